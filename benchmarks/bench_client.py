@@ -0,0 +1,357 @@
+"""Offline benchmarks of the qosic client against the in-process QosIc simulator.
+
+Run with ``uv run python benchmarks/bench_client.py``, nothing is sent over the network.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import logging
+import secrets
+import statistics
+import string
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import httpx
+
+from qosic import AsyncClient, Client, Payer, bj
+from qosic.clock import VirtualClock
+from qosic.executor import PaymentExecutor
+from qosic.ingest import PayerBatch
+from qosic.instrumentation import Instrumentation
+from qosic.polling import FixedInterval
+from qosic.responses import parse_response
+from qosic.routing import RoutingTable
+from qosic.templates import PaymentTemplate
+from qosic.references import RandomReference, SortableReference, UniqueReferences
+from qosic.testing import FakeQosServer, run_load
+
+MTN_PHONE_NUMBER = "22991617451"
+MOOV_PHONE_NUMBER = "22963588213"
+
+
+def make_client(server: FakeQosServer, **kwargs) -> Client:
+    mobile_carriers = [
+        bj.MTN(id="mtn", polling=FixedInterval(kwargs.pop("step", 0))),
+        bj.MOOV(id="moov"),
+    ]
+    return Client(
+        login="login",
+        password="password",
+        mobile_carriers=mobile_carriers,
+        transport=server.transport,
+        **kwargs,
+    )
+
+
+def timed(label: str, count: int, func) -> float:
+    started_at = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started_at
+    print(
+        f"{label:<45} {count / elapsed:>10.0f} ops/s {elapsed / count * 1e6:>10.1f} us/op"
+    )
+    return elapsed
+
+
+def bench_pay(count: int) -> None:
+    for carrier, phone in (("MOOV", MOOV_PHONE_NUMBER), ("MTN", MTN_PHONE_NUMBER)):
+        client = make_client(FakeQosServer())
+        timed(
+            f"Client.pay {carrier}",
+            count,
+            lambda: [client.pay(phone=phone, amount=100) for _ in range(count)],
+        )
+
+
+def bench_pay_many(count: int) -> None:
+    client = make_client(FakeQosServer())
+    payers = (Payer(phone=MOOV_PHONE_NUMBER, amount=100) for _ in range(count))
+    timed(
+        "Client.pay_many MOOV (concurrency=20)",
+        count,
+        lambda: list(client.pay_many(payers, concurrency=20)),
+    )
+
+    async def run():
+        async with AsyncClient(
+            login="login",
+            password="password",
+            mobile_carriers=[bj.MOOV(id="moov")],
+            transport=FakeQosServer().transport,
+        ) as async_client:
+            payers = (Payer(phone=MOOV_PHONE_NUMBER, amount=100) for _ in range(count))
+            async for _ in async_client.pay_many(payers, concurrency=20):
+                pass
+
+    timed(
+        "AsyncClient.pay_many MOOV (concurrency=20)", count, lambda: asyncio.run(run())
+    )
+
+
+def bench_processes(count: int) -> None:
+    # 10ms of latency per request, the work is bound by the number of payments in flight
+    config = make_client(FakeQosServer(latency=0.01)).config
+    for processes in (1, 2, 4):
+        with PaymentExecutor(config, processes=processes, concurrency=10) as executor:
+            list(executor.pay_many([Payer(phone=MOOV_PHONE_NUMBER, amount=100)]))
+            payers = [Payer(phone=MOOV_PHONE_NUMBER, amount=100) for _ in range(count)]
+            timed(
+                f"PaymentExecutor MOOV ({processes} processes)",
+                count,
+                lambda: list(executor.pay_many(payers)),
+            )
+
+
+def bench_polling(count: int) -> None:
+    server = FakeQosServer(confirmation_delay=0.02)
+    client = make_client(server, step=0.005)
+    timed(
+        "Client.pay MTN, confirmed after 20ms",
+        count,
+        lambda: [client.pay(phone=MTN_PHONE_NUMBER, amount=100) for _ in range(count)],
+    )
+    status_requests = sum(
+        hits for path, hits in server.requests.items() if "status" in path
+    )
+    print(f"{'  status checks per payment':<45} {status_requests / count:>10.1f}")
+
+
+def bench_instrumentation(count: int) -> None:
+    logger = logging.getLogger("qosic.bench")
+    logger.addHandler(logging.NullHandler())
+    scenarios = {
+        "disabled": Instrumentation(logger=logger),
+        "with a hook": Instrumentation([lambda event: None], logger=logger),
+        "with a hook and bodies": Instrumentation(
+            [lambda event: None], logger=logger, log_bodies=True
+        ),
+    }
+    for label, instrumentation in scenarios.items():
+        client = make_client(FakeQosServer(), instrumentation=instrumentation)
+        timed(
+            f"Client.pay MOOV, instrumentation {label}",
+            count,
+            lambda: [
+                client.pay(phone=MOOV_PHONE_NUMBER, amount=100) for _ in range(count)
+            ],
+        )
+
+
+def bench_pending_memory(count: int) -> None:
+    client = make_client(FakeQosServer(confirmation_delay=3600))
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    pending = [
+        client.submit_payment(phone=MTN_PHONE_NUMBER, amount=100) for _ in range(count)
+    ]
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{'memory per PendingPayment':<45} {(after - before) / len(pending):>10.0f} bytes"
+    )
+
+
+def bench_references(count: int) -> None:
+    alphabet = string.ascii_letters + string.digits
+    factories = {
+        "secrets.choice loop (previous default)": lambda: "".join(
+            secrets.choice(alphabet) for _ in range(12)
+        ),
+        "RandomReference": RandomReference(),
+        "SortableReference": SortableReference(),
+        "UniqueReferences(RandomReference)": UniqueReferences(),
+    }
+    for label, factory in factories.items():
+        timed(label, count, lambda: [factory() for _ in range(count)])
+
+
+def bench_startup(count: int) -> None:
+    # each import runs in a fresh interpreter, the count is capped since every run costs a process start
+    runs = min(count, 20)
+    statements = (
+        "import qosic",
+        "from qosic import Payer",
+        "from qosic import Client, bj; bj.MOOV",
+        "from qosic import Client, bj; bj.MTN",
+    )
+    for statement in statements:
+        code = (
+            "import time; started_at = time.perf_counter(); "
+            f"{statement}; print(time.perf_counter() - started_at)"
+        )
+        durations = [
+            float(subprocess.check_output([sys.executable, "-c", code]))
+            for _ in range(runs)
+        ]
+        print(f"{statement:<45} {statistics.median(durations) * 1000:>10.1f} ms")
+
+
+def bench_results_memory(count: int) -> None:
+    for label, compact_results in (("Result", False), ("compact Result", True)):
+        client = make_client(FakeQosServer(), compact_results=compact_results)
+        payers = [Payer(phone=MOOV_PHONE_NUMBER, amount=100) for _ in range(count)]
+        gc.collect()
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        results = [item.result for item in client.pay_many(payers, concurrency=20)]
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{'memory per ' + label:<45} {(after - before) / len(results):>10.0f} bytes"
+        )
+    timed(
+        "Payer validation",
+        count,
+        lambda: [Payer(phone=MOOV_PHONE_NUMBER, amount=100) for _ in range(count)],
+    )
+
+
+def bench_parsing(count: int) -> None:
+    body = b'{"responsecode": "00", "responsemsg": "SUCCESSFUL", "transref": "cN8jjZbQaZ97"}'
+
+    def responses() -> list[httpx.Response]:
+        return [
+            httpx.Response(
+                200, content=body, headers={"content-type": "application/json"}
+            )
+            for _ in range(count)
+        ]
+
+    batch = responses()
+    timed("httpx Response.json", count, lambda: [r.json() for r in batch])
+    batch = responses()
+    timed("parse_response", count, lambda: [parse_response(r) for r in batch])
+    timed(
+        "parse_response, already parsed",
+        count,
+        lambda: [parse_response(r) for r in batch],
+    )
+
+
+def bench_requests(count: int) -> None:
+    mtn = bj.MTN(id="mtn")
+    http_client = httpx.Client(
+        base_url="https://api.qosic.net", headers={"content-type": "application/json"}
+    )
+    payer = Payer(phone=MTN_PHONE_NUMBER, amount=100, first_name="Jean", last_name="N")
+    timed(
+        "build_request from a dict body",
+        count,
+        lambda: [
+            http_client.build_request(
+                "POST",
+                "/QosicBridge/user/requestpayment",
+                json=payer.to_qos_compliant_payment_request_body(mtn, "cN8jjZbQaZ97"),
+            )
+            for _ in range(count)
+        ],
+    )
+    template = PaymentTemplate(mtn, http_client, "/QosicBridge/user/requestpayment")
+    timed(
+        "PaymentTemplate.build_request",
+        count,
+        lambda: [template.build_request(payer, "cN8jjZbQaZ97") for _ in range(count)],
+    )
+
+
+def bench_ingest(count: int) -> None:
+    carriers = [bj.MTN(id="mtn"), bj.MOOV(id="moov")]
+    phones = [MTN_PHONE_NUMBER, MOOV_PHONE_NUMBER] * (count // 2)
+    amounts = ["100"] * len(phones)
+
+    def one_payer_per_row():
+        router = RoutingTable(carriers)
+        for phone, amount in zip(phones, amounts):
+            payer = Payer(phone=phone, amount=int(amount))
+            router.carrier_for(payer.phone)
+
+    timed("Payer and carrier_for per row", len(phones), one_payer_per_row)
+    batch = None
+
+    def from_columns():
+        nonlocal batch
+        batch = PayerBatch.from_columns(
+            phones=phones, amounts=amounts, mobile_carriers=carriers
+        )
+
+    def routed():
+        # read lazily like pay_many does, the payers are not all kept alive at once
+        for _ in batch.routed():
+            pass
+
+    validated = timed("PayerBatch.from_columns", len(phones), from_columns)
+    materialized = timed("  then PayerBatch.routed", len(phones), routed)
+    elapsed = validated + materialized
+    print(
+        f"{'  from_columns + routed':<45} {len(phones) / elapsed:>10.0f} ops/s "
+        f"{elapsed / len(phones) * 1e6:>10.1f} us/op"
+    )
+
+
+def bench_load(count: int) -> None:
+    # two minutes of default polling per payment, on a virtual clock
+    clock = VirtualClock()
+    server = FakeQosServer(
+        confirmation_delay=90, rejection_rate=0.05, seed=1, clock=clock
+    )
+    client = Client(
+        login="login",
+        password="password",
+        mobile_carriers=[bj.MTN(id="mtn", clock=clock)],
+        transport=server.transport,
+    )
+    payers = (Payer(phone=MTN_PHONE_NUMBER, amount=100) for _ in range(count))
+    started_at = time.perf_counter()
+    report = run_load(client, payers, clock=clock, rate=50)
+    elapsed = time.perf_counter() - started_at
+    print(f"{'  virtual seconds simulated':<45} {report.duration:>10.1f}")
+    print(f"{'  real seconds':<45} {elapsed:>10.1f}")
+    print(f"{'  payments per virtual second':<45} {report.throughput:>10.1f}")
+    print(
+        f"{'  time to confirmation p50 / p99':<45} {report.p50:>10.1f} {report.p99:.1f}"
+    )
+    for path, hits in sorted(report.requests.items()):
+        print(f"{'  ' + path:<45} {hits:>10}")
+
+
+BENCHMARKS = {
+    "pay": bench_pay,
+    "pay_many": bench_pay_many,
+    "processes": bench_processes,
+    "polling": bench_polling,
+    "instrumentation": bench_instrumentation,
+    "memory": bench_pending_memory,
+    "results": bench_results_memory,
+    "references": bench_references,
+    "startup": bench_startup,
+    "parsing": bench_parsing,
+    "requests": bench_requests,
+    "ingest": bench_ingest,
+    "load": bench_load,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmarks", nargs="*", help=", ".join(BENCHMARKS))
+    parser.add_argument("-n", "--count", type=int, default=1000)
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    for name in args.benchmarks or BENCHMARKS:
+        print(f"--- {name}")
+        BENCHMARKS[name](args.count)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,48 @@
 """Top-level package for qosic-sdk."""
-from .client import Client  # noqa
-from .mobile_carriers import bj  # noqa
-from .utils import Result, Payer  # noqa
+
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .bulk import BatchItem, BatchProgress  # noqa
+    from .client import Client, AsyncClient  # noqa
+    from .mobile_carriers import bj  # noqa
+    from .pending import PendingPayment  # noqa
+    from .poller import StatusPoller  # noqa
+    from .utils import Result, Payer  # noqa
 
 __author__ = """Tobi DEGNON"""
 __email__ = "tobidegnon@proton.me"
 __version__ = "5.0.1"
+
+# the submodules are only imported when one of their names is first accessed,
+# so that ``import qosic`` does not pay for httpx when only ``Payer`` is used for example
+_LAZY_ATTRIBUTES = {
+    "BatchItem": ".bulk",
+    "BatchProgress": ".bulk",
+    "Client": ".client",
+    "AsyncClient": ".client",
+    "bj": ".mobile_carriers.bj",
+    "PendingPayment": ".pending",
+    "StatusPoller": ".poller",
+    "Result": ".utils",
+    "Payer": ".utils",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(module_name, __name__)
+    value = module if name == "bj" else getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *__all__])
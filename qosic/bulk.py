@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import itertools
+from collections import Counter, defaultdict, deque
+from typing import Iterable, TYPE_CHECKING
+
+from dataclasses import dataclass
+
+from .ingest import PayerBatch
+from .utils import Payer, Result
+
+if TYPE_CHECKING:
+    from .protocols import MobileCarrier
+    from .routing import RoutingTable
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    """The outcome of one payment of a bulk job, ``error`` is set if the payment raised an exception."""
+
+    index: int
+    payer: Payer
+    result: Result | None = None
+    error: Exception | None = None
+
+    @property
+    def success(self) -> bool:
+        return self.result is not None and self.result.success
+
+
+@dataclass
+class BatchProgress:
+    """Counters updated while a bulk job runs, it can be read at any time to report the progress."""
+
+    completed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    errored: int = 0
+
+    def record(self, item: BatchItem) -> None:
+        self.completed += 1
+        if item.error is not None:
+            self.errored += 1
+        elif item.success:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+
+
+class BatchDispatcher:
+    """Pull payers lazily from an iterable or a ``PayerBatch`` and hand them out grouped by mobile carrier,
+    without exceeding ``concurrency`` payments in total and ``max_per_carrier`` per carrier.
+    Only about ``concurrency`` payers are kept in memory at the same time."""
+
+    def __init__(
+        self,
+        payers: Iterable[Payer] | PayerBatch,
+        *,
+        router: RoutingTable,
+        concurrency: int,
+        max_per_carrier: int | None = None,
+    ):
+        assert concurrency > 0, f"Concurrency {concurrency} must be positive"
+        self.router = router
+        self.concurrency = concurrency
+        self.max_per_carrier = max_per_carrier or concurrency
+        self.in_flight = 0
+        # a PayerBatch is already routed, the carrier of the other payers is looked up as they are read
+        if isinstance(payers, PayerBatch) and payers.routed_to(router.mobile_carriers):
+            self._rows = payers.routed()
+        elif isinstance(payers, PayerBatch):
+            # routed for another client, its carriers would send the payments with the wrong ids
+            self._rows = ((index, payer, None) for index, payer, _ in payers.routed())
+        else:
+            self._rows = ((index, payer, None) for index, payer in enumerate(payers))
+        self._backlog: dict[str, deque] = defaultdict(deque)
+        self._queued = 0
+        self._running: Counter = Counter()
+        self._exhausted = False
+
+    @property
+    def finished(self) -> bool:
+        return self._exhausted and not self._queued and not self.in_flight
+
+    def fill(self) -> list[BatchItem]:
+        """Read payers until enough are queued, payers that can't be routed are returned as errored items."""
+        errors = []
+        wanted = self.concurrency - self._queued
+        if self._exhausted or wanted <= 0:
+            return errors
+        read = 0
+        for index, payer, carrier in itertools.islice(self._rows, wanted):
+            read += 1
+            if carrier is None:
+                try:
+                    carrier = self.router.carrier_for(payer.phone)
+                except Exception as exc:
+                    errors.append(BatchItem(index=index, payer=payer, error=exc))
+                    continue
+            self._backlog[carrier.id].append((index, payer, carrier))
+            self._queued += 1
+        self._exhausted = read < wanted
+        return errors
+
+    def next_jobs(self) -> list[tuple[int, Payer, MobileCarrier]]:
+        """Return the payments that can be started now."""
+        jobs = []
+        for carrier_id, queue in self._backlog.items():
+            while (
+                queue
+                and self.in_flight < self.concurrency
+                and self._running[carrier_id] < self.max_per_carrier
+            ):
+                jobs.append(queue.popleft())
+                self._queued -= 1
+                self._running[carrier_id] += 1
+                self.in_flight += 1
+        return jobs
+
+    def release(self, carrier: MobileCarrier) -> None:
+        self._running[carrier.id] -= 1
+        self.in_flight -= 1
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Callable, Protocol
+
+from .utils import Result
+
+TERMINAL_STATUSES = (Result.Status.CONFIRMED, Result.Status.FAILED)
+
+# a status value and the time it expires at, None if it never expires
+CacheEntry = tuple[str, "float | None"]
+
+
+class CacheBackend(Protocol):
+    """Where a :class:`StatusCache` keeps its entries, keyed by carrier id and transaction reference."""
+
+    def get(self, key: tuple[str, str]) -> CacheEntry | None: ...
+
+    def set(self, key: tuple[str, str], entry: CacheEntry) -> None: ...
+
+    def delete(self, key: tuple[str, str]) -> None: ...
+
+
+class MemoryCacheBackend:
+    """Keep up to ``maxsize`` entries in a dict, the least recently used ones are dropped first."""
+
+    def __init__(self, maxsize: int = 100_000):
+        assert maxsize > 0, "maxsize should be a positive number"
+        self.maxsize = maxsize
+        # dicts keep the insertion order, the first key is the least recently used
+        self._entries: dict[tuple[str, str], CacheEntry] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[str, str]) -> CacheEntry | None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+        return entry
+
+    def set(self, key: tuple[str, str], entry: CacheEntry) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            if len(self._entries) > self.maxsize:
+                del self._entries[next(iter(self._entries))]
+
+    def delete(self, key: tuple[str, str]) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """Keep the entries in a SQLite database, to share them between processes and keep them across restarts.
+    Once more than ``maxsize`` entries are stored, the expired then the least recently used ones are deleted.
+    """
+
+    # the size is only checked every few writes
+    _EVICTION_INTERVAL = 100
+
+    def __init__(self, path: str | os.PathLike, *, maxsize: int = 1_000_000):
+        import sqlite3
+
+        self.path = path
+        self.maxsize = maxsize
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS qosic_status_cache ("
+                "carrier TEXT NOT NULL, reference TEXT NOT NULL, status TEXT NOT NULL, "
+                "expires_at REAL, used_at REAL NOT NULL, PRIMARY KEY (carrier, reference))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS qosic_status_cache_used_at "
+                "ON qosic_status_cache (used_at)"
+            )
+
+    def get(self, key: tuple[str, str]) -> CacheEntry | None:
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT status, expires_at FROM qosic_status_cache "
+                "WHERE carrier = ? AND reference = ?",
+                key,
+            ).fetchone()
+            if row is not None:
+                self._connection.execute(
+                    "UPDATE qosic_status_cache SET used_at = ? "
+                    "WHERE carrier = ? AND reference = ?",
+                    (time.time(), *key),
+                )
+        return row
+
+    def set(self, key: tuple[str, str], entry: CacheEntry) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO qosic_status_cache VALUES (?, ?, ?, ?, ?)",
+                (*key, *entry, time.time()),
+            )
+            self._writes += 1
+            if self._writes % self._EVICTION_INTERVAL == 0:
+                self._evict()
+
+    def delete(self, key: tuple[str, str]) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM qosic_status_cache WHERE carrier = ? AND reference = ?",
+                key,
+            )
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _evict(self) -> None:
+        (count,) = self._connection.execute(
+            "SELECT COUNT(*) FROM qosic_status_cache"
+        ).fetchone()
+        if count <= self.maxsize:
+            return
+        self._connection.execute(
+            "DELETE FROM qosic_status_cache WHERE expires_at <= ?", (time.time(),)
+        )
+        self._connection.execute(
+            "DELETE FROM qosic_status_cache WHERE rowid IN ("
+            "SELECT rowid FROM qosic_status_cache ORDER BY used_at "
+            "LIMIT max((SELECT COUNT(*) FROM qosic_status_cache) - ?, 0))",
+            (self.maxsize,),
+        )
+
+
+class StatusCache:
+    """Cache the transaction statuses checked by a client, keyed by carrier id and reference.
+
+    Confirmed and failed statuses can't change anymore, they are kept for ``terminal_ttl`` seconds, forever by
+    default (until evicted by the backend). Pending statuses are kept for ``pending_ttl`` seconds, so that
+    several parts of an application asking about the same payment at the same time share a single status check.
+    The same cache can be shared by several clients.
+    :param backend: Where the entries are stored, a ``MemoryCacheBackend`` by default
+    :param pending_ttl: Seconds a pending status is reused, 0 to never cache them
+    :param terminal_ttl: Seconds a confirmed or failed status is reused, ``None`` to keep them as long as possible
+    :param clock: Returns the current time in seconds, the expiry times are stored with it
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend | None = None,
+        *,
+        pending_ttl: float = 5,
+        terminal_ttl: float | None = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.pending_ttl = pending_ttl
+        self.terminal_ttl = terminal_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+    def get(self, carrier_id: str, reference: str) -> Result.Status | None:
+        key = (carrier_id, reference)
+        entry = self.backend.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= self.clock():
+            self.backend.delete(key)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return Result.Status(entry[0])
+
+    def set(self, carrier_id: str, reference: str, status: Result.Status) -> None:
+        ttl = self.terminal_ttl if status in TERMINAL_STATUSES else self.pending_ttl
+        if ttl == 0:
+            return
+        expires_at = None if ttl is None else self.clock() + ttl
+        self.backend.set((carrier_id, reference), (status.value, expires_at))
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from typing import Mapping
+from urllib.parse import parse_qsl
+
+from .errors import InvalidCallbackError
+from .logger import logger as _logger
+from .pending import PendingPayment
+from .utils import Result
+
+CONFIRMED_CODES = ("00", "0")
+
+
+class CallbackReceiver:
+    """Resolve pending payments from the transaction notifications pushed by the QosIc api.
+
+    Register the payments to watch (``Client(..., callbacks=receiver)`` does it for every submitted payment) and
+    expose ``wsgi_app`` or ``asgi_app`` on the callback url configured on your QosIc account, or call ``handle``
+    from any web framework view. By default a notification is not trusted as is: it triggers an immediate status
+    check that resolves the payment. Pair it with a ``StatusPoller`` as a fallback for notifications that never arrive.
+    :param trust_payload: Resolve payments from the notification content without checking the status
+    :param fallback_after: Seconds before the client poller starts checking a payment itself
+    :param logger: Custom logger
+    """
+
+    def __init__(
+        self,
+        *,
+        trust_payload: bool = False,
+        fallback_after: float = 60,
+        logger=_logger,
+    ):
+        self.trust_payload = trust_payload
+        self.fallback_after = fallback_after
+        self.logger = logger
+        self._pending: dict[str, PendingPayment] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, reference: str) -> bool:
+        return reference in self._pending
+
+    def register(self, pending: PendingPayment) -> PendingPayment:
+        if pending.done():
+            return pending
+        with self._lock:
+            self._pending[pending.reference] = pending
+        pending.add_done_callback(self._forget)
+        return pending
+
+    def handle(self, payload: bytes | str | Mapping) -> bool:
+        """Process one notification, return ``False`` if it does not match any registered payment."""
+        notification = parse_notification(payload)
+        reference = notification.get("transref")
+        if not reference:
+            raise InvalidCallbackError("The notification has no transref")
+        with self._lock:
+            pending = self._pending.get(reference)
+        if pending is None:
+            self.logger.info(
+                f"Callback received for an unknown transaction {reference}"
+            )
+            return False
+        code = notification.get("responsecode")
+        if self.trust_payload and code is not None:
+            pending.resolve(
+                Result.Status.CONFIRMED
+                if code in CONFIRMED_CODES
+                else Result.Status.FAILED
+            )
+        else:
+            pending.poll_once()
+        return True
+
+    def wsgi_app(self, environ: dict, start_response) -> list[bytes]:
+        """A WSGI application accepting the notifications posted by the api."""
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            body = environ["wsgi.input"].read(length)
+            status = "200 OK" if self.handle(body) else "404 Not Found"
+        except InvalidCallbackError:
+            status = "400 Bad Request"
+        start_response(status, [("Content-Type", "text/plain")])
+        return [status.encode()]
+
+    async def asgi_app(self, scope: dict, receive, send) -> None:
+        """An ASGI application accepting the notifications posted by the api."""
+        assert scope["type"] == "http", "Only http requests are supported"
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        try:
+            matched = await asyncio.to_thread(self.handle, body)
+            status = 200 if matched else 404
+        except InvalidCallbackError:
+            status = 400
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        await send({"type": "http.response.body", "body": str(status).encode()})
+
+    def _forget(self, pending: PendingPayment) -> None:
+        with self._lock:
+            self._pending.pop(pending.reference, None)
+
+
+def parse_notification(payload: bytes | str | Mapping) -> dict:
+    """Read a notification sent either as JSON or as an url encoded form."""
+    if isinstance(payload, Mapping):
+        return dict(payload)
+    if isinstance(payload, bytes):
+        payload = payload.decode(errors="replace")
+    payload = payload.strip()
+    if payload.startswith("{"):
+        try:
+            return json.loads(payload)
+        except ValueError as exc:
+            raise InvalidCallbackError(f"Invalid notification: {exc}") from exc
+    return dict(parse_qsl(payload))
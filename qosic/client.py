@@ -1,13 +1,62 @@
 from __future__ import annotations
 
-from functools import partial
+import asyncio
+import contextlib
+from logging import Logger
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Callable, Iterable, Iterator, TYPE_CHECKING
 
 import httpx
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 
+from .bulk import BatchDispatcher, BatchItem, BatchProgress
+from .clock import SYSTEM_CLOCK, Clock
+from .instrumentation import Instrumentation
 from .logger import logger as _logger
-from .protocols import MobileCarrier
-from .utils import Result, guess_mobile_carrier_from, Payer, log_response, log_request
+from .pending import PendingPayment
+from .reconciliation import StatusItem
+from .transports import AsyncSharedTransport, SharedTransport
+from .routing import RoutingTable
+from .utils import Result, Payer
+
+if TYPE_CHECKING:
+    from .cache import StatusCache
+    from .callbacks import CallbackReceiver
+    from .ingest import PayerBatch
+    from .journal import TransactionStore
+    from .metrics import MetricsCollector
+    from .poller import StatusPoller
+    from .protocols import MobileCarrier
+    from .ratelimit import RateLimiter
+    from .retry import RetryPolicy
+    from .templates import PaymentTemplate
+
+
+@dataclass(frozen=True)
+class ClientConfig:
+    """The settings of a ``Client`` that can be pickled, to build identical clients in other processes or hosts.
+
+    The stateful objects (poller, callbacks, metrics, store, rate limiter...) are left out, they are specific to
+    each process. ``transport`` is only kept if it can be pickled, the mobile carriers reference factories too.
+    """
+
+    login: str
+    password: str
+    mobile_carriers: tuple[MobileCarrier, ...]
+    base_url: str = "https://api.qosic.net"
+    timeout: httpx.Timeout | float = 80
+    limits: httpx.Limits | None = None
+    http2: bool = False
+    verify: bool = False
+    transport: httpx.BaseTransport | None = None
+    retry: RetryPolicy | None = None
+    compact_results: bool = False
+
+    def build(self, **kwargs) -> Client:
+        """Create a ``Client`` from this config, ``kwargs`` are passed to the client along with the config."""
+        options = {f.name: getattr(self, f.name) for f in fields(self)}
+        options["mobile_carriers"] = list(self.mobile_carriers)
+        return Client(**options, **kwargs)
 
 
 @dataclass
@@ -18,36 +67,87 @@ class Client:
     :param password: Your server authentication password
     :param logger: Custom logger
     :param base_url: The QosIC server root domain if you ever need to change it
+    :param poller: A shared ``StatusPoller``, payments submitted with ``submit_payment`` are registered on it
+    :param callbacks: A ``CallbackReceiver`` resolving the payments submitted with ``submit_payment`` from the
+        notifications of the api, the ``poller`` then only checks them after ``callbacks.fallback_after`` seconds
+    :param timeout: Requests timeout in seconds, or a ``httpx.Timeout`` to configure connect/read/write/pool timeouts
+    :param limits: Connection pool size and keep-alive expiry, as a ``httpx.Limits``
+    :param http2: Enable HTTP/2, requires the ``http2`` extra to be installed
+    :param verify: Verify the server TLS certificate
+    :param transport: A transport shared with other clients, ``limits``, ``http2`` and ``verify`` are then
+        configured on the transport itself and closing the client does not close it
+    :param instrumentation: Receives an event for every request, by default the events are only logged
+        at the ``DEBUG`` level of ``logger``
+    :param metrics: Collect latency, throughput and error metrics of the requests and payments
+    :param store: Journal every payment before it is sent and on each change of state, see ``resume``
+    :param rate_limiter: Throttle the requests per carrier and endpoint, it can be shared by several clients
+    :param retry: Retry the requests failing with server or network errors, and fail fast while the api is down
+    :param compact_results: Return compact results from ``pay`` and ``pay_many``, without the raw response
+    :param status_cache: Caches the statuses returned by the status endpoint to ``check_status`` and
+        ``check_status_many``, it can be shared by several clients and backed by a SQLite database, see ``qosic.cache``
     """
 
     login: str
     password: str
     mobile_carriers: list[MobileCarrier]
     base_url: str = "https://api.qosic.net"
-    logger: bool = _logger
+    logger: Logger = _logger
+    poller: StatusPoller | None = None
+    callbacks: CallbackReceiver | None = None
+    timeout: httpx.Timeout | float = 80
+    limits: httpx.Limits | None = None
+    http2: bool = False
+    verify: bool = False
+    transport: httpx.BaseTransport | None = None
+    instrumentation: Instrumentation | None = None
+    metrics: MetricsCollector | None = None
+    store: TransactionStore | None = None
+    rate_limiter: RateLimiter | None = None
+    retry: RetryPolicy | None = None
+    compact_results: bool = False
+    status_cache: StatusCache | None = field(default=None, repr=False)
+    _templates: dict[int, PaymentTemplate] = field(
+        init=False, repr=False, default_factory=dict
+    )
     _http_client: httpx.Client = field(init=False, repr=False)
+    _router: RoutingTable = field(init=False, repr=False)
 
     def __post_init__(self):
+        self._router = RoutingTable(self.mobile_carriers)
+        _setup_instrumentation(self)
+        transport = _build_transport(self)
         self._http_client = httpx.Client(
-            base_url=self.base_url,
-            auth=(self.login, self.password),
-            headers={"content-type": "application/json"},
-            verify=False,
-            timeout=80,
-            event_hooks={
-                "request": [partial(log_request, logger=self.logger)],
-                "response": [partial(log_response, logger=self.logger)],
-            },
+            transport=transport,
+            event_hooks=self.instrumentation.event_hooks(),
+            **_http_client_options(self, transport),
         )
 
-    def __del__(self):
+    @property
+    def config(self) -> ClientConfig:
+        options = {f.name: getattr(self, f.name) for f in fields(ClientConfig)}
+        options["mobile_carriers"] = tuple(self.mobile_carriers)
+        if not _can_pickle(self.transport):
+            # a connection pool holds sockets and an ssl context, the other process opens its own
+            options["transport"] = None
+        return ClientConfig(**options)
+
+    def __reduce__(self):
+        # the http connections can't be pickled, the client is built again from its config
+        return ClientConfig.build, (self.config,)
+
+    def close(self) -> None:
         self._http_client.close()
 
+    def __del__(self):
+        # __post_init__ may have failed before the http client was created
+        if hasattr(self, "_http_client"):
+            self._http_client.close()
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._http_client.close()
+        self.close()
 
     def pay(
         self,
@@ -60,15 +160,590 @@ class Client:
         payer = Payer(
             phone=phone, amount=amount, first_name=first_name, last_name=last_name
         )
-        mobile_carrier = guess_mobile_carrier_from(
-            phone=phone, mobile_carriers=self.mobile_carriers
+        mobile_carrier = self._router.carrier_for(phone)
+        return self._pay(mobile_carrier, payer)
+
+    def submit_payment(
+        self,
+        *,
+        phone: str,
+        amount: int,
+        first_name: str = "",
+        last_name: str = "",
+    ) -> PendingPayment:
+        """Same as ``pay`` but return as soon as the payment request is accepted by the server,
+        the confirmation is then resolved through the returned ``PendingPayment``, automatically
+        if a ``poller`` is configured."""
+        payer = Payer(
+            phone=phone, amount=amount, first_name=first_name, last_name=last_name
         )
-        return mobile_carrier.pay(self._http_client, payer=payer)
+        mobile_carrier = self._router.carrier_for(phone)
+        with _track_errors(self.metrics, mobile_carrier):
+            pending = self._submit(mobile_carrier, payer)
+        return self._watch(pending)
+
+    def resume(self, batch_size: int = 100) -> Iterator[PendingPayment]:
+        """Yield a ``PendingPayment`` for each payment journaled in ``store`` but not resolved yet,
+        after a crash for example. The payments are not sent again, their status is checked with their
+        original reference. The resumed results have an empty ``phone`` since the number is not stored.
+        """
+        from .journal import journal_pending_payment
+
+        assert self.store is not None, "resume needs a transaction store"
+        carriers = {carrier.id: carrier for carrier in self.mobile_carriers}
+        for records in self.store.in_flight(batch_size):
+            for record in records:
+                mobile_carrier = carriers.get(record.carrier)
+                if not hasattr(mobile_carrier, "check_status"):
+                    self.logger.warning(
+                        f"Can't resume {record.reference}, no status check for carrier {record.carrier}"
+                    )
+                    continue
+                pending = PendingPayment(
+                    mobile_carrier=mobile_carrier,
+                    http_client=self._http_client,
+                    reference=record.reference,
+                    phone="",
+                    response=None,
+                )
+                journal_pending_payment(self.store, record, pending)
+                yield self._watch(pending)
 
     def refund(self, reference: str, phone: str) -> Result:
-        mobile_carrier = guess_mobile_carrier_from(
-            phone=phone, mobile_carriers=self.mobile_carriers
+        mobile_carrier = self._router.carrier_for(phone)
+        with _track_errors(self.metrics, mobile_carrier):
+            return mobile_carrier.refund(
+                self._http_client, reference=reference, phone=phone
+            )
+
+    def _pay(self, mobile_carrier: MobileCarrier, payer: Payer) -> Result:
+        clock = _clock_of(mobile_carrier)
+        started_at = clock.monotonic()
+        with _track_payment(self.metrics, mobile_carrier):
+            result = self._submit(mobile_carrier, payer).wait()
+        if self.metrics is not None:
+            self.metrics.record_payment(result, duration=clock.monotonic() - started_at)
+        return result.compact() if self.compact_results else result
+
+    def _submit(self, mobile_carrier: MobileCarrier, payer: Payer) -> PendingPayment:
+        if self.store is None:
+            return mobile_carrier.submit(
+                self._http_client,
+                payer=payer,
+                template=self._template_for(mobile_carrier),
+            )
+        from .journal import TransactionRecord, journal_pending_payment
+
+        reference = mobile_carrier.reference_factory(payer)
+        record = TransactionRecord.for_payment(
+            reference=reference,
+            mobile_carrier=mobile_carrier,
+            payer=payer,
+            phone_key=getattr(self.store, "phone_key", None),
         )
-        return mobile_carrier.refund(
-            self._http_client, reference=reference, phone=phone
+        self.store.save(record)
+        pending = mobile_carrier.submit(
+            self._http_client,
+            payer=payer,
+            reference=reference,
+            template=self._template_for(mobile_carrier),
         )
+        journal_pending_payment(self.store, record, pending)
+        return pending
+
+    def _template_for(self, mobile_carrier: MobileCarrier) -> PaymentTemplate:
+        # built on the first payment of each carrier, the carriers live as long as the client
+        template = self._templates.get(id(mobile_carrier))
+        if template is None:
+            template = self._templates[id(mobile_carrier)] = (
+                mobile_carrier.payment_template(self._http_client)
+            )
+        return template
+
+    def _watch(self, pending: PendingPayment) -> PendingPayment:
+        if self.metrics is not None:
+            self.metrics.track_pending_payment(pending)
+        delay = 0
+        if self.callbacks is not None:
+            self.callbacks.register(pending)
+            delay = self.callbacks.fallback_after
+        if self.poller is not None:
+            self.poller.register(pending, delay=delay)
+        return pending
+
+    def check_status(
+        self, reference: str, *, mobile_carrier: MobileCarrier | None = None
+    ) -> Result.Status:
+        """Return the current status of the transaction ``reference``, from the ``status_cache`` if it is there.
+        Only the statuses returned by the status endpoint are cached, not those of the payments: a payment
+        that timed out on the client side may still be confirmed later.
+        :param mobile_carrier: The carrier of the transaction, needed if several carriers can check a status
+        """
+        mobile_carrier = mobile_carrier or _status_carrier(self.mobile_carriers)
+        status = self._cached_status(mobile_carrier, reference)
+        if status is None:
+            status = self._fetch_status(mobile_carrier, reference)
+        return status
+
+    def _fetch_status(
+        self, mobile_carrier: MobileCarrier, reference: str
+    ) -> Result.Status:
+        with _track_errors(self.metrics, mobile_carrier):
+            status = mobile_carrier.check_status(self._http_client, reference=reference)
+        if self.status_cache is not None:
+            self.status_cache.set(mobile_carrier.id, reference, status)
+        return status
+
+    def _cached_status(
+        self, mobile_carrier: MobileCarrier, reference: str
+    ) -> Result.Status | None:
+        if self.status_cache is None:
+            return None
+        return self.status_cache.get(mobile_carrier.id, reference)
+
+    def check_status_many(
+        self,
+        references: Iterable[str],
+        *,
+        mobile_carrier: MobileCarrier | None = None,
+        concurrency: int = 10,
+    ) -> Iterator[StatusItem]:
+        """Check the status of every transaction of ``references`` with at most ``concurrency`` checks in flight
+        and yield a ``StatusItem`` as soon as each check completes, in completion order. ``references`` is read
+        lazily, use ``qosic.reconciliation.read_references`` to stream them from a CSV or JSON lines file.
+        :param mobile_carrier: The carrier of the transactions, needed if several carriers can check a status
+        """
+        mobile_carrier = mobile_carrier or _status_carrier(self.mobile_carriers)
+        references = iter(references)
+        futures = {}
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="qosic-status"
+        ) as executor:
+            while True:
+                for reference in references:
+                    status = self._cached_status(mobile_carrier, reference)
+                    if status is not None:
+                        yield StatusItem(
+                            reference=reference, status=status, cached=True
+                        )
+                        continue
+                    future = executor.submit(
+                        self._fetch_status, mobile_carrier, reference
+                    )
+                    futures[future] = reference
+                    if len(futures) >= concurrency:
+                        break
+                if not futures:
+                    return
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _status_item_from(future, reference=futures.pop(future))
+
+    def pay_many(
+        self,
+        payers: Iterable[Payer] | PayerBatch,
+        *,
+        concurrency: int = 10,
+        max_per_carrier: int | None = None,
+        progress: BatchProgress | None = None,
+    ) -> Iterator[BatchItem]:
+        """Pay every payer from ``payers`` using a pool of ``concurrency`` threads and yield a ``BatchItem``
+        as soon as each payment completes, in completion order. An exception raised by one payment is reported
+        on its ``BatchItem`` and does not stop the batch. ``payers`` can be a ``PayerBatch`` read from a payout
+        file, its rows are already validated and routed.
+        :param max_per_carrier: Maximum number of payments in flight for a single mobile carrier
+        :param progress: Counters updated as items are yielded
+        """
+        dispatcher = BatchDispatcher(
+            payers,
+            router=self._router,
+            concurrency=concurrency,
+            max_per_carrier=max_per_carrier,
+        )
+        futures = {}
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="qosic-batch"
+        ) as executor:
+            while not dispatcher.finished:
+                items = dispatcher.fill()
+                for index, payer, carrier in dispatcher.next_jobs():
+                    future = executor.submit(self._pay, carrier, payer)
+                    futures[future] = (index, payer, carrier)
+                if futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, payer, carrier = futures.pop(future)
+                        dispatcher.release(carrier)
+                        items.append(_batch_item_from(future, index=index, payer=payer))
+                for item in items:
+                    if progress is not None:
+                        progress.record(item)
+                    yield item
+
+
+@dataclass
+class AsyncClient:
+    """The asynchronous client, same as :class:`Client` but built on top of ``httpx.AsyncClient``
+    :param mobile_carriers: The list of configured mobile carriers to use to communicate with the API.
+    :param login: Your server authentication login/user
+    :param password: Your server authentication password
+    :param logger: Custom logger
+    :param base_url: The QosIC server root domain if you ever need to change it
+    :param timeout: Requests timeout in seconds, or a ``httpx.Timeout`` to configure connect/read/write/pool timeouts
+    :param limits: Connection pool size and keep-alive expiry, as a ``httpx.Limits``
+    :param http2: Enable HTTP/2, requires the ``http2`` extra to be installed
+    :param verify: Verify the server TLS certificate
+    :param transport: An async transport shared with other clients, closing the client does not close it
+    :param instrumentation: Receives an event for every request, by default the events are only logged
+        at the ``DEBUG`` level of ``logger``
+    :param metrics: Collect latency, throughput and error metrics of the requests and payments
+    :param store: Journal every payment before it is sent and on each change of state, see ``resume``
+    :param rate_limiter: Throttle the requests per carrier and endpoint, it can be shared by several clients
+    :param retry: Retry the requests failing with server or network errors, and fail fast while the api is down
+    :param compact_results: Return compact results from ``pay`` and ``pay_many``, without the raw response
+    :param status_cache: Caches the statuses returned by the status endpoint to ``check_status`` and
+        ``check_status_many``, it can be shared by several clients and backed by a SQLite database, see ``qosic.cache``.
+        The backends other than ``MemoryCacheBackend`` are queried in a thread, not on the event loop
+    """
+
+    login: str
+    password: str
+    mobile_carriers: list[MobileCarrier]
+    base_url: str = "https://api.qosic.net"
+    logger: Logger = _logger
+    timeout: httpx.Timeout | float = 80
+    limits: httpx.Limits | None = None
+    http2: bool = False
+    verify: bool = False
+    transport: httpx.AsyncBaseTransport | None = None
+    instrumentation: Instrumentation | None = None
+    metrics: MetricsCollector | None = None
+    store: TransactionStore | None = None
+    rate_limiter: RateLimiter | None = None
+    retry: RetryPolicy | None = None
+    compact_results: bool = False
+    status_cache: StatusCache | None = field(default=None, repr=False)
+    _templates: dict[int, PaymentTemplate] = field(
+        init=False, repr=False, default_factory=dict
+    )
+    _http_client: httpx.AsyncClient = field(init=False, repr=False)
+    _router: RoutingTable = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._router = RoutingTable(self.mobile_carriers)
+        _setup_instrumentation(self)
+        transport = _build_async_transport(self)
+        self._http_client = httpx.AsyncClient(
+            transport=transport,
+            event_hooks=self.instrumentation.async_event_hooks(),
+            **_http_client_options(self, transport),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._http_client.aclose()
+
+    async def pay(
+        self,
+        *,
+        phone: str,
+        amount: int,
+        first_name: str = "",
+        last_name: str = "",
+    ) -> Result:
+        payer = Payer(
+            phone=phone, amount=amount, first_name=first_name, last_name=last_name
+        )
+        mobile_carrier = self._router.carrier_for(phone)
+        return await self._pay(mobile_carrier, payer)
+
+    async def refund(self, reference: str, phone: str) -> Result:
+        mobile_carrier = self._router.carrier_for(phone)
+        with _track_errors(self.metrics, mobile_carrier):
+            return await mobile_carrier.arefund(
+                self._http_client, reference=reference, phone=phone
+            )
+
+    async def _pay(self, mobile_carrier: MobileCarrier, payer: Payer) -> Result:
+        clock = _clock_of(mobile_carrier)
+        started_at = clock.monotonic()
+        with _track_payment(self.metrics, mobile_carrier):
+            result = await self._send(mobile_carrier, payer)
+        if self.metrics is not None:
+            self.metrics.record_payment(result, duration=clock.monotonic() - started_at)
+        return result.compact() if self.compact_results else result
+
+    async def _send(self, mobile_carrier: MobileCarrier, payer: Payer) -> Result:
+        if self.store is None:
+            return await mobile_carrier.apay(
+                self._http_client,
+                payer=payer,
+                template=self._template_for(mobile_carrier),
+            )
+        from .journal import TransactionRecord, TransactionState
+
+        reference = mobile_carrier.reference_factory(payer)
+        record = TransactionRecord.for_payment(
+            reference=reference,
+            mobile_carrier=mobile_carrier,
+            payer=payer,
+            phone_key=getattr(self.store, "phone_key", None),
+        )
+        # the stores write to files and databases, away from the event loop
+        await asyncio.to_thread(self.store.save, record)
+
+        async def journal_submitted() -> None:
+            await asyncio.to_thread(
+                self.store.save, record.with_state(TransactionState.SUBMITTED)
+            )
+
+        result = await mobile_carrier.apay(
+            self._http_client,
+            payer=payer,
+            reference=reference,
+            template=self._template_for(mobile_carrier),
+            on_submitted=journal_submitted,
+        )
+        await asyncio.to_thread(
+            self.store.save,
+            record.with_state(TransactionState.from_status(result.status)),
+        )
+        return result
+
+    def _template_for(self, mobile_carrier: MobileCarrier) -> PaymentTemplate:
+        template = self._templates.get(id(mobile_carrier))
+        if template is None:
+            template = self._templates[id(mobile_carrier)] = (
+                mobile_carrier.payment_template(self._http_client)
+            )
+        return template
+
+    async def check_status(
+        self, reference: str, *, mobile_carrier: MobileCarrier | None = None
+    ) -> Result.Status:
+        """Async counterpart of :meth:`Client.check_status`."""
+        mobile_carrier = mobile_carrier or _status_carrier(self.mobile_carriers)
+        status = await self._cached_status(mobile_carrier, reference)
+        if status is None:
+            status = await self._fetch_status(mobile_carrier, reference)
+        return status
+
+    async def _fetch_status(
+        self, mobile_carrier: MobileCarrier, reference: str
+    ) -> Result.Status:
+        with _track_errors(self.metrics, mobile_carrier):
+            status = await mobile_carrier.acheck_status(
+                self._http_client, reference=reference
+            )
+        if self.status_cache is not None:
+            await self._off_loop(
+                self.status_cache.set, mobile_carrier.id, reference, status
+            )
+        return status
+
+    async def _cached_status(
+        self, mobile_carrier: MobileCarrier, reference: str
+    ) -> Result.Status | None:
+        if self.status_cache is None:
+            return None
+        return await self._off_loop(self.status_cache.get, mobile_carrier.id, reference)
+
+    async def _off_loop(self, method: Callable, *args):
+        from .cache import MemoryCacheBackend
+
+        # a dict lookup is cheap, the other backends query files and databases away from the event loop
+        if isinstance(self.status_cache.backend, MemoryCacheBackend):
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    async def check_status_many(
+        self,
+        references: Iterable[str],
+        *,
+        mobile_carrier: MobileCarrier | None = None,
+        concurrency: int = 10,
+    ) -> AsyncIterator[StatusItem]:
+        """Async counterpart of :meth:`Client.check_status_many`, checks run as tasks on the current event loop."""
+        mobile_carrier = mobile_carrier or _status_carrier(self.mobile_carriers)
+        references = iter(references)
+        tasks = {}
+        try:
+            while True:
+                for reference in references:
+                    status = await self._cached_status(mobile_carrier, reference)
+                    if status is not None:
+                        yield StatusItem(
+                            reference=reference, status=status, cached=True
+                        )
+                        continue
+                    task = asyncio.create_task(
+                        self._fetch_status(mobile_carrier, reference)
+                    )
+                    tasks[task] = reference
+                    if len(tasks) >= concurrency:
+                        break
+                if not tasks:
+                    return
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield _status_item_from(task, reference=tasks.pop(task))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def pay_many(
+        self,
+        payers: Iterable[Payer] | PayerBatch,
+        *,
+        concurrency: int = 10,
+        max_per_carrier: int | None = None,
+        progress: BatchProgress | None = None,
+    ) -> AsyncIterator[BatchItem]:
+        """Async counterpart of :meth:`Client.pay_many`, payments run as tasks on the current event loop."""
+        dispatcher = BatchDispatcher(
+            payers,
+            router=self._router,
+            concurrency=concurrency,
+            max_per_carrier=max_per_carrier,
+        )
+        tasks = {}
+        try:
+            while not dispatcher.finished:
+                items = dispatcher.fill()
+                for index, payer, carrier in dispatcher.next_jobs():
+                    task = asyncio.create_task(self._pay(carrier, payer))
+                    tasks[task] = (index, payer, carrier)
+                if tasks:
+                    done, _ = await asyncio.wait(
+                        tasks, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        index, payer, carrier = tasks.pop(task)
+                        dispatcher.release(carrier)
+                        items.append(_batch_item_from(task, index=index, payer=payer))
+                for item in items:
+                    if progress is not None:
+                        progress.record(item)
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def _setup_instrumentation(client: Client | AsyncClient) -> None:
+    if client.instrumentation is None:
+        client.instrumentation = Instrumentation(logger=client.logger)
+    if client.metrics is not None:
+        client.instrumentation.add_hook(client.metrics)
+
+
+def _track_errors(metrics: MetricsCollector | None, mobile_carrier: MobileCarrier):
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.track_errors(type(mobile_carrier).__name__)
+
+
+def _track_payment(metrics: MetricsCollector | None, mobile_carrier: MobileCarrier):
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.track_payment(type(mobile_carrier).__name__)
+
+
+def _build_transport(client: Client) -> httpx.BaseTransport | None:
+    transport = client.transport and SharedTransport(client.transport)
+    # the optional layers are imported only when they are used, to keep ``import qosic`` cheap
+    if client.rate_limiter is not None:
+        from .ratelimit import RateLimitedTransport
+
+        transport = RateLimitedTransport(
+            transport or httpx.HTTPTransport(**_http_transport_options(client)),
+            client.rate_limiter,
+        )
+    if client.retry is not None:
+        from .retry import Retrier, RetryTransport
+
+        transport = RetryTransport(
+            transport or httpx.HTTPTransport(**_http_transport_options(client)),
+            Retrier(client.retry, metrics=client.metrics),
+        )
+    return transport
+
+
+def _build_async_transport(client: AsyncClient) -> httpx.AsyncBaseTransport | None:
+    transport = client.transport and AsyncSharedTransport(client.transport)
+    if client.rate_limiter is not None:
+        from .ratelimit import AsyncRateLimitedTransport
+
+        transport = AsyncRateLimitedTransport(
+            transport or httpx.AsyncHTTPTransport(**_http_transport_options(client)),
+            client.rate_limiter,
+        )
+    if client.retry is not None:
+        from .retry import AsyncRetryTransport, Retrier
+
+        transport = AsyncRetryTransport(
+            transport or httpx.AsyncHTTPTransport(**_http_transport_options(client)),
+            Retrier(client.retry, metrics=client.metrics),
+        )
+    return transport
+
+
+def _http_client_options(client: Client | AsyncClient, transport) -> dict:
+    options = {
+        "base_url": client.base_url,
+        "auth": (client.login, client.password),
+        "headers": {"content-type": "application/json"},
+        "timeout": client.timeout,
+    }
+    if transport is None:
+        options.update(_http_transport_options(client))
+    return options
+
+
+def _http_transport_options(client: Client | AsyncClient) -> dict:
+    options = {"verify": client.verify, "http2": client.http2}
+    if client.limits is not None:
+        options["limits"] = client.limits
+    return options
+
+
+def _can_pickle(value: object) -> bool:
+    import pickle
+
+    try:
+        pickle.dumps(value)
+    except (TypeError, AttributeError, pickle.PicklingError):
+        return False
+    return True
+
+
+def _clock_of(mobile_carrier: MobileCarrier) -> Clock:
+    # the carriers waiting for a confirmation measure their timeout with a clock
+    return getattr(mobile_carrier, "clock", SYSTEM_CLOCK)
+
+
+def _status_carrier(mobile_carriers: list[MobileCarrier]) -> MobileCarrier:
+    carriers = [c for c in mobile_carriers if hasattr(c, "check_status")]
+    assert (
+        len(carriers) == 1
+    ), "Pass the mobile_carrier, the client has no or several carriers with a status check"
+    return carriers[0]
+
+
+def _status_item_from(future, *, reference: str) -> StatusItem:
+    error = future.exception()
+    if error is not None:
+        return StatusItem(reference=reference, error=error)
+    return StatusItem(reference=reference, status=future.result())
+
+
+def _batch_item_from(future, *, index: int, payer: Payer) -> BatchItem:
+    error = future.exception()
+    if error is not None:
+        return BatchItem(index=index, payer=payer, error=error)
+    return BatchItem(index=index, payer=payer, result=future.result())
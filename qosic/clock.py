@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Protocol
+
+
+class Clock(Protocol):
+    """The time source and the sleeps used while waiting for the confirmation of a payment."""
+
+    def monotonic(self) -> float: ...
+
+    def sleep(self, seconds: float) -> None: ...
+
+    async def asleep(self, seconds: float) -> None: ...
+
+
+class SystemClock:
+    """The wall clock, the default of every component taking a ``clock``."""
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    async def asleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+class VirtualClock:
+    """A clock that only moves when told to, sleeping on it returns at once after moving it forward.
+
+    Pass the same instance to the mobile carriers (``MTN(clock=...)``) and to the ``FakeQosServer`` to run
+    scenarios spanning minutes of polling in a few milliseconds, see ``qosic.testing.run_load``.
+    The time is shared by every thread and task using the clock, sleeping concurrently adds up the delays.
+    """
+
+    def __init__(self, start: float = 0):
+        self._now = float(start)
+        self._lock = threading.Lock()
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def advance(self, seconds: float) -> None:
+        assert seconds >= 0, "the time can't go backward"
+        with self._lock:
+            self._now += seconds
+
+    def advance_to(self, instant: float) -> None:
+        """Move the time forward to ``instant``, do nothing if it is already past."""
+        with self._lock:
+            self._now = max(self._now, instant)
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(max(seconds, 0))
+
+    async def asleep(self, seconds: float) -> None:
+        self.advance(max(seconds, 0))
+        # still let the other tasks run, like a real sleep
+        await asyncio.sleep(0)
@@ -24,3 +24,19 @@ class InvalidProviderIDError(Exception):
 
 class InvalidCredentialsError(Exception):
     pass
+
+
+class MobileCarrierConflictError(Exception):
+    pass
+
+
+class InvalidCallbackError(Exception):
+    pass
+
+
+class ReferenceCollisionError(Exception):
+    pass
+
+
+class CircuitOpenError(ServerError):
+    pass
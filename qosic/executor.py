@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+from dataclasses import replace
+
+from .bulk import BatchItem, BatchProgress
+from .client import Client, ClientConfig
+from .utils import Payer
+
+# set in each worker process by _init_worker
+_client: Client | None = None
+_results: multiprocessing.Queue | None = None
+_concurrency: int = 10
+
+
+class PaymentExecutor:
+    """Spread the payments of a bulk job over a pool of processes, each one with its own ``Client``.
+
+    The clients are built from ``config`` once per process, when the pool starts, and reused for every batch.
+    Each process pays its payers with ``Client.pay_many`` and sends back each ``BatchItem`` over a queue
+    as soon as it completes, so the results of ``pay_many`` are streamed in completion order.
+    :param config: The settings of the clients, see ``Client.config``
+    :param processes: Number of worker processes, the number of CPUs by default
+    :param concurrency: Payments in flight in each process
+    :param chunk_size: Number of payers sent to a process at once
+    :param mp_context: The multiprocessing context used to start the processes, ``spawn`` by default
+    """
+
+    def __init__(
+        self,
+        config: ClientConfig,
+        *,
+        processes: int | None = None,
+        concurrency: int = 10,
+        chunk_size: int = 100,
+        mp_context: multiprocessing.context.BaseContext | None = None,
+    ):
+        assert chunk_size >= 1, "chunk_size should be at least 1"
+        self.config = config
+        self.processes = processes or os.cpu_count() or 1
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        # fork is not safe in a process running threads, like the ones of a StatusPoller
+        context = mp_context or multiprocessing.get_context("spawn")
+        self._results = context.Queue()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(config, self._results, concurrency),
+        )
+        self._chunk_ids = itertools.count()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        self._results.close()
+
+    def pay_many(
+        self,
+        payers: Iterable[Payer],
+        *,
+        progress: BatchProgress | None = None,
+    ) -> Iterator[BatchItem]:
+        """Pay every payer from ``payers`` and yield a ``BatchItem`` as each payment completes, in completion order.
+        ``payers`` is read lazily, a few chunks per process are in flight at any time. Run one batch at a time,
+        the batches of an executor share the same result queue.
+        :param progress: Counters updated as items are yielded
+        """
+        payers = enumerate(payers)
+        # the payers of each chunk not yet reported, to report them as errors if their process dies
+        chunks: dict[int, dict[int, Payer]] = {}
+        futures: dict[int, Future] = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(chunks) < self.processes * 2:
+                chunk = dict(itertools.islice(payers, self.chunk_size))
+                if not chunk:
+                    exhausted = True
+                    break
+                chunk_id = next(self._chunk_ids)
+                chunks[chunk_id] = chunk
+                futures[chunk_id] = self._pool.submit(
+                    _pay_chunk, chunk_id, list(chunk.items())
+                )
+            if not chunks:
+                return
+            for item in self._collect(chunks, futures):
+                if progress is not None:
+                    progress.record(item)
+                yield item
+
+    def _collect(
+        self, chunks: dict[int, dict[int, Payer]], futures: dict[int, Future]
+    ) -> list[BatchItem]:
+        try:
+            chunk_id, item = pickle.loads(self._results.get(timeout=0.1))
+        except queue.Empty:
+            return self._collect_failed_chunks(chunks, futures)
+        chunk = chunks.get(chunk_id)
+        if chunk is None:
+            # its process died and the rest of the chunk was already reported as failed
+            return []
+        del chunk[item.index]
+        if not chunk:
+            del chunks[chunk_id], futures[chunk_id]
+        return [item]
+
+    @staticmethod
+    def _collect_failed_chunks(
+        chunks: dict[int, dict[int, Payer]], futures: dict[int, Future]
+    ) -> list[BatchItem]:
+        items = []
+        for chunk_id, future in list(futures.items()):
+            if not future.done() or future.exception() is None:
+                continue
+            for index, payer in chunks.pop(chunk_id).items():
+                items.append(
+                    BatchItem(index=index, payer=payer, error=future.exception())
+                )
+            del futures[chunk_id]
+        return items
+
+
+def _init_worker(
+    config: ClientConfig, results: multiprocessing.Queue, concurrency: int
+) -> None:
+    global _client, _results, _concurrency
+    _client = config.build()
+    _results = results
+    _concurrency = concurrency
+
+
+def _pay_chunk(chunk_id: int, payers: list[tuple[int, Payer]]) -> None:
+    for item in _client.pay_many(
+        (payer for _, payer in payers), concurrency=_concurrency
+    ):
+        item = replace(item, index=payers[item.index][0])
+        # pickled here rather than in the queue feeder thread, where a failure would lose the item silently
+        try:
+            message = pickle.dumps((chunk_id, item))
+        except Exception as exc:
+            error = RuntimeError(f"{item.error!r} can't be sent back: {exc}")
+            message = pickle.dumps((chunk_id, replace(item, error=error)))
+        _results.put(message)
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import os
+from typing import IO, Any, Iterator, Sequence, TYPE_CHECKING
+
+from dataclasses import dataclass, field
+
+from .routing import RoutingTable
+from .utils import Payer
+
+if TYPE_CHECKING:
+    from .protocols import MobileCarrier
+
+INVALID_PHONE = "invalid phone number, expected 11 digits like 229XXXXXXXX"
+UNKNOWN_CARRIER = "no mobile carrier for this phone number"
+INVALID_AMOUNT = "invalid amount, expected a positive integer"
+
+
+@dataclass(frozen=True, slots=True)
+class Rejection:
+    """A row of a batch that can't be paid, with the values it was read with."""
+
+    index: int
+    phone: Any
+    amount: Any
+    reason: str
+
+
+@dataclass(frozen=True)
+class PayerBatch:
+    """The valid rows of a payout file, stored column by column and already routed to their mobile carrier.
+
+    The rows are validated and routed for the whole batch at once, see ``from_columns``, and the rows that
+    can't be paid are kept in ``rejections``. Pass the batch to ``pay_many``: its payers are built without being
+    validated again, the carriers are not looked up again and the ``index`` of each ``BatchItem`` is the row
+    number in the source, so results and rejections can be matched with the original file.
+    """
+
+    indexes: list[int]
+    phones: list[str]
+    amounts: list[int]
+    first_names: list[str]
+    last_names: list[str]
+    carriers: list[MobileCarrier]
+    rejections: list[Rejection] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.indexes)
+
+    def __iter__(self) -> Iterator[Payer]:
+        return Payer._trusted_many(*self._payer_columns())
+
+    def routed(self) -> Iterator[tuple[int, Payer, MobileCarrier]]:
+        """Yield the row number, the payer and the mobile carrier of each valid row."""
+        payers = Payer._trusted_many(*self._payer_columns())
+        return zip(self.indexes, payers, self.carriers)
+
+    def routed_to(self, mobile_carriers: list[MobileCarrier]) -> bool:
+        """Whether every row is routed to one of ``mobile_carriers``, the carriers of the client paying the batch."""
+        known = {id(carrier) for carrier in mobile_carriers}
+        return {id(carrier) for carrier in self.carriers} <= known
+
+    def _payer_columns(self) -> tuple[list, ...]:
+        return self.phones, self.amounts, self.first_names, self.last_names
+
+    @classmethod
+    def from_columns(
+        cls,
+        *,
+        phones: Sequence[Any],
+        amounts: Sequence[Any],
+        first_names: Sequence[Any] | None = None,
+        last_names: Sequence[Any] | None = None,
+        mobile_carriers: list[MobileCarrier],
+    ) -> PayerBatch:
+        """Validate and route the rows given as columns of the same length, the rows are numbered from 0.
+        Phones are checked like ``Payer`` does, amounts can be strings as read from a CSV file.
+        :param mobile_carriers: The carriers the phones are routed to, those of the client paying the batch
+        """
+        phones = [str(phone).strip() for phone in _values(phones)]
+        raw_amounts = _values(amounts)
+        size = len(phones)
+        assert (
+            len(raw_amounts) == size
+        ), "phones and amounts should have the same length"
+        first_names = _names(first_names, size)
+        last_names = _names(last_names, size)
+        amounts = _amounts(raw_amounts)
+        router = RoutingTable(mobile_carriers)
+        positions = router.indexes_of(phones)
+        # the same check as the pattern of Payer, \d matches the unicode decimal digits
+        valid_phones = [len(phone) == 11 and phone.isdecimal() for phone in phones]
+        rejections = []
+        for row in range(size):
+            if not valid_phones[row]:
+                reason = INVALID_PHONE
+            elif positions[row] is None:
+                reason = UNKNOWN_CARRIER
+            elif amounts[row] is None:
+                reason = INVALID_AMOUNT
+            else:
+                continue
+            rejections.append(
+                Rejection(
+                    index=row,
+                    phone=phones[row],
+                    amount=raw_amounts[row],
+                    reason=reason,
+                )
+            )
+        indexes: Sequence[int] = range(size)
+        if rejections:
+            rejected = {rejection.index for rejection in rejections}
+            indexes = [row for row in indexes if row not in rejected]
+            phones, amounts, first_names, last_names, positions = (
+                [column[row] for row in indexes]
+                for column in (phones, amounts, first_names, last_names, positions)
+            )
+        carriers = router.mobile_carriers
+        return cls(
+            indexes=list(indexes),
+            phones=phones,
+            amounts=amounts,
+            first_names=first_names,
+            last_names=last_names,
+            carriers=[carriers[position] for position in positions],
+            rejections=rejections,
+        )
+
+    @classmethod
+    def from_table(
+        cls,
+        table: Any,
+        *,
+        mobile_carriers: list[MobileCarrier],
+        phone: str = "phone",
+        amount: str = "amount",
+        first_name: str = "first_name",
+        last_name: str = "last_name",
+    ) -> PayerBatch:
+        """Read the columns of a pandas ``DataFrame``, a dict of lists or any table indexed by column name.
+        The name columns are optional."""
+        return cls.from_columns(
+            phones=table[phone],
+            amounts=table[amount],
+            first_names=table[first_name] if first_name in table else None,
+            last_names=table[last_name] if last_name in table else None,
+            mobile_carriers=mobile_carriers,
+        )
+
+    def write_rejections(self, destination: str | os.PathLike | IO[str]) -> None:
+        """Write the rejected rows as CSV, with their row number, phone, amount and the reason of the rejection."""
+        import csv
+
+        if isinstance(destination, (str, os.PathLike)):
+            with open(destination, "w", newline="") as file:
+                self.write_rejections(file)
+            return
+        writer = csv.writer(destination)
+        writer.writerow(["index", "phone", "amount", "reason"])
+        for rejection in self.rejections:
+            writer.writerow(
+                [rejection.index, rejection.phone, rejection.amount, rejection.reason]
+            )
+
+
+def read_payers(
+    source: str | os.PathLike | IO[str],
+    *,
+    mobile_carriers: list[MobileCarrier],
+    phone: str = "phone",
+    amount: str = "amount",
+    first_name: str = "first_name",
+    last_name: str = "last_name",
+) -> PayerBatch:
+    """Read a CSV file with a header or a JSON lines file into a ``PayerBatch``, see ``PayerBatch.from_table``
+    for the column names. The rows are numbered from 0, not counting the header."""
+    import csv
+    import itertools
+    import json
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="") as file:
+            return read_payers(
+                file,
+                mobile_carriers=mobile_carriers,
+                phone=phone,
+                amount=amount,
+                first_name=first_name,
+                last_name=last_name,
+            )
+    lines = (line for line in source if line.strip())
+    first_line = next(lines, "")
+    lines = itertools.chain([first_line], lines)
+    names = (phone, amount, first_name, last_name)
+    columns: dict[str, list] = {name: [] for name in names}
+    if first_line.lstrip().startswith("{"):
+        for line in lines:
+            row = json.loads(line)
+            for name in names:
+                columns[name].append(row.get(name))
+    else:
+        for row in csv.DictReader(lines):
+            for name in names:
+                columns[name].append(row.get(name))
+    return PayerBatch.from_columns(
+        phones=columns[phone],
+        amounts=columns[amount],
+        first_names=columns[first_name],
+        last_names=columns[last_name],
+        mobile_carriers=mobile_carriers,
+    )
+
+
+def _values(column: Sequence[Any]) -> list:
+    # pandas and numpy columns are converted to lists of python values in one call
+    tolist = getattr(column, "tolist", None)
+    return tolist() if tolist is not None else list(column)
+
+
+def _names(column: Sequence[Any] | None, size: int) -> list[str]:
+    if column is None:
+        return [""] * size
+    # missing values are None, or NaN in a pandas column
+    names = [
+        "" if name is None or name != name else str(name) for name in _values(column)
+    ]
+    assert len(names) == size, "every column should have the same length"
+    return names
+
+
+def _amounts(values: list) -> list[int | None]:
+    # most files have integer amounts only, they are converted in one pass
+    if all(type(value) is int for value in values) or all(
+        type(value) is str for value in values
+    ):
+        try:
+            return [amount if amount > 0 else None for amount in map(int, values)]
+        except ValueError:
+            pass
+    return [_amount(value) for value in values]
+
+
+def _amount(value: Any) -> int | None:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    try:
+        amount = value if isinstance(value, int) else int(str(value).strip())
+    except ValueError:
+        return None
+    return amount if amount > 0 else None
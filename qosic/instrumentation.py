@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import json
+import logging
+import time
+from logging import Logger
+from typing import Callable, Iterable
+
+import httpx
+from dataclasses import dataclass
+
+from .logger import logger as _logger
+
+CONTEXT_EXTENSION = "qosic"
+_STARTED_AT_EXTENSION = "qosic.started_at"
+_REDACTED_FIELDS = ("firstname", "lastname")
+
+
+@dataclass(frozen=True)
+class RequestEvent:
+    """A summary of one request sent to the QosIc api.
+    :param endpoint: The path of the api endpoint
+    :param carrier: The name of the mobile carrier that sent the request
+    :param status_code: The HTTP status code of the response
+    :param latency: Seconds between sending the request and receiving the response headers
+    :param attempt: The status check number for transaction status requests
+    :param request_body: The redacted request body, only set if ``log_bodies`` is enabled
+    :param response_body: The redacted response body, only set if ``log_bodies`` is enabled
+    """
+
+    endpoint: str
+    carrier: str | None
+    status_code: int
+    latency: float
+    attempt: int | None = None
+    request_body: str | None = None
+    response_body: str | None = None
+
+
+def request_context(carrier, *, attempt: int | None = None) -> dict:
+    """Extensions attached to the requests sent by ``carrier``, read back by :class:`Instrumentation`."""
+    return {CONTEXT_EXTENSION: {"carrier": type(carrier).__name__, "attempt": attempt}}
+
+
+def redact(content: bytes) -> str:
+    """Mask the personal data (phone number and names) of a QosIc request or response body."""
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return content.decode(errors="replace")
+    if not isinstance(data, dict):
+        return json.dumps(data)
+    msisdn = data.get("msisdn")
+    if isinstance(msisdn, str):
+        data["msisdn"] = "*" * max(len(msisdn) - 3, 0) + msisdn[-3:]
+    for key in _REDACTED_FIELDS:
+        if data.get(key):
+            data[key] = "***"
+    return json.dumps(data)
+
+
+class Instrumentation:
+    """Turn every request sent by a client into a :class:`RequestEvent`.
+
+    Events are passed to each of the ``hooks`` and logged at the ``DEBUG`` level. When there is no hook and
+    ``DEBUG`` is not enabled on the logger, the httpx event hooks return immediately and no event is built.
+    :param hooks: Callables receiving each ``RequestEvent``
+    :param logger: Logger used to log the events
+    :param log_bodies: Also read and attach the redacted request and response bodies to the events
+    """
+
+    def __init__(
+        self,
+        hooks: Iterable[Callable[[RequestEvent], None]] = (),
+        *,
+        logger: Logger = _logger,
+        log_bodies: bool = False,
+    ):
+        self.hooks = list(hooks)
+        self.logger = logger
+        self.log_bodies = log_bodies
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.hooks) or self.logger.isEnabledFor(logging.DEBUG)
+
+    def add_hook(self, hook: Callable[[RequestEvent], None]) -> None:
+        # an instrumentation shared by several clients gets the same hook from each of them
+        if hook not in self.hooks:
+            self.hooks.append(hook)
+
+    def on_request(self, request: httpx.Request) -> None:
+        if self.enabled:
+            request.extensions[_STARTED_AT_EXTENSION] = time.perf_counter()
+
+    def on_response(self, response: httpx.Response) -> None:
+        if _STARTED_AT_EXTENSION not in response.request.extensions:
+            return
+        bodies = {}
+        if self.log_bodies:
+            bodies = self._bodies(response.request.read(), response.read())
+        self._emit(response, **bodies)
+
+    async def aon_request(self, request: httpx.Request) -> None:
+        self.on_request(request)
+
+    async def aon_response(self, response: httpx.Response) -> None:
+        if _STARTED_AT_EXTENSION not in response.request.extensions:
+            return
+        bodies = {}
+        if self.log_bodies:
+            bodies = self._bodies(
+                await response.request.aread(), await response.aread()
+            )
+        self._emit(response, **bodies)
+
+    def event_hooks(self) -> dict:
+        return {"request": [self.on_request], "response": [self.on_response]}
+
+    def async_event_hooks(self) -> dict:
+        return {"request": [self.aon_request], "response": [self.aon_response]}
+
+    @staticmethod
+    def _bodies(request_content: bytes, response_content: bytes) -> dict:
+        return {
+            "request_body": redact(request_content),
+            "response_body": redact(response_content),
+        }
+
+    def _emit(self, response: httpx.Response, **bodies) -> None:
+        request = response.request
+        context = request.extensions.get(CONTEXT_EXTENSION, {})
+        event = RequestEvent(
+            endpoint=request.url.path,
+            carrier=context.get("carrier"),
+            status_code=response.status_code,
+            latency=time.perf_counter() - request.extensions[_STARTED_AT_EXTENSION],
+            attempt=context.get("attempt"),
+            **bodies,
+        )
+        for hook in self.hooks:
+            hook(event)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("%s", event)
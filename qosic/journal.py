@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Iterator, Protocol, TYPE_CHECKING
+
+from dataclasses import asdict, dataclass, replace
+
+from .logger import logger as _logger
+from .utils import Payer, Result
+
+if TYPE_CHECKING:
+    from .pending import PendingPayment
+    from .protocols import MobileCarrier
+
+
+class TransactionState(str, Enum):
+    CREATED = "CREATED"  # saved before the payment request is sent
+    SUBMITTED = "SUBMITTED"  # accepted by the server, waiting for the confirmation
+    CONFIRMED = "CONFIRMED"
+    FAILED = "FAILED"
+
+    @property
+    def in_flight(self) -> bool:
+        return self in (TransactionState.CREATED, TransactionState.SUBMITTED)
+
+    @classmethod
+    def from_status(cls, status: Result.Status) -> TransactionState:
+        if status == Result.Status.CONFIRMED:
+            return cls.CONFIRMED
+        if status == Result.Status.PENDING:
+            return cls.SUBMITTED
+        return cls.FAILED
+
+
+@dataclass(frozen=True)
+class TransactionRecord:
+    """What is kept about a payment. The phone number is only stored as an HMAC keyed with the ``phone_key``
+    of the store, and not at all if the store has no key."""
+
+    reference: str
+    carrier: str
+    amount: int
+    phone_hash: str
+    state: TransactionState = TransactionState.CREATED
+    updated_at: float = 0
+
+    @classmethod
+    def for_payment(
+        cls,
+        *,
+        reference: str,
+        mobile_carrier: MobileCarrier,
+        payer: Payer,
+        phone_key: bytes | None = None,
+    ) -> TransactionRecord:
+        return cls(
+            reference=reference,
+            carrier=mobile_carrier.id,
+            amount=payer.amount,
+            phone_hash=hash_phone(payer.phone, phone_key) if phone_key else "",
+            updated_at=time.time(),
+        )
+
+    def with_state(self, state: TransactionState) -> TransactionRecord:
+        return replace(self, state=state, updated_at=time.time())
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "state": self.state.value}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> TransactionRecord:
+        return cls(**{**data, "state": TransactionState(data["state"])})
+
+
+def hash_phone(phone: str, key: bytes) -> str:
+    """The HMAC-SHA256 of ``phone``, a plain hash of an 11 digits number is reversed by trying them all."""
+    return hmac.new(key, phone.encode(), hashlib.sha256).hexdigest()
+
+
+def journal_pending_payment(
+    store: TransactionStore, record: TransactionRecord, pending: PendingPayment
+) -> None:
+    """Save the state of ``pending`` now and again once it is resolved."""
+    if not pending.done():
+        store.save(record.with_state(TransactionState.SUBMITTED))
+
+    def resolved(future: PendingPayment) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        state = TransactionState.from_status(future.result().status)
+        store.save(record.with_state(state))
+
+    pending.add_done_callback(resolved)
+
+
+class TransactionStore(Protocol):
+    """Where the client journals its payments, to be able to resume them after a crash."""
+
+    # the secret the phone numbers are hashed with, they are not stored if it is None
+    phone_key: bytes | None
+
+    def save(self, record: TransactionRecord) -> None:
+        """Insert the record or replace the one with the same reference."""
+        ...
+
+    def get(self, reference: str) -> TransactionRecord | None: ...
+
+    def in_flight(self, batch_size: int = 100) -> Iterator[list[TransactionRecord]]:
+        """The records of the payments not resolved yet, in batches of at most ``batch_size``."""
+        ...
+
+
+class MemoryStore:
+    """Keep the records in a dict, useful for tests, it does not survive a restart.
+    :param phone_key: The secret the phone numbers are hashed with, see ``hash_phone``
+    """
+
+    def __init__(self, *, phone_key: bytes | str | None = None):
+        self.phone_key = _key(phone_key)
+        self._records: dict[str, TransactionRecord] = {}
+        self._lock = threading.Lock()
+
+    def save(self, record: TransactionRecord) -> None:
+        with self._lock:
+            self._records[record.reference] = record
+
+    def get(self, reference: str) -> TransactionRecord | None:
+        return self._records.get(reference)
+
+    def in_flight(self, batch_size: int = 100) -> Iterator[list[TransactionRecord]]:
+        with self._lock:
+            records = [r for r in self._records.values() if r.state.in_flight]
+        for start in range(0, len(records), batch_size):
+            yield records[start : start + batch_size]
+
+
+class FileStore(MemoryStore):
+    """Append every change as a JSON line to ``path``, the file is replayed when the store is opened.
+    Call ``compact`` from time to time to drop the lines of the resolved payments."""
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        *,
+        fsync: bool = False,
+        phone_key: bytes | str | None = None,
+    ):
+        super().__init__(phone_key=phone_key)
+        self.path = Path(path)
+        self.fsync = fsync
+        if self.path.exists():
+            self._replay()
+        self._file = self.path.open("a")
+
+    def _replay(self) -> None:
+        content = self.path.read_bytes()
+        lines = content.splitlines(keepends=True)
+        offset = 0
+        for number, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    record = TransactionRecord.from_dict(json.loads(line))
+                except ValueError:
+                    if number < len(lines):
+                        raise
+                    # a crash in the middle of ``save`` leaves a truncated last line, it is dropped
+                    # so that the next records are not appended to it
+                    _logger.warning(
+                        f"Dropping the truncated last line of the journal {self.path}"
+                    )
+                    os.truncate(self.path, offset)
+                    return
+                self._records[record.reference] = record
+            offset += len(line)
+        if content and not content.endswith(b"\n"):
+            with self.path.open("a") as file:
+                file.write("\n")
+
+    def save(self, record: TransactionRecord) -> None:
+        line = json.dumps(record.to_dict()) + "\n"
+        with self._lock:
+            self._records[record.reference] = record
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def compact(self) -> None:
+        """Rewrite the file with only the payments still in flight."""
+        with self._lock:
+            self._records = {
+                reference: record
+                for reference, record in self._records.items()
+                if record.state.in_flight
+            }
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            with tmp_path.open("w") as file:
+                for record in self._records.values():
+                    file.write(json.dumps(record.to_dict()) + "\n")
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = self.path.open("a")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SQLiteStore:
+    """Keep the records in a SQLite database, it can be shared by the threads of a process."""
+
+    def __init__(
+        self, path: str | os.PathLike, *, phone_key: bytes | str | None = None
+    ):
+        import sqlite3
+
+        self.path = path
+        self.phone_key = _key(phone_key)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS qosic_transactions ("
+                "reference TEXT PRIMARY KEY, carrier TEXT NOT NULL, amount INTEGER NOT NULL, "
+                "phone_hash TEXT NOT NULL, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS qosic_transactions_state "
+                "ON qosic_transactions (state, reference)"
+            )
+
+    def save(self, record: TransactionRecord) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO qosic_transactions VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    record.reference,
+                    record.carrier,
+                    record.amount,
+                    record.phone_hash,
+                    record.state.value,
+                    record.updated_at,
+                ),
+            )
+
+    def get(self, reference: str) -> TransactionRecord | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM qosic_transactions WHERE reference = ?", (reference,)
+            ).fetchone()
+        return self._record(row) if row else None
+
+    def in_flight(self, batch_size: int = 100) -> Iterator[list[TransactionRecord]]:
+        last_reference = ""
+        states = (TransactionState.CREATED.value, TransactionState.SUBMITTED.value)
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT * FROM qosic_transactions WHERE state IN (?, ?) AND reference > ? "
+                    "ORDER BY reference LIMIT ?",
+                    (*states, last_reference, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            last_reference = rows[-1][0]
+            yield [self._record(row) for row in rows]
+
+    def close(self) -> None:
+        self._connection.close()
+
+    @staticmethod
+    def _record(row: tuple) -> TransactionRecord:
+        reference, carrier, amount, phone_hash, state, updated_at = row
+        return TransactionRecord(
+            reference=reference,
+            carrier=carrier,
+            amount=amount,
+            phone_hash=phone_hash,
+            state=TransactionState(state),
+            updated_at=updated_at,
+        )
+
+
+def _key(phone_key: bytes | str | None) -> bytes | None:
+    return phone_key.encode() if isinstance(phone_key, str) else phone_key
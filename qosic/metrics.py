@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import bisect
+import contextlib
+import threading
+from typing import Iterator
+
+from dataclasses import dataclass, field
+
+from .instrumentation import RequestEvent
+from .pending import PendingPayment
+from .utils import Result
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180)
+ATTEMPTS_BUCKETS = (1, 2, 3, 5, 8, 13, 21)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...]
+    counts: list[int] = field(default_factory=list)
+    sum: float = 0
+    count: int = 0
+
+    def __post_init__(self):
+        # the last slot counts the observations above the highest bucket (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """The Prometheus representation, observations less than or equal to each bucket."""
+        total = 0
+        result = []
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            result.append((str(bound), total))
+        return result
+
+
+class MetricsCollector:
+    """Collect counters, gauges and histograms about the requests and payments of a client.
+
+    Register it on a client with ``Client(..., metrics=MetricsCollector())``, it then receives every request event
+    and every payment outcome. Read the collected values with ``snapshot()`` or export them with ``to_prometheus()``.
+
+    * ``qosic_request_latency_seconds`` (histogram): per ``endpoint`` and ``carrier``
+    * ``qosic_requests_total`` (counter): per ``endpoint``, ``carrier`` and ``status_code``
+    * ``qosic_payments_total`` (counter): per ``carrier`` and ``status``
+    * ``qosic_payment_duration_seconds`` (histogram): time to confirmation per ``carrier``
+    * ``qosic_payment_poll_attempts`` (histogram): status checks needed per MTN payment
+    * ``qosic_errors_total`` (counter): exceptions raised per ``carrier`` and ``error`` class
+    * ``qosic_payments_in_flight`` (gauge): payments started and not yet resolved per ``carrier``
+    """
+
+    def __init__(self, namespace: str = "qosic"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._gauges: dict[tuple[str, Labels], float] = {}
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+
+    def __call__(self, event: RequestEvent) -> None:
+        labels = {"endpoint": event.endpoint, "carrier": event.carrier or ""}
+        self.observe(
+            "request_latency_seconds", event.latency, LATENCY_BUCKETS, **labels
+        )
+        self.increment("requests_total", status_code=str(event.status_code), **labels)
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def add_to_gauge(self, name: str, value: float, **labels: str) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    def observe(
+        self, name: str, value: float, buckets: tuple[float, ...], **labels: str
+    ) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def track_payment(self, carrier: str) -> Iterator[None]:
+        """Count the payment as in flight and record the exception it raises, if any."""
+        self.add_to_gauge("payments_in_flight", 1, carrier=carrier)
+        try:
+            with self.track_errors(carrier):
+                yield
+        finally:
+            self.add_to_gauge("payments_in_flight", -1, carrier=carrier)
+
+    @contextlib.contextmanager
+    def track_errors(self, carrier: str) -> Iterator[None]:
+        try:
+            yield
+        except Exception as exc:
+            self.record_error(exc, carrier=carrier)
+            raise
+
+    def track_pending_payment(self, pending: PendingPayment) -> None:
+        """Count the payment as in flight until it is resolved, then record its outcome."""
+        carrier = type(pending.mobile_carrier).__name__
+        self.add_to_gauge("payments_in_flight", 1, carrier=carrier)
+
+        def done(future: PendingPayment) -> None:
+            self.add_to_gauge("payments_in_flight", -1, carrier=carrier)
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.record_error(future.exception(), carrier=carrier)
+                return
+            # submitted_at was read from the clock of the payment, a virtual one in load tests
+            self.record_payment(
+                future.result(),
+                duration=future.clock.monotonic() - future.submitted_at,
+            )
+
+        pending.add_done_callback(done)
+
+    def record_error(self, exc: BaseException, *, carrier: str = "") -> None:
+        self.increment("errors_total", carrier=carrier, error=type(exc).__name__)
+
+    def record_payment(self, result: Result, *, duration: float) -> None:
+        carrier = type(result.mobile_carrier).__name__
+        self.increment("payments_total", carrier=carrier, status=result.status.value)
+        if result.success:
+            self.observe(
+                "payment_duration_seconds", duration, LATENCY_BUCKETS, carrier=carrier
+            )
+        if result.attempts:
+            self.observe(
+                "payment_poll_attempts",
+                result.attempts,
+                ATTEMPTS_BUCKETS,
+                carrier=carrier,
+            )
+
+    def snapshot(self) -> dict:
+        """A copy of the collected values, keyed by metric name then by labels."""
+        snapshot = {"counters": {}, "gauges": {}, "histograms": {}}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                snapshot["counters"].setdefault(name, {})[labels] = value
+            for (name, labels), value in self._gauges.items():
+                snapshot["gauges"].setdefault(name, {})[labels] = value
+            for (name, labels), histogram in self._histograms.items():
+                snapshot["histograms"].setdefault(name, {})[labels] = {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": histogram.cumulative(),
+                }
+        return snapshot
+
+    def to_prometheus(self) -> str:
+        """Render the collected values in the Prometheus text exposition format."""
+        lines = []
+        snapshot = self.snapshot()
+        for kind, type_ in (("counters", "counter"), ("gauges", "gauge")):
+            for name, series in sorted(snapshot[kind].items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} {type_}")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+        for name, series in sorted(snapshot["histograms"].items()):
+            metric = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, histogram in sorted(series.items()):
+                for bound, count in histogram["buckets"]:
+                    bucket_labels = (*labels, ("le", bound))
+                    lines.append(
+                        f"{metric}_bucket{_format_labels(bucket_labels)} {count}"
+                    )
+                lines.append(f"{metric}_sum{_format_labels(labels)} {histogram['sum']}")
+                lines.append(
+                    f"{metric}_count{_format_labels(labels)} {histogram['count']}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
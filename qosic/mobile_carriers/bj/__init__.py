@@ -1,2 +1,26 @@
-from .moov import MOOV  # noqa
-from .mtn import MTN  # noqa
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .moov import MOOV  # noqa
+    from .mtn import MTN  # noqa
+
+# MTN brings the status polling machinery, it is only imported when MTN is used
+_LAZY_ATTRIBUTES = {"MOOV": ".moov", "MTN": ".mtn"}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *__all__])
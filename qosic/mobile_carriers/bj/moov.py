@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Awaitable, Callable
+
 import httpx
 from dataclasses import dataclass, field
 
@@ -8,11 +10,14 @@ from qosic.mobile_carriers.utils import (
     generic_reference_factory,
     validate_reference_factory,
     handle_common_errors,
-    get_json_from,
-    response_is_ok,
 )
+from ...instrumentation import request_context
+from ...pending import PendingPayment
+from ...responses import parse_response
+from ...templates import PaymentTemplate
 from ...utils import Payer, Result
 
+COUNTRY_CODE = "229"
 MOOV_PREFIXES = ["55", "60", "63", "64", "65", "68", "94", "95", "98", "99", "58"]
 MOOV_PAYMENT_PATH = "/QosicBridge/user/requestpaymentmv"
 
@@ -22,19 +27,79 @@ class MOOV:
     id: str
     allowed_prefixes: list[str] = field(default_factory=lambda: MOOV_PREFIXES)
     reference_factory: callable = generic_reference_factory
+    country_code: str = COUNTRY_CODE
 
     def __post_init__(self):
         validate_reference_factory(self.reference_factory)
 
-    def pay(self, client: httpx.Client, *, payer: Payer) -> Result:
-        body = payer.to_qos_compliant_payment_request_body(self)
-        response = client.post(url=MOOV_PAYMENT_PATH, json=body)
-        handle_common_errors(response, provider=self, payer=payer)
-        json_content = get_json_from(response)
-        ok = response_is_ok(response) and json_content["responsecode"] == "0"
+    def pay(
+        self,
+        client: httpx.Client,
+        *,
+        payer: Payer,
+        reference: str | None = None,
+        template: PaymentTemplate | None = None,
+    ) -> Result:
+        reference = reference or self.reference_factory(payer)
+        if template is None:
+            response = client.post(
+                url=MOOV_PAYMENT_PATH,
+                json=payer.to_qos_compliant_payment_request_body(self, reference),
+                extensions=request_context(self),
+            )
+        else:
+            response = client.send(template.build_request(payer, reference))
+        return self._build_payment_result(response, reference=reference, payer=payer)
+
+    def submit(
+        self,
+        client: httpx.Client,
+        *,
+        payer: Payer,
+        reference: str | None = None,
+        template: PaymentTemplate | None = None,
+    ) -> PendingPayment:
+        """MOOV answers synchronously, the returned payment is already resolved."""
+        return PendingPayment.resolved(
+            self.pay(client, payer=payer, reference=reference, template=template)
+        )
+
+    def payment_template(
+        self, client: httpx.Client | httpx.AsyncClient
+    ) -> PaymentTemplate:
+        """The parts of the payment requests sent with ``client`` that are the same for every payer."""
+        return PaymentTemplate(self, client, MOOV_PAYMENT_PATH)
+
+    async def apay(
+        self,
+        client: httpx.AsyncClient,
+        *,
+        payer: Payer,
+        reference: str | None = None,
+        template: PaymentTemplate | None = None,
+        on_submitted: Callable[[], Awaitable[None]] | None = None,
+    ) -> Result:
+        # MOOV answers with the final status, there is no submitted state to report to ``on_submitted``
+        reference = reference or self.reference_factory(payer)
+        if template is None:
+            response = await client.post(
+                url=MOOV_PAYMENT_PATH,
+                json=payer.to_qos_compliant_payment_request_body(self, reference),
+                extensions=request_context(self),
+            )
+        else:
+            response = await client.send(template.build_request(payer, reference))
+        return self._build_payment_result(response, reference=reference, payer=payer)
+
+    def _build_payment_result(
+        self, response: httpx.Response, *, reference: str, payer: Payer
+    ) -> Result:
+        parsed = parse_response(response)
+        handle_common_errors(parsed, provider=self, payer=payer)
+        ok = parsed.ok and parsed.response_code == "0"
         status = Result.Status.CONFIRMED if ok else Result.Status.FAILED
         return Result(
-            reference=body["transref"],
+            reference=reference,
             mobile_carrier=self,
             status=status,
             response=response,
@@ -43,3 +108,8 @@ class MOOV:
 
     def refund(self, client: httpx.Client, *, reference: str, phone: str) -> Result:
         raise FeatureNotImplementedError("MOOV does not support the refund operation")
+
+    async def arefund(
+        self, client: httpx.AsyncClient, *, reference: str, phone: str
+    ) -> Result:
+        raise FeatureNotImplementedError("MOOV does not support the refund operation")
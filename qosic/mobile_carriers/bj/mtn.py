@@ -1,20 +1,26 @@
 from __future__ import annotations
 
-import contextlib
+from typing import Awaitable, Callable
 
 import httpx
-import polling2
 from dataclasses import dataclass, field
 
 from qosic.mobile_carriers.utils import (
     generic_reference_factory,
     validate_reference_factory,
     handle_common_errors,
-    get_json_from,
-    response_is_ok,
 )
+from ...clock import SYSTEM_CLOCK, Clock
+from ...errors import ServerError
+from ...instrumentation import request_context
+from ...logger import logger as _logger
+from ...pending import PendingPayment
+from ...polling import DEFAULT_POLLING, FixedInterval, PollingStrategy
+from ...responses import parse_response
+from ...templates import PaymentTemplate
 from ...utils import Payer, Result
 
+COUNTRY_CODE = "229"
 MTN_PAYMENT_PATH = "/QosicBridge/user/requestpayment"
 MTN_PAYMENT_STATUS_PATH = "/QosicBridge/user/gettransactionstatus"
 MTN_PREFIXES = ["51", "52", "53", "61", "62", "66", "67", "69", "90", "91", "96", "97"]
@@ -23,57 +29,232 @@ MTN_REFUND_PATH = "/QosicBridge/user/refund"
 
 @dataclass(frozen=True)
 class MTN:
+    """MTN payments need to be confirmed by the payer, the transaction status is polled until then.
+    The delay between two status checks is given by ``polling``, or is a fixed ``step`` if set,
+    by default the checks are frequent at first and slow down over time. ``clock`` measures the timeout
+    and sleeps between the checks, a ``VirtualClock`` makes the polling instantaneous in tests.
+    """
+
     id: str
-    step: int = 10
+    step: int | None = None
     timeout: int = 60 * 2
     max_tries: int | None = None
     allowed_prefixes: list[str] = field(default_factory=lambda: MTN_PREFIXES)
     reference_factory: callable = generic_reference_factory
+    polling: PollingStrategy | None = None
+    country_code: str = COUNTRY_CODE
+    clock: Clock = field(default=SYSTEM_CLOCK, compare=False, repr=False)
 
     def __post_init__(self):
         validate_reference_factory(self.reference_factory)
-        assert 5 <= self.step <= 30, f"Step {self.step} must be between 5 and 30"
+        if self.step is not None:
+            assert self.polling is None, "step and polling can not be used together"
+            assert 5 <= self.step <= 30, f"Step {self.step} must be between 5 and 30"
         assert (
             60 <= self.timeout <= 180
         ), f"Timeout {self.timeout}  must be between 60 and 180"
+        if self.step is None:
+            if self.polling is None:
+                object.__setattr__(self, "polling", DEFAULT_POLLING)
+            return
         if self.max_tries:
             assert (
                 self.max_tries * self.step <= self.timeout
             ), f"max_tries exceed timeout: {self.max_tries} * {self.step} > {self.timeout}"
+        object.__setattr__(self, "polling", FixedInterval(self.step))
+
+    def pay(
+        self,
+        client: httpx.Client,
+        *,
+        payer: Payer,
+        reference: str | None = None,
+        template: PaymentTemplate | None = None,
+    ) -> Result:
+        return self.submit(
+            client, payer=payer, reference=reference, template=template
+        ).wait()
 
-    def pay(self, client: httpx.Client, *, payer: Payer) -> Result:
-        body = payer.to_qos_compliant_payment_request_body(self)
-        response = client.post(url=MTN_PAYMENT_PATH, json=body)
+    def submit(
+        self,
+        client: httpx.Client,
+        *,
+        payer: Payer,
+        reference: str | None = None,
+        template: PaymentTemplate | None = None,
+    ) -> PendingPayment:
+        """Send the payment request without waiting for the confirmation of the payer.
+        The request is built from ``template`` if given, see ``payment_template``."""
+        reference = reference or self.reference_factory(payer)
+        if template is None:
+            response = client.post(
+                url=MTN_PAYMENT_PATH,
+                json=payer.to_qos_compliant_payment_request_body(self, reference),
+                extensions=request_context(self),
+            )
+        else:
+            response = client.send(template.build_request(payer, reference))
         handle_common_errors(response, provider=self, payer=payer)
-        res_dict = {
-            "reference": body["transref"],
-            "mobile_carrier": self,
-            "status": Result.Status.FAILED,
-            "response": response,
-            "phone": payer.phone,
-        }
         if response.status_code != httpx.codes.ACCEPTED:
-            return Result(**res_dict)
-        with contextlib.suppress(polling2.TimeoutException, MTNPaymentRejected):
-            res_dict["status"] = polling2.poll(
-                target=self._check_status,
-                check_success=polling2.is_value(Result.Status.CONFIRMED),
-                step=self.step,
-                timeout=self.timeout,
-                max_tries=self.max_tries,
-                kwargs={"reference": body["transref"], "client": client},
+            return PendingPayment.resolved(
+                Result(
+                    reference=reference,
+                    mobile_carrier=self,
+                    status=Result.Status.FAILED,
+                    response=response,
+                    phone=payer.phone,
+                )
+            )
+        return PendingPayment(
+            mobile_carrier=self,
+            http_client=client,
+            reference=reference,
+            phone=payer.phone,
+            response=response,
+            clock=self.clock,
+        )
+
+    def payment_template(
+        self, client: httpx.Client | httpx.AsyncClient
+    ) -> PaymentTemplate:
+        """The parts of the payment requests sent with ``client`` that are the same for every payer."""
+        return PaymentTemplate(self, client, MTN_PAYMENT_PATH)
+
+    async def apay(
+        self,
+        client: httpx.AsyncClient,
+        *,
+        payer: Payer,
+        reference: str | None = None,
+        template: PaymentTemplate | None = None,
+        on_submitted: Callable[[], Awaitable[None]] | None = None,
+    ) -> Result:
+        """Send the payment request and wait for the confirmation of the payer, ``on_submitted`` is awaited
+        once the api accepted the payment, before the confirmation."""
+        reference = reference or self.reference_factory(payer)
+        if template is None:
+            response = await client.post(
+                url=MTN_PAYMENT_PATH,
+                json=payer.to_qos_compliant_payment_request_body(self, reference),
+                extensions=request_context(self),
+            )
+        else:
+            response = await client.send(template.build_request(payer, reference))
+        handle_common_errors(response, provider=self, payer=payer)
+        status, attempts = Result.Status.FAILED, 0
+        if response.status_code == httpx.codes.ACCEPTED:
+            if on_submitted is not None:
+                await on_submitted()
+            status, attempts = await self._await_confirmation(
+                client=client, reference=reference
+            )
+        return Result(
+            reference=reference,
+            mobile_carrier=self,
+            status=status,
+            response=response,
+            phone=payer.phone,
+            attempts=attempts,
+        )
+
+    async def _await_confirmation(
+        self, *, client: httpx.AsyncClient, reference: str
+    ) -> tuple[Result.Status, int]:
+        """Asyncio counterpart of ``PendingPayment.wait``, sleeps with ``clock.asleep``
+        so that the event loop stays free while waiting for the confirmation.
+        Return the final status and the number of status checks."""
+        deadline = self.clock.monotonic() + self.timeout
+        attempts = 0
+        while True:
+            attempts += 1
+            error = None
+            try:
+                status = await self.acheck_status(
+                    client, reference=reference, attempt=attempts
+                )
+            except Exception as exc:
+                # tried again until the payment is exhausted, like ``PendingPayment.wait`` does
+                _logger.warning(f"Status check failed for {reference}: {exc}")
+                status, error = Result.Status.PENDING, exc
+            if status != Result.Status.PENDING:
+                return status, attempts
+            if (
+                self.max_tries
+                and attempts >= self.max_tries
+                or self.clock.monotonic() >= deadline
+            ):
+                if error is not None:
+                    raise error
+                return Result.Status.FAILED, attempts
+            delay = self.polling.delay(attempts)
+            await self.clock.asleep(
+                min(delay, max(deadline - self.clock.monotonic(), 0))
+            )
+
+    def check_status(
+        self, client: httpx.Client, *, reference: str, attempt: int | None = None
+    ) -> Result.Status:
+        """Return the current status of a transaction, ``Result.Status.PENDING`` if not yet confirmed.
+        ``ServerError`` or ``InvalidCredentialsError`` are raised when the api can't tell the status.
+        """
+        try:
+            status = self._check_status(
+                client=client, reference=reference, attempt=attempt
             )
-        return Result(**res_dict)
+        except MTNPaymentRejected:
+            return Result.Status.FAILED
+        if status != Result.Status.CONFIRMED:
+            return Result.Status.PENDING
+        return status
 
-    def _check_status(self, *, client: httpx.Client, reference: str) -> Result.Status:
+    async def acheck_status(
+        self, client: httpx.AsyncClient, *, reference: str, attempt: int | None = None
+    ) -> Result.Status:
+        try:
+            status = await self._acheck_status(
+                client=client, reference=reference, attempt=attempt
+            )
+        except MTNPaymentRejected:
+            return Result.Status.FAILED
+        if status != Result.Status.CONFIRMED:
+            return Result.Status.PENDING
+        return status
+
+    def _check_status(
+        self, *, client: httpx.Client, reference: str, attempt: int | None = None
+    ) -> Result.Status:
         response = client.post(
             url=MTN_PAYMENT_STATUS_PATH,
             json={"clientid": self.id, "transref": reference},
+            extensions=request_context(self, attempt=attempt),
         )
-        json_content = get_json_from(response)
-        if not response_is_ok(response) or json_content["responsecode"] is None:
+        return self._parse_status(response)
+
+    async def _acheck_status(
+        self, *, client: httpx.AsyncClient, reference: str, attempt: int | None = None
+    ) -> Result.Status:
+        response = await client.post(
+            url=MTN_PAYMENT_STATUS_PATH,
+            json={"clientid": self.id, "transref": reference},
+            extensions=request_context(self, attempt=attempt),
+        )
+        return self._parse_status(response)
+
+    @staticmethod
+    def _parse_status(response: httpx.Response) -> Result.Status:
+        parsed = parse_response(response)
+        # the status is unknown on server errors and invalid credentials, they are raised
+        handle_common_errors(parsed)
+        if parsed.status_code == httpx.codes.NOT_FOUND or (
+            parsed.ok and parsed.response_code is None
+        ):
+            # unknown transactions, and those rejected by the payer that have no response code
             raise MTNPaymentRejected()
-        if response_is_ok(response) and json_content["responsecode"] == "00":
+        if not parsed.ok:
+            raise ServerError(
+                f"Unexpected {parsed.status_code} response to the status check"
+            )
+        if parsed.response_code == "00":
             return Result.Status.CONFIRMED
         return Result.Status.FAILED
 
@@ -81,11 +262,26 @@ class MTN:
         response = client.post(
             url=MTN_REFUND_PATH,
             json={"clientid": self.id, "transref": reference},
+            extensions=request_context(self),
         )
-        handle_common_errors(response, provider=self)
-        ok = (
-            response_is_ok(response) and get_json_from(response)["responsecode"] == "00"
+        return self._build_refund_result(response, reference=reference, phone=phone)
+
+    async def arefund(
+        self, client: httpx.AsyncClient, *, reference: str, phone: str
+    ) -> Result:
+        response = await client.post(
+            url=MTN_REFUND_PATH,
+            json={"clientid": self.id, "transref": reference},
+            extensions=request_context(self),
         )
+        return self._build_refund_result(response, reference=reference, phone=phone)
+
+    def _build_refund_result(
+        self, response: httpx.Response, *, reference: str, phone: str
+    ) -> Result:
+        parsed = parse_response(response)
+        handle_common_errors(parsed, provider=self)
+        ok = parsed.ok and parsed.response_code == "00"
         status = Result.Status.CONFIRMED if ok else Result.Status.FAILED
         return Result(
             reference=reference,
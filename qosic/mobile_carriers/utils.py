@@ -1,7 +1,5 @@
 from __future__ import annotations
 
-import json
-
 import httpx
 from httpx import codes
 
@@ -11,21 +9,18 @@ from qosic.errors import (
     UserAccountNotFoundError,
     ServerError,
 )
-from qosic.utils import get_random_string
-
+from qosic.references import RandomReference
+from qosic.responses import QosResponse, parse_response
 
-def generic_reference_factory(*args, **kwargs) -> str:
-    return get_random_string()
+generic_reference_factory = RandomReference()
 
 
 def get_json_from(response: httpx.Response) -> dict:
-    try:
-        return response.json()
-    except json.decoder.JSONDecodeError:
-        return {"responsecode": None}
+    content = parse_response(response).content
+    return {"responsecode": None} if content is None else content
 
 
-def handle_common_errors(response: httpx.Response, **kwargs) -> None:
+def handle_common_errors(response: httpx.Response | QosResponse, **kwargs) -> None:
     status: int = response.status_code  # noqa
     if codes.is_server_error(status):
         raise ServerError(
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, TimeoutError
+from typing import TYPE_CHECKING
+
+from .clock import SYSTEM_CLOCK, Clock
+from .logger import logger as _logger
+from .utils import Result
+
+if TYPE_CHECKING:
+    import httpx
+
+    from .protocols import MobileCarrier
+
+
+class PendingPayment(Future):
+    """A handle on a payment accepted by the server but not yet confirmed.
+
+    It is a ``concurrent.futures.Future`` that resolves to a :class:`Result`, so it can be used with
+    ``concurrent.futures.wait`` / ``as_completed`` or have callbacks attached with ``add_done_callback``.
+    Nothing happens in the background, the status is only checked when ``poll_once`` or ``wait`` is called.
+    """
+
+    def __init__(
+        self,
+        *,
+        mobile_carrier: MobileCarrier,
+        http_client: httpx.Client | None,
+        reference: str,
+        phone: str,
+        response: httpx.Response,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        super().__init__()
+        self.mobile_carrier = mobile_carrier
+        self.reference = reference
+        self.phone = phone
+        self.response = response
+        self.attempts = 0
+        self.clock = clock
+        self.submitted_at = clock.monotonic()
+        self._http_client = http_client
+        self._poll_lock = threading.Lock()
+
+    def __repr__(self):
+        state = "done" if self.done() else "pending"
+        return f"<PendingPayment reference={self.reference} state={state}>"
+
+    @classmethod
+    def resolved(cls, result: Result) -> PendingPayment:
+        """Wrap an already known result, used when no confirmation is needed."""
+        pending = cls(
+            mobile_carrier=result.mobile_carrier,
+            http_client=None,
+            reference=result.reference,
+            phone=result.phone,
+            response=result.response,
+        )
+        pending.set_result(result)
+        return pending
+
+    @property
+    def deadline(self) -> float:
+        return self.submitted_at + self.mobile_carrier.timeout
+
+    @property
+    def exhausted(self) -> bool:
+        max_tries = self.mobile_carrier.max_tries
+        if max_tries and self.attempts >= max_tries:
+            return True
+        return self.clock.monotonic() >= self.deadline
+
+    def poll_once(self) -> Result.Status:
+        """Check the transaction status once and resolve the payment if it reached a final state.
+        Return ``Result.Status.PENDING`` while the payment is still waiting for a confirmation.
+        """
+        with self._poll_lock:
+            if self.done():
+                return self.result().status
+            try:
+                status = self.mobile_carrier.check_status(
+                    self._http_client,
+                    reference=self.reference,
+                    attempt=self.attempts + 1,
+                )
+            finally:
+                self.attempts += 1
+            if status == Result.Status.PENDING and self.exhausted:
+                status = Result.Status.FAILED
+            if status != Result.Status.PENDING:
+                self._resolve(status)
+            return status
+
+    def wait(self, timeout: float | None = None) -> Result:
+        """Poll the status following the polling strategy of the mobile carrier until the payment is resolved.
+        A status check that raises, a server error for example, is tried again like a ``StatusPoller`` does,
+        the payment fails with the last error once it is exhausted.
+        If ``timeout`` is given and the payment is still pending when it expires, ``TimeoutError`` is raised,
+        the payment can still be waited on later."""
+        end = None if timeout is None else self.clock.monotonic() + timeout
+        while not self.done():
+            try:
+                status = self.poll_once()
+            except Exception as exc:
+                _logger.warning(f"Status check failed for {self.reference}: {exc}")
+                if self.exhausted:
+                    self._fail(exc)
+                    break
+                status = Result.Status.PENDING
+            if status != Result.Status.PENDING:
+                break
+            delay = self.next_delay()
+            if end is not None:
+                remaining = end - self.clock.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Payment {self.reference} is still pending")
+                delay = min(delay, remaining)
+            self.clock.sleep(delay)
+        return self.result()
+
+    def resolve(self, status: Result.Status) -> None:
+        """Resolve the payment with a status learned elsewhere, a callback from the api for example."""
+        assert (
+            status != Result.Status.PENDING
+        ), "A payment can not be resolved as pending"
+        with self._poll_lock:
+            if not self.done():
+                self._resolve(status)
+
+    def next_delay(self) -> float:
+        """Number of seconds to wait before the next status check."""
+        delay = self.mobile_carrier.polling.delay(self.attempts)
+        return min(delay, max(self.deadline - self.clock.monotonic(), 0))
+
+    def _resolve(self, status: Result.Status) -> None:
+        if self.set_running_or_notify_cancel():
+            self.set_result(
+                Result(
+                    status=status,
+                    reference=self.reference,
+                    phone=self.phone,
+                    mobile_carrier=self.mobile_carrier,
+                    response=self.response,
+                    attempts=self.attempts,
+                )
+            )
+
+    def _fail(self, exc: BaseException) -> None:
+        with self._poll_lock:
+            if not self.done() and self.set_running_or_notify_cancel():
+                self.set_exception(exc)
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .clock import SYSTEM_CLOCK, Clock, SystemClock
+from .logger import logger as _logger
+from .pending import PendingPayment
+from .utils import Result
+
+
+class StatusPoller:
+    """A single background thread that checks the status of every registered ``PendingPayment``.
+
+    Status checks are scheduled on one heap ordered by due time and run on a small thread pool, so
+    that at most ``max_workers`` requests are sent at the same time no matter how many payments are pending.
+    :param max_workers: Maximum number of status requests running at the same time
+    :param logger: Custom logger
+    :param clock: The time the checks are scheduled on, the clock of the carriers. A ``VirtualClock`` is moved
+        forward to the next check instead of being waited on
+    """
+
+    def __init__(
+        self, max_workers: int = 4, logger=_logger, *, clock: Clock = SYSTEM_CLOCK
+    ):
+        self.max_workers = max_workers
+        self.logger = logger
+        self.clock = clock
+        self._heap: list[tuple[float, int, PendingPayment]] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="qosic-poller"
+        )
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="qosic-poller-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def register(self, pending: PendingPayment, delay: float = 0) -> PendingPayment:
+        """Schedule status checks for ``pending`` until it is resolved, the first one after ``delay`` seconds."""
+        if pending.done():
+            return pending
+        if not self._schedule(pending, self.clock.monotonic() + delay):
+            raise RuntimeError("Cannot register a payment on a closed poller")
+        return pending
+
+    def close(self, wait: bool = True) -> None:
+        """Stop the poller, payments that are still pending are left unresolved."""
+        with self._condition:
+            self._closed = True
+            self._heap.clear()
+            self._condition.notify()
+        if wait:
+            self._thread.join()
+        self._executor.shutdown(wait=wait)
+
+    def _schedule(self, pending: PendingPayment, due: float) -> bool:
+        with self._condition:
+            if self._closed:
+                return False
+            heapq.heappush(self._heap, (due, next(self._counter), pending))
+            self._condition.notify()
+            return True
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed and (
+                    not self._heap or self._heap[0][0] > self.clock.monotonic()
+                ):
+                    timeout = (
+                        self._heap[0][0] - self.clock.monotonic()
+                        if self._heap
+                        else None
+                    )
+                    if timeout is not None and not isinstance(self.clock, SystemClock):
+                        self.clock.sleep(timeout)
+                        continue
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+                _, _, pending = heapq.heappop(self._heap)
+            if pending.done():
+                continue
+            self._slots.acquire()
+            try:
+                self._executor.submit(self._poll, pending)
+            except RuntimeError:
+                self._slots.release()
+                return
+
+    def _poll(self, pending: PendingPayment) -> None:
+        try:
+            status = pending.poll_once()
+        except Exception as exc:
+            self.logger.warning(f"Status check failed for {pending.reference}: {exc}")
+            if pending.exhausted:
+                pending._fail(exc)
+                return
+            status = Result.Status.PENDING
+        finally:
+            self._slots.release()
+        if status == Result.Status.PENDING:
+            self._schedule(pending, self.clock.monotonic() + pending.next_delay())
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import random
+from typing import Protocol
+
+from dataclasses import dataclass
+
+
+class PollingStrategy(Protocol):
+    """Decide how long to wait between two transaction status checks."""
+
+    def delay(self, attempt: int) -> float:
+        """Return the number of seconds to wait after the ``attempt``-th status check (starting at 1)."""
+        ...
+
+
+@dataclass(frozen=True)
+class FixedInterval:
+    """Always wait ``step`` seconds, the historical behaviour of ``MTN(step=...)``."""
+
+    step: float = 10
+
+    def __post_init__(self):
+        assert self.step >= 0, f"Step {self.step} must be positive"
+
+    def delay(self, attempt: int) -> float:
+        return self.step
+
+
+@dataclass(frozen=True)
+class ExponentialBackoff:
+    """Start at ``initial`` seconds and multiply the delay by ``factor`` after each check, up to ``maximum``."""
+
+    initial: float = 2
+    factor: float = 1.5
+    maximum: float = 15
+
+    def __post_init__(self):
+        assert self.initial > 0, f"Initial delay {self.initial} must be positive"
+        assert self.factor >= 1, f"Factor {self.factor} must be greater than 1"
+        assert (
+            self.maximum >= self.initial
+        ), f"Maximum {self.maximum} must be greater than initial {self.initial}"
+
+    def delay(self, attempt: int) -> float:
+        return min(self.initial * self.factor ** (attempt - 1), self.maximum)
+
+
+@dataclass(frozen=True)
+class FastStart:
+    """Check every ``fast_step`` seconds for the first ``fast_attempts`` checks then every ``slow_step`` seconds."""
+
+    fast_step: float = 2
+    fast_attempts: int = 3
+    slow_step: float = 15
+
+    def __post_init__(self):
+        assert (
+            0 <= self.fast_step <= self.slow_step
+        ), f"Fast step {self.fast_step} must be between 0 and slow step {self.slow_step}"
+
+    def delay(self, attempt: int) -> float:
+        return self.fast_step if attempt <= self.fast_attempts else self.slow_step
+
+
+@dataclass(frozen=True)
+class Jitter:
+    """Randomize the delays of ``strategy`` by plus or minus ``ratio``, so that payments submitted
+    at the same time do not hit the status endpoint at the same time."""
+
+    strategy: PollingStrategy
+    ratio: float = 0.1
+
+    def __post_init__(self):
+        assert 0 <= self.ratio < 1, f"Ratio {self.ratio} must be between 0 and 1"
+
+    def delay(self, attempt: int) -> float:
+        delay = self.strategy.delay(attempt)
+        return random.uniform(delay * (1 - self.ratio), delay * (1 + self.ratio))
+
+
+# Most payments are confirmed within the first seconds: check after 2, 5 and 9.5 seconds
+# then slow down, over the default 2 minutes timeout it sends about as many requests as a fixed 10 seconds step.
+DEFAULT_POLLING = Jitter(ExponentialBackoff(initial=2, factor=1.5, maximum=15))
@@ -1,17 +1,55 @@
 from __future__ import annotations
 
-from typing import Protocol
+from typing import Awaitable, Callable, Protocol, TYPE_CHECKING
 
+from .pending import PendingPayment
+from .templates import PaymentTemplate
 from .utils import Result, Payer
 
+if TYPE_CHECKING:
+    from httpx import AsyncClient, Client
+
 
 class MobileCarrier(Protocol):
     id: str
     allowed_prefixes: list[str]
+    country_code: str
     reference_factory: callable[[Payer], str]
 
-    def pay(self, http_client: Client, *, payer: Payer) -> Result:
-        ...
+    def pay(
+        self,
+        http_client: Client,
+        *,
+        payer: Payer,
+        reference: str | None = None,
+        template: PaymentTemplate | None = None,
+    ) -> Result: ...
+
+    def refund(self, http_client: Client, *, reference: str, phone: str) -> Result: ...
+
+    def submit(
+        self,
+        http_client: Client,
+        *,
+        payer: Payer,
+        reference: str | None = None,
+        template: PaymentTemplate | None = None,
+    ) -> PendingPayment: ...
+
+    def payment_template(
+        self, http_client: Client | AsyncClient
+    ) -> PaymentTemplate: ...
+
+    async def apay(
+        self,
+        http_client: AsyncClient,
+        *,
+        payer: Payer,
+        reference: str | None = None,
+        template: PaymentTemplate | None = None,
+        on_submitted: Callable[[], Awaitable[None]] | None = None,
+    ) -> Result: ...
 
-    def refund(self, http_client: Client, *, reference: str, phone: str) -> Result:
-        ...
+    async def arefund(
+        self, http_client: AsyncClient, *, reference: str, phone: str
+    ) -> Result: ...
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Iterable
+
+import httpx
+from dataclasses import dataclass
+
+from .instrumentation import CONTEXT_EXTENSION
+
+
+class TokenBucket:
+    """Allow ``rate`` operations per second on average, with bursts of up to ``burst`` operations.
+
+    ``reserve`` takes a token right away, even if the bucket is empty, and returns how long the caller has to
+    wait before using it. Concurrent callers are served in the order they reserved, from any thread or event loop.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        assert rate > 0, "rate should be a positive number"
+        assert burst >= 1, "burst should be at least 1"
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated_at
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+
+class ConcurrencyLimit:
+    """A semaphore usable from threads and from event loops at the same time.
+
+    Released slots are handed to the waiters in the order they arrived, whether they wait in a thread or in a coroutine.
+    """
+
+    def __init__(self, size: int):
+        assert size >= 1, "size should be at least 1"
+        self.size = size
+        self._available = size
+        self._waiters: deque[threading.Event | asyncio.Future] = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._available and not self._waiters:
+                self._available -= 1
+                return
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+        # release hands the slot over directly, there is no need to decrement _available
+        waiter.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._available and not self._waiters:
+                self._available -= 1
+                return
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # the slot was already handed over, _hand_over gives it back if it is not set yet
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self._available += 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            waiter.get_loop().call_soon_threadsafe(self._hand_over, waiter)
+
+    def _hand_over(self, waiter: asyncio.Future) -> None:
+        if waiter.cancelled():
+            self.release()
+        else:
+            waiter.set_result(None)
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """A limit applied to the requests matching ``carrier`` and ``endpoint``, ``None`` matches all of them.
+    :param carrier: Name of the mobile carrier class sending the requests, ``"MTN"`` or ``"MOOV"``
+    :param endpoint: Path of the api endpoint, ``MTN_PAYMENT_STATUS_PATH`` for example
+    :param rate: Maximum number of requests per second
+    :param burst: Number of requests that can be sent at once before ``rate`` applies
+    :param concurrency: Maximum number of requests waiting for a response at the same time
+    """
+
+    carrier: str | None = None
+    endpoint: str | None = None
+    rate: float | None = None
+    burst: int = 1
+    concurrency: int | None = None
+
+    def __post_init__(self):
+        assert (
+            self.rate is not None or self.concurrency is not None
+        ), "set a rate, a concurrency or both"
+
+    def matches(self, carrier: str | None, endpoint: str) -> bool:
+        return (self.carrier is None or self.carrier == carrier) and (
+            self.endpoint is None or self.endpoint == endpoint
+        )
+
+
+@dataclass
+class _Limit:
+    bucket: TokenBucket | None
+    slots: ConcurrencyLimit | None
+
+
+class RateLimiter:
+    """Throttle the requests sent to the QosIc api, to stay under the rate at which it starts failing.
+
+    A request waits for every rule that matches it, so a limit on the whole account and a stricter one on the
+    MTN status checks can be combined. Pass it as the ``rate_limiter`` of a ``Client`` or an ``AsyncClient``,
+    the same instance can be shared by several clients using the same credentials, in any thread.
+
+    .. code-block:: python
+
+        RateLimiter([RateLimit(rate=20, burst=5), RateLimit(carrier="MTN", endpoint=MTN_PAYMENT_STATUS_PATH, rate=5)])
+    """
+
+    def __init__(self, limits: Iterable[RateLimit]):
+        self.limits = list(limits)
+        self._states = [
+            _Limit(
+                bucket=TokenBucket(limit.rate, limit.burst) if limit.rate else None,
+                slots=(
+                    ConcurrencyLimit(limit.concurrency) if limit.concurrency else None
+                ),
+            )
+            for limit in self.limits
+        ]
+        # the rules are matched once per carrier and endpoint, always in the same order to avoid deadlocks
+        self._matches: dict[tuple[str | None, str], list[_Limit]] = {}
+
+    def limits_for(self, request: httpx.Request) -> list[_Limit]:
+        carrier = request.extensions.get(CONTEXT_EXTENSION, {}).get("carrier")
+        key = (carrier, request.url.path)
+        matches = self._matches.get(key)
+        if matches is None:
+            matches = self._matches[key] = [
+                state
+                for limit, state in zip(self.limits, self._states)
+                if limit.matches(*key)
+            ]
+        return matches
+
+    def acquire(self, limits: list[_Limit]) -> None:
+        delay = 0
+        for limit in limits:
+            if limit.slots is not None:
+                limit.slots.acquire()
+            if limit.bucket is not None:
+                delay = max(delay, limit.bucket.reserve())
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, limits: list[_Limit]) -> None:
+        delay = 0
+        acquired = []
+        try:
+            for limit in limits:
+                if limit.slots is not None:
+                    await limit.slots.aacquire()
+                    acquired.append(limit)
+                if limit.bucket is not None:
+                    delay = max(delay, limit.bucket.reserve())
+            if delay:
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.release(acquired)
+            raise
+
+    @staticmethod
+    def release(limits: list[_Limit]) -> None:
+        for limit in limits:
+            if limit.slots is not None:
+                limit.slots.release()
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """Wait for the ``limiter`` before sending each request with ``transport``."""
+
+    def __init__(self, transport: httpx.BaseTransport, limiter: RateLimiter):
+        self.transport = transport
+        self.limiter = limiter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        limits = self.limiter.limits_for(request)
+        self.limiter.acquire(limits)
+        try:
+            return self.transport.handle_request(request)
+        finally:
+            self.limiter.release(limits)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of :class:`RateLimitedTransport`."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: RateLimiter):
+        self.transport = transport
+        self.limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limits = self.limiter.limits_for(request)
+        await self.limiter.aacquire(limits)
+        try:
+            return await self.transport.handle_async_request(request)
+        finally:
+            self.limiter.release(limits)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
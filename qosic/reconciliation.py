@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import csv
+import itertools
+import json
+import os
+from typing import IO, Iterator
+
+from dataclasses import dataclass
+
+from .utils import Result
+
+
+@dataclass(frozen=True, slots=True)
+class StatusItem:
+    """The status of one transaction checked by ``check_status_many``, ``error`` is set if the check raised."""
+
+    reference: str
+    status: Result.Status | None = None
+    error: Exception | None = None
+    cached: bool = False
+
+
+def read_references(
+    source: str | os.PathLike | IO[str], *, column: str = "transref"
+) -> Iterator[str]:
+    """Read the transaction references of a CSV or JSON lines file, one row at a time.
+
+    JSON lines are objects with the reference under ``column``. CSV files are read from the ``column`` column
+    if the header has one, from the first column otherwise.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="") as file:
+            yield from read_references(file, column=column)
+        return
+    lines = (line for line in source if line.strip())
+    first_line = next(lines, None)
+    if first_line is None:
+        return
+    lines = itertools.chain([first_line], lines)
+    if first_line.lstrip().startswith("{"):
+        for line in lines:
+            yield str(json.loads(line)[column])
+        return
+    rows = csv.reader(lines)
+    header = next(rows)
+    if column in header:
+        position = header.index(column)
+    else:
+        # no header, the first line is a reference
+        position = 0
+        rows = itertools.chain([header], rows)
+    for row in rows:
+        yield row[position]
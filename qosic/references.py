@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from string import ascii_lowercase, ascii_uppercase, digits
+from typing import Callable, ClassVar
+
+from dataclasses import dataclass, field
+
+from .errors import ReferenceCollisionError
+
+# in ASCII order, so that the references sort like the numbers they encode
+ALPHABET = digits + ascii_uppercase + ascii_lowercase
+_BASE = len(ALPHABET)
+# random bytes are mapped to ALPHABET[byte % 62], the bytes above the last multiple of 62 are dropped
+# otherwise the first characters of the alphabet would come out more often than the others
+_UNBIASED_LIMIT = 256 - 256 % _BASE
+_TRANSLATION = bytes(ord(ALPHABET[byte % _BASE]) for byte in range(256))
+_DROPPED = bytes(range(_UNBIASED_LIMIT, 256))
+
+MAX_REFERENCE_LENGTH = 16
+
+
+def random_characters(length: int) -> str:
+    """``length`` characters of ``ALPHABET`` from a single ``os.urandom`` draw, most of the time."""
+    characters = b""
+    while len(characters) < length:
+        # about 3% of the bytes are dropped, draw a few more than needed
+        characters += os.urandom(length + 8).translate(_TRANSLATION, _DROPPED)
+    return characters[:length].decode()
+
+
+def encode(number: int, width: int) -> str:
+    """``number`` in base 62, left padded with zeros to ``width`` characters."""
+    characters = []
+    for _ in range(width):
+        number, digit = divmod(number, _BASE)
+        characters.append(ALPHABET[digit])
+    return "".join(reversed(characters))
+
+
+def _validate_prefix(prefix: str, length: int, *, random_part: int) -> None:
+    assert (
+        prefix == "" or prefix.isalnum()
+    ), "The prefix should only contain letters and digits"
+    assert (
+        length <= MAX_REFERENCE_LENGTH
+    ), f"References are limited to {MAX_REFERENCE_LENGTH} characters"
+    assert (
+        length - len(prefix) >= random_part
+    ), "The prefix is too long for the length of the references"
+
+
+@dataclass(frozen=True)
+class RandomReference:
+    """Random references from a cryptographically secure source.
+    :param length: Total length of the references, prefix included
+    :param prefix: Prepended to every reference, to tell apart the references of several processes or nodes
+    """
+
+    length: int = 12
+    prefix: str = ""
+
+    def __post_init__(self):
+        _validate_prefix(self.prefix, self.length, random_part=6)
+
+    def __call__(self, *args, **kwargs) -> str:
+        return self.prefix + random_characters(self.length - len(self.prefix))
+
+
+@dataclass(frozen=True)
+class SortableReference:
+    """References starting with the creation time in milliseconds, followed by random characters.
+
+    They sort in creation order, so they are appended at the end of the database indexes instead of being
+    scattered across them.
+    :param length: Total length of the references, prefix included
+    :param prefix: Prepended to every reference, to tell apart the references of several processes or nodes
+    :param clock: Returns the current time in seconds
+    """
+
+    length: int = 16
+    prefix: str = ""
+    clock: Callable[[], float] = field(default=time.time, compare=False)
+
+    # 8 characters in base 62 are enough for milliseconds timestamps until the year 8800
+    timestamp_width: ClassVar[int] = 8
+
+    def __post_init__(self):
+        _validate_prefix(self.prefix, self.length, random_part=self.timestamp_width + 4)
+
+    def __call__(self, *args, **kwargs) -> str:
+        timestamp = encode(int(self.clock() * 1000), self.timestamp_width)
+        random_part = self.length - len(self.prefix) - self.timestamp_width
+        return self.prefix + timestamp + random_characters(random_part)
+
+
+class UniqueReferences:
+    """Wrap a reference factory to make sure it never returns one of its ``capacity`` most recent references.
+    :param factory: The reference factory to wrap
+    :param capacity: Number of recent references remembered
+    :param max_tries: Number of references generated before giving up with a ``ReferenceCollisionError``
+    """
+
+    def __init__(
+        self,
+        factory: Callable[..., str] = RandomReference(),
+        *,
+        capacity: int = 100_000,
+        max_tries: int = 5,
+    ):
+        assert capacity > 0, "capacity should be a positive number"
+        self.factory = factory
+        self.capacity = capacity
+        self.max_tries = max_tries
+        # dicts keep the insertion order, the first key is the oldest reference
+        self._recent: dict[str, None] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs) -> str:
+        for _ in range(self.max_tries):
+            reference = self.factory(*args, **kwargs)
+            with self._lock:
+                if reference in self._recent:
+                    continue
+                self._recent[reference] = None
+                if len(self._recent) > self.capacity:
+                    del self._recent[next(iter(self._recent))]
+            return reference
+        raise ReferenceCollisionError(
+            f"{self.factory} generated {self.max_tries} references already in use"
+        )
+
+    def __contains__(self, reference: str) -> bool:
+        return reference in self._recent
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+from typing import Generic, Iterator, TypeVar, TYPE_CHECKING
+
+import httpx
+
+from .client import AsyncClient, Client
+from .instrumentation import Instrumentation
+from .poller import StatusPoller
+
+if TYPE_CHECKING:
+    from .protocols import MobileCarrier
+
+_C = TypeVar("_C", Client, AsyncClient)
+
+
+class _Registry(Generic[_C]):
+    def __init__(self, options: dict):
+        self.options = options
+        self._clients: dict[str, _C] = {}
+
+    def __getitem__(self, merchant: str) -> _C:
+        return self._clients[merchant]
+
+    def __contains__(self, merchant: object) -> bool:
+        return merchant in self._clients
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._clients)
+
+    def get(self, merchant: str) -> _C | None:
+        return self._clients.get(merchant)
+
+    def _client_options(self, options: dict) -> dict:
+        options = {**self.options, **options}
+        shared = options.get("instrumentation")
+        if shared is not None:
+            # the client adds its ``metrics`` to the hooks, they must not receive the requests of other merchants
+            options["instrumentation"] = Instrumentation(
+                shared.hooks, logger=shared.logger, log_bodies=shared.log_bodies
+            )
+        return options
+
+    def _add(self, merchant: str, client: _C) -> _C:
+        assert (
+            merchant not in self._clients
+        ), f"The merchant {merchant} is already registered"
+        self._clients[merchant] = client
+        return client
+
+
+class ClientRegistry(_Registry[Client]):
+    """The clients of many merchant accounts, looked up by merchant key.
+
+    Every client sends its requests over the same connection pool and registers its pending payments on the
+    same ``StatusPoller``, clients with carriers of the same types and prefixes also share the same routing
+    index. Adding a merchant only costs its credentials and a lightweight ``httpx.Client``: the number of
+    sockets and threads does not grow with the number of merchants.
+    :param transport: The shared connection pool, one is created from ``limits``, ``http2`` and ``verify`` if not set
+    :param poller: The shared status poller, one is created if not set
+    :param limits: Connection pool size and keep-alive expiry of the created transport
+    :param http2: Enable HTTP/2 on the created transport
+    :param verify: Verify the server TLS certificate on the created transport
+    :param options: The other ``Client`` options shared by every merchant, ``metrics`` or ``retry`` for example.
+        Each client gets its own ``Instrumentation``, with the hooks of ``instrumentation`` if it is set, so that
+        the ``metrics`` passed to ``register`` only count the requests of that merchant
+
+    .. code-block:: python
+
+        registry = ClientRegistry(limits=httpx.Limits(max_connections=50))
+        registry.register("shop-1", login="...", password="...", mobile_carriers=[bj.MTN(id="...")])
+        result = registry["shop-1"].pay(phone="22991617451", amount=2000)
+    """
+
+    def __init__(
+        self,
+        *,
+        transport: httpx.BaseTransport | None = None,
+        poller: StatusPoller | None = None,
+        limits: httpx.Limits | None = None,
+        http2: bool = False,
+        verify: bool = False,
+        **options,
+    ):
+        # closed with the registry only if it created them
+        self._owns_transport = transport is None
+        self._owns_poller = poller is None
+        if transport is None:
+            transport = httpx.HTTPTransport(
+                verify=verify, http2=http2, **_limits_option(limits)
+            )
+        super().__init__(options)
+        self.transport = transport
+        self.poller = poller or StatusPoller()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def register(
+        self,
+        merchant: str,
+        *,
+        login: str,
+        password: str,
+        mobile_carriers: list[MobileCarrier],
+        **options,
+    ) -> Client:
+        """Create the client of ``merchant``, ``options`` override the options of the registry for this merchant."""
+        return self._add(
+            merchant,
+            Client(
+                login=login,
+                password=password,
+                mobile_carriers=mobile_carriers,
+                **self._client_options(
+                    {"transport": self.transport, "poller": self.poller, **options}
+                ),
+            ),
+        )
+
+    def remove(self, merchant: str) -> None:
+        self._clients.pop(merchant).close()
+
+    def close(self) -> None:
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
+        if self._owns_poller:
+            self.poller.close()
+        if self._owns_transport:
+            self.transport.close()
+
+
+class AsyncClientRegistry(_Registry[AsyncClient]):
+    """Async counterpart of :class:`ClientRegistry`, there is no poller since ``AsyncClient.pay`` waits for
+    the confirmation of each payment itself."""
+
+    def __init__(
+        self,
+        *,
+        transport: httpx.AsyncBaseTransport | None = None,
+        limits: httpx.Limits | None = None,
+        http2: bool = False,
+        verify: bool = False,
+        **options,
+    ):
+        self._owns_transport = transport is None
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(
+                verify=verify, http2=http2, **_limits_option(limits)
+            )
+        super().__init__(options)
+        self.transport = transport
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    def register(
+        self,
+        merchant: str,
+        *,
+        login: str,
+        password: str,
+        mobile_carriers: list[MobileCarrier],
+        **options,
+    ) -> AsyncClient:
+        """Create the client of ``merchant``, ``options`` override the options of the registry for this merchant."""
+        return self._add(
+            merchant,
+            AsyncClient(
+                login=login,
+                password=password,
+                mobile_carriers=mobile_carriers,
+                **self._client_options({"transport": self.transport, **options}),
+            ),
+        )
+
+    async def remove(self, merchant: str) -> None:
+        await self._clients.pop(merchant).aclose()
+
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        if self._owns_transport:
+            await self.transport.aclose()
+
+
+def _limits_option(limits: httpx.Limits | None) -> dict:
+    return {} if limits is None else {"limits": limits}
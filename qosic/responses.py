@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import functools
+from typing import Callable, TYPE_CHECKING
+
+from dataclasses import dataclass
+
+if TYPE_CHECKING:
+    import httpx
+
+_PARSED_EXTENSION = "qosic.parsed"
+
+
+@dataclass(frozen=True, slots=True)
+class QosResponse:
+    """What the carriers need from a response of the QosIc api, decoded once by :func:`parse_response`.
+    :param status_code: The HTTP status code
+    :param response_code: The ``responsecode`` of the json body, ``None`` if the body has none
+    :param content: The json body if it is an object, ``None`` otherwise
+    """
+
+    status_code: int
+    response_code: str | None = None
+    content: dict | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code == 200
+
+
+def parse_response(response: httpx.Response) -> QosResponse:
+    """Decode the body of ``response`` and keep the result on it, the next calls return the same record.
+    The body is decoded with ``orjson`` if it is installed."""
+    parsed = response.extensions.get(_PARSED_EXTENSION)
+    if parsed is not None:
+        return parsed
+    content = None
+    if response.content:
+        try:
+            content = _json_loads()(response.content)
+        except ValueError:
+            pass
+    if isinstance(content, dict):
+        parsed = QosResponse(response.status_code, content.get("responsecode"), content)
+    else:
+        parsed = QosResponse(response.status_code)
+    response.extensions[_PARSED_EXTENSION] = parsed
+    return parsed
+
+
+@functools.cache
+def _json_loads() -> Callable[[bytes], object]:
+    # imported on the first response rather than with the package, to keep ``import qosic`` cheap
+    try:
+        # optional, installed with the ``fast`` extra
+        from orjson import loads
+    except ImportError:  # pragma: no cover
+        from json import loads
+    return loads
@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from enum import Enum
+
+import httpx
+from dataclasses import dataclass, field
+
+from .errors import CircuitOpenError
+from .instrumentation import CONTEXT_EXTENSION
+from .metrics import MetricsCollector
+from .mobile_carriers.bj.moov import MOOV_PAYMENT_PATH
+from .mobile_carriers.bj.mtn import MTN_PAYMENT_PATH
+from .polling import ExponentialBackoff, Jitter, PollingStrategy
+
+PAYMENT_PATHS = (MTN_PAYMENT_PATH, MOOV_PAYMENT_PATH)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# the request was not sent, it can be retried even if it is not idempotent
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """When and how to send again a request that failed with a server error or a network error.
+
+    Status checks and refunds are always retried. Payments are only retried if they could not be sent
+    or if ``retry_payments`` is set: the payment request is then sent again with the same ``transref``.
+    :param max_attempts: Maximum number of times a request is sent, including the first one
+    :param backoff: Delay before each retry, any polling strategy can be used
+    :param retry_payments: Also retry the payment requests that may have reached the server
+    :param budget_ratio: Retries allowed per request sent, to avoid multiplying the load on a failing api
+    :param budget_minimum: Retries allowed even when few requests are sent
+    :param failure_threshold: Consecutive failures of a carrier that open its circuit breaker
+    :param recovery_time: Seconds the circuit stays open before a request is allowed to probe the api again
+    """
+
+    max_attempts: int = 3
+    backoff: PollingStrategy = Jitter(
+        ExponentialBackoff(initial=0.5, factor=2, maximum=5)
+    )
+    retry_payments: bool = False
+    budget_ratio: float = 0.2
+    budget_minimum: int = 10
+    failure_threshold: int = 5
+    recovery_time: float = 30
+
+    def __post_init__(self):
+        assert self.max_attempts >= 1, "max_attempts should be at least 1"
+        assert 0 <= self.budget_ratio <= 1, "budget_ratio should be between 0 and 1"
+        assert self.failure_threshold >= 1, "failure_threshold should be at least 1"
+
+    def is_idempotent(self, request: httpx.Request) -> bool:
+        return self.retry_payments or request.url.path not in PAYMENT_PATHS
+
+    def should_retry_response(
+        self, request: httpx.Request, response: httpx.Response
+    ) -> bool:
+        return response.status_code in RETRY_STATUS_CODES and self.is_idempotent(
+            request
+        )
+
+    def should_retry_error(self, request: httpx.Request, exc: Exception) -> bool:
+        if isinstance(exc, _NOT_SENT_ERRORS):
+            return True
+        return isinstance(exc, httpx.TransportError) and self.is_idempotent(request)
+
+
+class RetryBudget:
+    """Every request sent adds ``ratio`` retry to the budget, up to ``minimum``, every retry takes one."""
+
+    def __init__(self, ratio: float, minimum: int):
+        self.ratio = ratio
+        self.minimum = minimum
+        self._balance = float(minimum)
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._balance = min(self.minimum, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class CircuitBreaker:
+    """Stop sending requests for ``recovery_time`` seconds after ``failure_threshold`` consecutive failures.
+
+    Once the delay has passed, a single request is let through: the circuit is closed again if it succeeds
+    and opened for another ``recovery_time`` seconds if it fails.
+    """
+
+    class State(int, Enum):
+        CLOSED = 0
+        HALF_OPEN = 1
+        OPEN = 2
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int,
+        recovery_time: float,
+        metrics: MetricsCollector | None = None,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.metrics = metrics
+        self.state = CircuitBreaker.State.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        with self._lock:
+            if self.state == CircuitBreaker.State.CLOSED:
+                return
+            if time.monotonic() - self._opened_at >= self.recovery_time:
+                # let one request probe the api, the next one is let through only if it never completes
+                self._opened_at = time.monotonic()
+                self._set_state(CircuitBreaker.State.HALF_OPEN)
+                return
+            raise CircuitOpenError(
+                f"The QosIc api is failing for {self.name}, requests are suspended"
+            )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            if self.state != CircuitBreaker.State.CLOSED:
+                self._set_state(CircuitBreaker.State.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if (
+                self.state == CircuitBreaker.State.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                self._set_state(CircuitBreaker.State.OPEN)
+
+    def _set_state(self, state: CircuitBreaker.State) -> None:
+        self.state = state
+        if self.metrics is not None:
+            self.metrics.set_gauge(
+                "circuit_breaker_state", state.value, carrier=self.name
+            )
+            if state == CircuitBreaker.State.OPEN:
+                self.metrics.increment(
+                    "circuit_breaker_opened_total", carrier=self.name
+                )
+
+
+@dataclass
+class Retrier:
+    """The retry state shared by the requests of a client: the budget and a circuit breaker per carrier."""
+
+    policy: RetryPolicy
+    metrics: MetricsCollector | None = None
+    budget: RetryBudget = field(init=False)
+    breakers: dict[str, CircuitBreaker] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        self.budget = RetryBudget(self.policy.budget_ratio, self.policy.budget_minimum)
+        self._lock = threading.Lock()
+
+    def breaker_for(self, request: httpx.Request) -> CircuitBreaker:
+        carrier = request.extensions.get(CONTEXT_EXTENSION, {}).get("carrier") or ""
+        breaker = self.breakers.get(carrier)
+        if breaker is None:
+            with self._lock:
+                breaker = self.breakers.setdefault(
+                    carrier,
+                    CircuitBreaker(
+                        carrier,
+                        failure_threshold=self.policy.failure_threshold,
+                        recovery_time=self.policy.recovery_time,
+                        metrics=self.metrics,
+                    ),
+                )
+        return breaker
+
+    def can_retry(self, request: httpx.Request, attempt: int) -> bool:
+        if attempt >= self.policy.max_attempts or not self.budget.withdraw():
+            return False
+        if self.metrics is not None:
+            context = request.extensions.get(CONTEXT_EXTENSION, {})
+            self.metrics.increment(
+                "retries_total",
+                endpoint=request.url.path,
+                carrier=context.get("carrier") or "",
+            )
+        return True
+
+
+class RetryTransport(httpx.BaseTransport):
+    """Send the requests with ``transport``, retrying them as allowed by the ``retrier``."""
+
+    def __init__(self, transport: httpx.BaseTransport, retrier: Retrier):
+        self.transport = transport
+        self.retrier = retrier
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        policy = self.retrier.policy
+        breaker = self.retrier.breaker_for(request)
+        self.retrier.budget.deposit()
+        attempt = 1
+        while True:
+            breaker.before_request()
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError as exc:
+                breaker.record_failure()
+                if not policy.should_retry_error(
+                    request, exc
+                ) or not self.retrier.can_retry(request, attempt):
+                    raise
+            else:
+                if response.status_code < 500:
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+                if not policy.should_retry_response(
+                    request, response
+                ) or not self.retrier.can_retry(request, attempt):
+                    return response
+                response.close()
+            time.sleep(policy.backoff.delay(attempt))
+            attempt += 1
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of :class:`RetryTransport`."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, retrier: Retrier):
+        self.transport = transport
+        self.retrier = retrier
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        policy = self.retrier.policy
+        breaker = self.retrier.breaker_for(request)
+        self.retrier.budget.deposit()
+        attempt = 1
+        while True:
+            breaker.before_request()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as exc:
+                breaker.record_failure()
+                if not policy.should_retry_error(
+                    request, exc
+                ) or not self.retrier.can_retry(request, attempt):
+                    raise
+            else:
+                if response.status_code < 500:
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+                if not policy.should_retry_response(
+                    request, response
+                ) or not self.retrier.can_retry(request, attempt):
+                    return response
+                await response.aclose()
+            await asyncio.sleep(policy.backoff.delay(attempt))
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import functools
+from typing import Iterable, Sequence, TYPE_CHECKING
+
+from .errors import MobileCarrierConflictError, MobileCarrierNotFoundError
+
+if TYPE_CHECKING:
+    from .protocols import MobileCarrier
+
+
+class RoutingTable:
+    """An index of the phone number prefixes of a list of mobile carriers, built once.
+
+    Each carrier is registered under its ``country_code`` followed by each of its ``allowed_prefixes``,
+    both can have any length. Looking a phone number up costs one dict access per distinct prefix length.
+    A prefix claimed by two carriers, or a prefix that starts with the prefix of another carrier,
+    raises ``MobileCarrierConflictError`` when the table is built.
+    """
+
+    def __init__(self, mobile_carriers: list[MobileCarrier]):
+        self.mobile_carriers = list(mobile_carriers)
+        # clients with carriers of the same types and prefixes, the merchants of a ClientRegistry for example,
+        # share the same index
+        self._index, self._lengths = _build_index(
+            tuple(
+                (
+                    type(carrier).__name__,
+                    carrier.country_code,
+                    tuple(carrier.allowed_prefixes),
+                )
+                for carrier in self.mobile_carriers
+            )
+        )
+
+    def __len__(self):
+        return len(self._index)
+
+    def index_of(self, phone: str) -> int:
+        """Return the position in ``mobile_carriers`` of the carrier of ``phone``."""
+        for length in self._lengths:
+            position = self._index.get(phone[:length])
+            if position is not None:
+                return position
+        raise MobileCarrierNotFoundError(
+            f"A mobile carrier was not found for the given phone number: {phone}"
+        )
+
+    def carrier_for(self, phone: str) -> MobileCarrier:
+        return self.mobile_carriers[self.index_of(phone)]
+
+    def indexes_of(self, phones: Sequence[str]) -> list[int | None]:
+        """Columnar ``index_of``: the carrier position of every phone, ``None`` for those without a carrier.
+        The phones are looked up one prefix length at a time, in a single pass when all prefixes have the same length.
+        """
+        positions: list[int | None] = [None] * len(phones)
+        remaining: Iterable[int] = range(len(phones))
+        for length in self._lengths:
+            missing = []
+            for row in remaining:
+                position = self._index.get(phones[row][:length])
+                if position is None:
+                    missing.append(row)
+                else:
+                    positions[row] = position
+            remaining = missing
+        return positions
+
+
+@functools.lru_cache(maxsize=128)
+def _build_index(
+    carriers: tuple[tuple[str, str, tuple[str, ...]], ...],
+) -> tuple[dict[str, int], list[int]]:
+    """Index the prefixes of ``carriers``, given as (name, country code, allowed prefixes)."""
+    index: dict[str, int] = {}
+    for position, (_, country_code, prefixes) in enumerate(carriers):
+        for prefix in prefixes:
+            key = country_code + prefix
+            existing = index.setdefault(key, position)
+            if existing != position:
+                raise MobileCarrierConflictError(
+                    f"The prefix {key} is used by both {carriers[existing][0]} and {carriers[position][0]}"
+                )
+    lengths = sorted({len(key) for key in index}, reverse=True)
+    for key, position in index.items():
+        for length in lengths:
+            if length >= len(key):
+                continue
+            other = index.get(key[:length])
+            if other is not None and other != position:
+                raise MobileCarrierConflictError(
+                    f"The prefix {key} of {carriers[position][0]} overlaps "
+                    f"the prefix {key[:length]} of {carriers[other][0]}"
+                )
+    return index, lengths
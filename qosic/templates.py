@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING
+
+import httpx
+
+from .instrumentation import request_context
+
+if TYPE_CHECKING:
+    from .protocols import MobileCarrier
+    from .utils import Payer
+
+
+class PaymentTemplate:
+    """The parts of the payment requests of a carrier that are the same for every payer, computed once.
+
+    The url, the headers, the timeout and the other extensions come from ``http_client.build_request``,
+    the body is written straight to bytes around the fields of each payer. The body is the compact json
+    encoding of ``Payer.to_qos_compliant_payment_request_body``, with the same fields in the same order.
+    :param mobile_carrier: The carrier sending the payments
+    :param http_client: The httpx client the requests are sent with
+    :param path: The path of the payment endpoint of the carrier
+    """
+
+    def __init__(
+        self,
+        mobile_carrier: MobileCarrier,
+        http_client: httpx.Client | httpx.AsyncClient,
+        path: str,
+    ):
+        request = http_client.build_request(
+            "POST", path, extensions=request_context(mobile_carrier)
+        )
+        self.url = request.url
+        self.headers = request.headers
+        # set again from the content of each request
+        del self.headers["content-length"]
+        self.extensions = request.extensions
+        self._format = (
+            '{"clientid":' + _json_string(mobile_carrier.id) + ',"msisdn":"%s",'
+            '"amount":"%s","transref":%s,"firstname":%s,"lastname":%s}'
+        )
+
+    def encode(self, payer: Payer, reference: str) -> bytes:
+        return (
+            self._format
+            % (
+                payer.phone,
+                payer.amount,
+                _json_string(reference),
+                _json_string(payer.first_name),
+                _json_string(payer.last_name),
+            )
+        ).encode()
+
+    def build_request(self, payer: Payer, reference: str) -> httpx.Request:
+        """The payment request of ``payer``, send it with ``http_client.send``."""
+        return httpx.Request(
+            "POST",
+            self.url,
+            headers=self.headers,
+            content=self.encode(payer, reference),
+            # the instrumentation and the transports write to the extensions of each request
+            extensions=self.extensions.copy(),
+        )
+
+
+def _json_string(value: str) -> str:
+    # references and names rarely need escaping
+    if value.isalnum() and value.isascii():
+        return f'"{value}"'
+    return json.dumps(value)
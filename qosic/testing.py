@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import json
+import random
+import threading
+from collections import Counter
+from typing import Iterable, TYPE_CHECKING
+
+import httpx
+from dataclasses import dataclass, field, fields
+
+from .clock import SYSTEM_CLOCK, Clock, VirtualClock
+from .instrumentation import RequestEvent
+from .mobile_carriers.bj.moov import MOOV_PAYMENT_PATH
+from .mobile_carriers.bj.mtn import (
+    MTN_PAYMENT_PATH,
+    MTN_PAYMENT_STATUS_PATH,
+    MTN_REFUND_PATH,
+)
+from .pending import PendingPayment
+from .utils import Payer, Result
+
+if TYPE_CHECKING:
+    from .client import Client
+
+
+@dataclass
+class FakeTransaction:
+    created_at: float
+    confirmed: bool
+    notified: bool = False
+
+
+@dataclass
+class FakeQosServer:
+    """An in-process stand-in for the QosIc api, to use as the ``transport`` of a client in tests and benchmarks.
+
+    It answers the ``requestpayment``, ``gettransactionstatus``, ``refund`` and ``requestpaymentmv`` endpoints,
+    works with both ``Client`` and ``AsyncClient`` and never touches the network.
+    :param latency: Seconds to wait before answering each request
+    :param confirmation_delay: Seconds between an MTN payment request and its confirmation (or rejection)
+    :param error_rate: Probability that a request fails with a 500 error
+    :param rejection_rate: Probability that a payment is rejected by the payer
+    :param seed: Seed of the random generator, for reproducible runs
+    :param clock: Measures the confirmation delay and waits for the latency, a ``VirtualClock`` in load tests
+    """
+
+    latency: float = 0
+    confirmation_delay: float = 0
+    error_rate: float = 0
+    rejection_rate: float = 0
+    seed: int | None = None
+    clock: Clock = SYSTEM_CLOCK
+    requests: Counter = field(default_factory=Counter, init=False)
+    transactions: dict[str, FakeTransaction] = field(default_factory=dict, init=False)
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self._routes = {
+            MTN_PAYMENT_PATH: self._request_payment,
+            MTN_PAYMENT_STATUS_PATH: self._transaction_status,
+            MTN_REFUND_PATH: self._refund,
+            MOOV_PAYMENT_PATH: self._request_payment_moov,
+        }
+
+    def __getstate__(self) -> dict:
+        # a server sent to another process starts over with the same settings
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.init}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(**state)
+
+    @property
+    def transport(self) -> FakeQosTransport:
+        return FakeQosTransport(self)
+
+    def pop_notifications(self) -> list[dict]:
+        """The callback payloads of the MTN transactions settled since the last call,
+        post them to a ``CallbackReceiver`` to simulate the api push notifications."""
+        notifications = []
+        now = self.clock.monotonic()
+        with self._lock:
+            for reference, transaction in self.transactions.items():
+                if transaction.notified:
+                    continue
+                if now - transaction.created_at < self.confirmation_delay:
+                    continue
+                transaction.notified = True
+                notifications.append(
+                    {
+                        "transref": reference,
+                        "responsecode": "00" if transaction.confirmed else "-1",
+                    }
+                )
+        return notifications
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        with self._lock:
+            self.requests[path] += 1
+            failed = self._random.random() < self.error_rate
+        route = self._routes.get(path)
+        if route is None:
+            return httpx.Response(httpx.codes.NOT_FOUND, request=request)
+        if failed:
+            return httpx.Response(httpx.codes.INTERNAL_SERVER_ERROR, request=request)
+        status_code, content = route(json.loads(request.content or b"{}"))
+        if content is None:
+            return httpx.Response(status_code, request=request)
+        # streamed like a real response, so that the client reads it and sets ``elapsed``
+        return httpx.Response(
+            status_code,
+            headers={"content-type": "application/json"},
+            stream=httpx.ByteStream(json.dumps(content).encode()),
+            request=request,
+        )
+
+    def _request_payment(self, body: dict) -> tuple[int, dict | None]:
+        with self._lock:
+            confirmed = self._random.random() >= self.rejection_rate
+            self.transactions[body["transref"]] = FakeTransaction(
+                created_at=self.clock.monotonic(), confirmed=confirmed
+            )
+        return httpx.codes.ACCEPTED, None
+
+    def _transaction_status(self, body: dict) -> tuple[int, dict | None]:
+        transaction = self.transactions.get(body["transref"])
+        if transaction is None:
+            return httpx.codes.NOT_FOUND, None
+        if self.clock.monotonic() - transaction.created_at < self.confirmation_delay:
+            return httpx.codes.OK, {"responsecode": "01", "responsemsg": "PENDING"}
+        if not transaction.confirmed:
+            # the api answers rejected transactions without any response code
+            return httpx.codes.OK, None
+        return httpx.codes.OK, {"responsecode": "00", "responsemsg": "SUCCESSFUL"}
+
+    def _refund(self, body: dict) -> tuple[int, dict | None]:
+        if body["transref"] not in self.transactions:
+            return httpx.codes.OK, {"responsecode": "-1"}
+        return httpx.codes.OK, {"responsecode": "00"}
+
+    def _request_payment_moov(self, body: dict) -> tuple[int, dict | None]:
+        confirmed = self._random.random() >= self.rejection_rate
+        return httpx.codes.OK, {"responsecode": "0" if confirmed else "-1"}
+
+
+class FakeQosTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Sync and async httpx transport answering with a :class:`FakeQosServer`."""
+
+    def __init__(self, server: FakeQosServer):
+        self.server = server
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.server.latency:
+            self.server.clock.sleep(self.server.latency)
+        request.read()
+        return self.server.handle(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.server.latency:
+            await self.server.clock.asleep(self.server.latency)
+        await request.aread()
+        return self.server.handle(request)
+
+
+@dataclass(frozen=True)
+class LoadReport:
+    """The outcome of :func:`run_load`, the durations are in seconds of the virtual clock.
+    :param payments: Number of payments submitted
+    :param confirmed: Payments confirmed
+    :param failed: Payments rejected or timed out
+    :param errors: Payments that raised an exception
+    :param duration: Time between the first submission and the last resolution
+    :param throughput: Payments resolved per second
+    :param p50: Median time between the submission and the resolution of a payment
+    :param p99: 99th percentile of the time between the submission and the resolution of a payment
+    :param requests: Number of requests sent per api endpoint
+    """
+
+    payments: int
+    confirmed: int
+    failed: int
+    errors: int
+    duration: float
+    throughput: float
+    p50: float
+    p99: float
+    requests: dict[str, int]
+
+
+def run_load(
+    client: Client,
+    payers: Iterable[Payer],
+    *,
+    clock: VirtualClock,
+    rate: float | None = None,
+) -> LoadReport:
+    """Pay every payer of ``payers`` with ``client`` on virtual time and report the throughput and latencies.
+
+    Payments arrive at ``rate`` per second, all at once if it is not set. Each pending payment is checked again
+    after the delay of the polling strategy of its carrier, the clock jumping from one request to the next, so
+    hours of traffic run in seconds and two runs with the same seeds give the same report. ``clock`` must also
+    be the clock of the carriers and of the ``FakeQosServer`` behind the client, which should have no poller.
+    """
+    assert client.poller is None, "the payments are polled by run_load"
+    requests = Counter()
+
+    def count(event: RequestEvent) -> None:
+        requests[event.endpoint] += 1
+
+    client.instrumentation.add_hook(count)
+    start = clock.monotonic()
+    sequence = itertools.count()
+    arrivals = enumerate(payers)
+    # (due time, sequence, payer or pending payment, submission time)
+    events: list[tuple[float, int, Payer | PendingPayment, float]] = []
+    latencies, statuses, errors = [], Counter(), 0
+
+    def schedule_arrival() -> None:
+        for position, payer in itertools.islice(arrivals, 1):
+            due = start + (position / rate if rate else 0)
+            heapq.heappush(events, (due, next(sequence), payer, due))
+
+    schedule_arrival()
+    try:
+        while events:
+            due, _, item, submitted_at = heapq.heappop(events)
+            clock.advance_to(due)
+            try:
+                if isinstance(item, Payer):
+                    schedule_arrival()
+                    item = client.submit_payment(
+                        phone=item.phone,
+                        amount=item.amount,
+                        first_name=item.first_name,
+                        last_name=item.last_name,
+                    )
+                    # checked right away, like a StatusPoller does
+                    delay = 0
+                else:
+                    item.poll_once()
+                    delay = item.next_delay()
+            except Exception:
+                errors += 1
+                continue
+            if item.done():
+                latencies.append(clock.monotonic() - submitted_at)
+                statuses[item.result().status] += 1
+            else:
+                heapq.heappush(
+                    events,
+                    (
+                        clock.monotonic() + delay,
+                        next(sequence),
+                        item,
+                        submitted_at,
+                    ),
+                )
+    finally:
+        client.instrumentation.hooks.remove(count)
+    latencies.sort()
+    duration = clock.monotonic() - start
+    return LoadReport(
+        payments=len(latencies) + errors,
+        confirmed=statuses[Result.Status.CONFIRMED],
+        failed=statuses[Result.Status.FAILED],
+        errors=errors,
+        duration=duration,
+        throughput=len(latencies) / duration if duration else 0,
+        p50=_percentile(latencies, 0.5),
+        p99=_percentile(latencies, 0.99),
+        requests=dict(requests),
+    )
+
+
+def _percentile(values: list[float], quantile: float) -> float:
+    if not values:
+        return 0
+    return values[min(int(len(values) * quantile), len(values) - 1)]
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import httpx
+
+
+class SharedTransport(httpx.BaseTransport):
+    """Wrap a transport used by several clients so that closing one client does not close
+    the shared connection pool, the owner of the transport is responsible for closing it.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self.transport.handle_request(request)
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncSharedTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of :class:`SharedTransport`."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
@@ -1,70 +1,91 @@
 from __future__ import annotations
 
 import re
-import secrets
 from enum import Enum
-from logging import Logger
-from string import ascii_letters, digits
-from typing import TYPE_CHECKING
+from typing import Iterable, Iterator, TYPE_CHECKING
 
-import httpx
 from dataclasses import dataclass
 
-from .errors import MobileCarrierNotFoundError, InvalidPhoneNumberError
+from .errors import InvalidPhoneNumberError
+from .references import random_characters
+from .responses import parse_response
+from .routing import RoutingTable
 
 if TYPE_CHECKING:
-    from .protocols import MobileCarrier
-
-
-def log_request(request: httpx.Request, /, *, logger: Logger):
-    logger.info(f"REQUEST: {request.method} {request.url} - Waiting for response")
-    logger.info(request.read())
+    import httpx
 
-
-def log_response(response: httpx.Response, /, *, logger: Logger):
-    request = response.request
-    logger.info(
-        f"RESPONSE: {request.method} {request.url} - Status {response.status_code}"
-    )
-    logger.info(f"{response.read()}")
+    from .protocols import MobileCarrier
 
 
 def get_random_string(length: int = 12) -> str:
-    return "".join(secrets.choice(ascii_letters + digits) for _ in range(length))
+    return random_characters(length)
 
 
 def guess_mobile_carrier_from(
     *, phone: str, mobile_carriers: list[MobileCarrier]
 ) -> MobileCarrier:
-    prefix = phone[3:5]
-    for carrier in mobile_carriers:
-        if prefix in carrier.allowed_prefixes:
-            return carrier
-    raise MobileCarrierNotFoundError(
-        f"A mobile carrier was not found for the given phone number: {phone}"
-    )
+    """Build a ``RoutingTable`` on the fly, the clients build theirs once and reuse it."""
+    return RoutingTable(mobile_carriers).carrier_for(phone)
 
 
-@dataclass(frozen=True)
+PHONE_NUMBER_PATTERN = re.compile(r"\d{11}")
+
+
+@dataclass(frozen=True, slots=True)
 class Result:
-    """A helper class to summarize the responses from the server."""
+    """A helper class to summarize the responses from the server.
+
+    A compact result, see ``compact()``, drops the raw ``response`` and only keeps its ``status_code``,
+    the ``response_code`` of its json content and its ``latency`` in seconds.
+    """
 
     class Status(str, Enum):
         CONFIRMED = "CONFIRMED"
         FAILED = "FAILED"
+        PENDING = "PENDING"
 
     status: Status
     reference: str
     phone: str
     mobile_carrier: MobileCarrier
-    response: httpx.Response
+    response: httpx.Response | None
+    attempts: int = 0
+    status_code: int | None = None
+    response_code: str | None = None
+    latency: float | None = None
 
     @property
     def success(self) -> bool:
         return self.status == self.Status.CONFIRMED
 
-
-@dataclass(frozen=True)
+    def compact(self) -> Result:
+        """A copy of the result without the response, its buffers and headers can then be freed."""
+        response = self.response
+        if response is None:
+            return self
+        try:
+            latency = response.elapsed.total_seconds()
+        except RuntimeError:
+            # the response was not read through a client
+            latency = None
+        return Result(
+            status=self.status,
+            reference=self.reference,
+            phone=self.phone,
+            mobile_carrier=self.mobile_carrier,
+            response=None,
+            attempts=self.attempts,
+            status_code=response.status_code,
+            response_code=_response_code(response),
+            latency=latency,
+        )
+
+
+def _response_code(response: httpx.Response) -> str | None:
+    return parse_response(response).response_code
+
+
+@dataclass(frozen=True, slots=True)
 class Payer:
     phone: str
     amount: int
@@ -72,19 +93,44 @@ class Payer:
     last_name: str = ""
 
     def __post_init__(self):
-        if not re.fullmatch(r"\d{11}", self.phone):
+        if not PHONE_NUMBER_PATTERN.fullmatch(self.phone):
             raise InvalidPhoneNumberError(
                 f"Invalid format for {self.phone}, ex: 229XXXXXXXX"
             )
 
+    @classmethod
+    def _trusted_many(
+        cls,
+        phones: Iterable[str],
+        amounts: Iterable[int],
+        first_names: Iterable[str],
+        last_names: Iterable[str],
+    ) -> Iterator[Payer]:
+        """Build payers from columns already validated by a ``PayerBatch``, without running ``__post_init__``.
+        The fields are written with the ``__set__`` of their slots, the frozen ``__setattr__`` being skipped
+        like the ``__init__`` of a frozen dataclass does, but without its ``object.__setattr__`` lookups.
+        """
+        new = object.__new__
+        set_phone, set_amount = cls.phone.__set__, cls.amount.__set__
+        set_first_name, set_last_name = cls.first_name.__set__, cls.last_name.__set__
+        for phone, amount, first_name, last_name in zip(
+            phones, amounts, first_names, last_names
+        ):
+            payer = new(cls)
+            set_phone(payer, phone)
+            set_amount(payer, amount)
+            set_first_name(payer, first_name)
+            set_last_name(payer, last_name)
+            yield payer
+
     def to_qos_compliant_payment_request_body(
-        self, mobile_carrier: MobileCarrier
+        self, mobile_carrier: MobileCarrier, reference: str | None = None
     ) -> dict:
         return {
             "clientid": mobile_carrier.id,
             "msisdn": self.phone,
             "amount": str(self.amount),
-            "transref": mobile_carrier.reference_factory(self),
+            "transref": reference or mobile_carrier.reference_factory(self),
             "firstname": self.first_name,
             "lastname": self.last_name,
         }
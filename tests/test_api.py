@@ -1,9 +1,42 @@
+import io
+import pickle
+import subprocess
+import sys
+import time
+from concurrent import futures
+
 import httpx
 import pytest
 from pytest_httpx import HTTPXMock
 
-from qosic import Client, bj
-from qosic.errors import InvalidCredentialsError, ServerError
+from qosic import BatchProgress, Client, Payer, Result, StatusPoller, bj
+from qosic.cache import MemoryCacheBackend, SQLiteCacheBackend, StatusCache
+from qosic.callbacks import CallbackReceiver
+from qosic.client import ClientConfig
+from qosic.clock import VirtualClock
+from qosic.errors import (
+    CircuitOpenError,
+    InvalidCredentialsError,
+    MobileCarrierNotFoundError,
+    ServerError,
+)
+from qosic.executor import PaymentExecutor
+from qosic.ingest import (
+    INVALID_AMOUNT,
+    INVALID_PHONE,
+    UNKNOWN_CARRIER,
+    PayerBatch,
+    read_payers,
+)
+from qosic.instrumentation import Instrumentation
+from qosic.journal import FileStore, MemoryStore, SQLiteStore, TransactionState
+from qosic.metrics import MetricsCollector
+from qosic.polling import FixedInterval
+from qosic.reconciliation import read_references
+from qosic.registry import ClientRegistry
+from qosic.ratelimit import RateLimit, RateLimiter
+from qosic.retry import CircuitBreaker, RetryPolicy
+from qosic.testing import FakeQosServer, run_load
 from qosic.mobile_carriers.bj.moov import MOOV_PAYMENT_PATH
 from qosic.mobile_carriers.bj.mtn import (
     MTN_REFUND_PATH,
@@ -134,3 +167,853 @@ def test_request_payment_moov_rejected(client: Client, httpx_mock: HTTPXMock):
         phone=MOOV_PHONE_NUMBER, amount=2000, first_name="jean", last_name="nb"
     )
     assert not result.success
+
+
+def test_submit_payment_mtn(client: Client, httpx_mock: HTTPXMock):
+    payment_url = client.base_url + MTN_PAYMENT_PATH
+    payment_status_url = client.base_url + MTN_PAYMENT_STATUS_PATH
+    httpx_mock.add_response(
+        url=payment_url, method="POST", status_code=httpx.codes.ACCEPTED
+    )
+    httpx_mock.add_response(
+        url=payment_status_url,
+        method="POST",
+        status_code=httpx.codes.OK,
+        json={"responsecode": "01"},
+    )
+    httpx_mock.add_response(
+        url=payment_status_url,
+        method="POST",
+        status_code=httpx.codes.OK,
+        json={"responsecode": "00"},
+    )
+    pending = client.submit_payment(phone=MTN_PHONE_NUMBER, amount=2000)
+    assert not pending.done()
+    assert pending.poll_once() == Result.Status.PENDING
+    assert pending.poll_once() == Result.Status.CONFIRMED
+    assert pending.done()
+    assert pending.attempts == 2
+    assert pending.result().success
+    assert pending.wait().reference == pending.reference
+
+
+def test_submit_payment_mtn_refused(client: Client, httpx_mock: HTTPXMock):
+    payment_url = client.base_url + MTN_PAYMENT_PATH
+    httpx_mock.add_response(
+        url=payment_url, method="POST", status_code=httpx.codes.FORBIDDEN
+    )
+    pending = client.submit_payment(phone=MTN_PHONE_NUMBER, amount=2000)
+    assert pending.done()
+    assert not pending.result().success
+
+
+def test_submit_payment_moov(client: Client, httpx_mock: HTTPXMock):
+    url = client.base_url + MOOV_PAYMENT_PATH
+    httpx_mock.add_response(
+        url=url,
+        method="POST",
+        status_code=httpx.codes.OK,
+        json={"responsecode": "0"},
+    )
+    pending = client.submit_payment(phone=MOOV_PHONE_NUMBER, amount=2000)
+    done, _ = futures.wait([pending], timeout=0)
+    assert pending in done
+    assert pending.result().success
+
+
+def test_submit_payment_with_poller(client: Client, httpx_mock: HTTPXMock):
+    payment_url = client.base_url + MTN_PAYMENT_PATH
+    payment_status_url = client.base_url + MTN_PAYMENT_STATUS_PATH
+    httpx_mock.add_response(
+        url=payment_url, method="POST", status_code=httpx.codes.ACCEPTED
+    )
+    httpx_mock.add_response(
+        url=payment_status_url,
+        method="POST",
+        status_code=httpx.codes.OK,
+        json={"responsecode": "00"},
+    )
+    with StatusPoller(max_workers=2) as poller:
+        client.poller = poller
+        pending = client.submit_payment(phone=MTN_PHONE_NUMBER, amount=2000)
+        assert pending.result(timeout=5).success
+
+
+def test_request_payment_mtn_confirmed_after_polling(httpx_mock: HTTPXMock):
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MTN(id=get_random_string(), polling=FixedInterval(0))],
+    )
+    httpx_mock.add_response(
+        url=client.base_url + MTN_PAYMENT_PATH,
+        method="POST",
+        status_code=httpx.codes.ACCEPTED,
+    )
+    for code in ("01", "01", "00"):
+        httpx_mock.add_response(
+            url=client.base_url + MTN_PAYMENT_STATUS_PATH,
+            method="POST",
+            status_code=httpx.codes.OK,
+            json={"responsecode": code},
+        )
+    result = client.pay(phone=MTN_PHONE_NUMBER, amount=2000)
+    assert result.success
+
+
+def test_pay_many(client: Client, httpx_mock: HTTPXMock):
+    for code in ("0", "0", "1"):
+        httpx_mock.add_response(
+            url=client.base_url + MOOV_PAYMENT_PATH,
+            method="POST",
+            status_code=httpx.codes.OK,
+            json={"responsecode": code},
+        )
+    payers = [Payer(phone=MOOV_PHONE_NUMBER, amount=amount) for amount in (1, 2, 3)]
+    payers.append(Payer(phone="22900000000", amount=4))
+    progress = BatchProgress()
+    items = list(
+        client.pay_many(payers, concurrency=2, max_per_carrier=1, progress=progress)
+    )
+    assert sorted(item.index for item in items) == [0, 1, 2, 3]
+    errored = next(item for item in items if item.index == 3)
+    assert isinstance(errored.error, MobileCarrierNotFoundError)
+    assert progress == BatchProgress(completed=4, succeeded=2, failed=1, errored=1)
+
+
+def test_shared_transport():
+    class Transport(httpx.MockTransport):
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    transport = Transport(
+        lambda request: httpx.Response(httpx.codes.OK, json={"responsecode": "00"})
+    )
+    clients = [
+        Client(
+            login=get_random_string(),
+            password=get_random_string(),
+            mobile_carriers=[bj.MTN(id=get_random_string())],
+            transport=transport,
+            timeout=httpx.Timeout(10, connect=2),
+        )
+        for _ in range(2)
+    ]
+    clients[0].close()
+    assert not transport.closed
+    result = clients[1].refund(reference=get_random_string(), phone=MTN_PHONE_NUMBER)
+    assert result.success
+    clients[1].close()
+    assert not transport.closed
+
+
+def test_instrumentation(httpx_mock: HTTPXMock):
+    events = []
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MTN(id=get_random_string())],
+        instrumentation=Instrumentation([events.append], log_bodies=True),
+    )
+    httpx_mock.add_response(
+        url=client.base_url + MTN_PAYMENT_PATH,
+        method="POST",
+        status_code=httpx.codes.ACCEPTED,
+    )
+    httpx_mock.add_response(
+        url=client.base_url + MTN_PAYMENT_STATUS_PATH,
+        method="POST",
+        status_code=httpx.codes.OK,
+        json={"responsecode": "00"},
+    )
+    client.pay(phone=MTN_PHONE_NUMBER, amount=2000, first_name="jean")
+    payment, status = events
+    assert (payment.endpoint, payment.carrier, payment.attempt) == (
+        MTN_PAYMENT_PATH,
+        "MTN",
+        None,
+    )
+    assert MTN_PHONE_NUMBER not in payment.request_body
+    assert "jean" not in payment.request_body
+    assert (status.endpoint, status.status_code, status.attempt) == (
+        MTN_PAYMENT_STATUS_PATH,
+        httpx.codes.OK,
+        1,
+    )
+    assert status.latency >= 0
+
+
+def test_instrumentation_disabled(client: Client, httpx_mock: HTTPXMock):
+    httpx_mock.add_response(
+        url=client.base_url + MTN_REFUND_PATH, method="POST", status_code=httpx.codes.OK
+    )
+    result = client.refund(reference=get_random_string(), phone=MTN_PHONE_NUMBER)
+    assert "qosic.started_at" not in result.response.request.extensions
+
+
+def test_metrics(httpx_mock: HTTPXMock):
+    metrics = MetricsCollector()
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MTN(id=get_random_string()), bj.MOOV(id="moov")],
+        metrics=metrics,
+    )
+    httpx_mock.add_response(
+        url=client.base_url + MTN_PAYMENT_PATH,
+        method="POST",
+        status_code=httpx.codes.ACCEPTED,
+    )
+    httpx_mock.add_response(
+        url=client.base_url + MTN_PAYMENT_STATUS_PATH,
+        method="POST",
+        status_code=httpx.codes.OK,
+        json={"responsecode": "00"},
+    )
+    httpx_mock.add_response(
+        url=client.base_url + MTN_REFUND_PATH,
+        method="POST",
+        status_code=httpx.codes.BAD_GATEWAY,
+    )
+    assert client.pay(phone=MTN_PHONE_NUMBER, amount=2000).success
+    with pytest.raises(ServerError):
+        client.refund(reference=get_random_string(), phone=MTN_PHONE_NUMBER)
+
+    snapshot = metrics.snapshot()
+    mtn = (("carrier", "MTN"),)
+    assert snapshot["counters"]["payments_total"] == {
+        (("carrier", "MTN"), ("status", "CONFIRMED")): 1
+    }
+    assert snapshot["counters"]["errors_total"] == {
+        (("carrier", "MTN"), ("error", "ServerError")): 1
+    }
+    assert snapshot["gauges"]["payments_in_flight"] == {mtn: 0}
+    assert snapshot["histograms"]["payment_poll_attempts"][mtn]["sum"] == 1
+    latency = snapshot["histograms"]["request_latency_seconds"]
+    assert {labels[1][1] for labels in latency} == {
+        MTN_PAYMENT_PATH,
+        MTN_PAYMENT_STATUS_PATH,
+        MTN_REFUND_PATH,
+    }
+    exported = metrics.to_prometheus()
+    assert "# TYPE qosic_request_latency_seconds histogram" in exported
+    assert 'qosic_payments_in_flight{carrier="MTN"} 0' in exported
+
+
+def test_fake_qos_server():
+    server = FakeQosServer(rejection_rate=0.5, seed=42)
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[
+            bj.MTN(id=get_random_string(), polling=FixedInterval(0)),
+            bj.MOOV(id=get_random_string()),
+        ],
+        transport=server.transport,
+    )
+    results = [client.pay(phone=MTN_PHONE_NUMBER, amount=100) for _ in range(20)]
+    confirmed = [result for result in results if result.success]
+    assert 0 < len(confirmed) < 20
+    refund = client.refund(reference=confirmed[0].reference, phone=MTN_PHONE_NUMBER)
+    assert refund.success
+    assert server.requests[MTN_PAYMENT_PATH] == 20
+    assert server.requests[MTN_PAYMENT_STATUS_PATH] == 20
+
+    server.error_rate = 1
+    with pytest.raises(ServerError):
+        client.pay(phone=MOOV_PHONE_NUMBER, amount=100)
+
+
+@pytest.mark.parametrize("trust_payload", [True, False])
+def test_callback_receiver(trust_payload: bool):
+    server = FakeQosServer(rejection_rate=0.5, seed=1)
+    receiver = CallbackReceiver(trust_payload=trust_payload)
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MTN(id=get_random_string())],
+        transport=server.transport,
+        callbacks=receiver,
+    )
+    payments = [
+        client.submit_payment(phone=MTN_PHONE_NUMBER, amount=100) for _ in range(6)
+    ]
+    assert all(payment.reference in receiver for payment in payments)
+
+    with httpx.Client(
+        transport=httpx.WSGITransport(app=receiver.wsgi_app), base_url="http://test"
+    ) as callback_client:
+        for notification in server.pop_notifications():
+            response = callback_client.post("/", json=notification)
+            assert response.status_code == httpx.codes.OK
+        response = callback_client.post("/", data={"transref": "unknown"})
+        assert response.status_code == httpx.codes.NOT_FOUND
+        response = callback_client.post("/", content=b"{invalid")
+        assert response.status_code == httpx.codes.BAD_REQUEST
+
+    assert all(payment.done() for payment in payments)
+    assert {payment.result().success for payment in payments} == {True, False}
+    assert not any(payment.reference in receiver for payment in payments)
+    status_checks = 0 if trust_payload else len(payments)
+    assert server.requests[MTN_PAYMENT_STATUS_PATH] == status_checks
+
+
+@pytest.mark.parametrize("store_class", ["memory", "file", "sqlite"])
+def test_resume_journaled_payments(store_class: str, tmp_path):
+    stores = {
+        "memory": lambda: store,
+        "file": lambda: FileStore(tmp_path / "journal.jsonl"),
+        "sqlite": lambda: SQLiteStore(tmp_path / "journal.db"),
+    }
+    store = MemoryStore()
+    server = FakeQosServer(confirmation_delay=0.1)
+    mobile_carriers = [bj.MTN(id="mtn", polling=FixedInterval(0.05))]
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=mobile_carriers,
+        transport=server.transport,
+        store=(store := stores[store_class]()),
+    )
+    pending = client.submit_payment(phone=MTN_PHONE_NUMBER, amount=100)
+    assert store.get(pending.reference).state == TransactionState.SUBMITTED
+    client.close()
+
+    # a new process picks up the payment without sending it again
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=mobile_carriers,
+        transport=server.transport,
+        store=(store := stores[store_class]()),
+    )
+    resumed = list(client.resume())
+    assert [p.reference for p in resumed] == [pending.reference]
+    assert resumed[0].wait().success
+    assert store.get(pending.reference).state == TransactionState.CONFIRMED
+    assert list(store.in_flight()) == []
+    assert server.requests[MTN_PAYMENT_PATH] == 1
+
+
+def test_file_store_truncated_last_line(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    server = FakeQosServer(confirmation_delay=0.1)
+    mobile_carriers = [bj.MTN(id="mtn", polling=FixedInterval(0.05))]
+    store = FileStore(path)
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=mobile_carriers,
+        transport=server.transport,
+        store=store,
+    )
+    pending = client.submit_payment(phone=MTN_PHONE_NUMBER, amount=100)
+    client.close()
+    store.close()
+    # the process crashed while writing the next record
+    with path.open("a") as file:
+        file.write('{"reference": "abc", "carr')
+
+    store = FileStore(path)
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=mobile_carriers,
+        transport=server.transport,
+        store=store,
+    )
+    (resumed,) = client.resume()
+    assert resumed.reference == pending.reference
+    assert resumed.wait().success
+    store.close()
+    assert FileStore(path).get(pending.reference).state == TransactionState.CONFIRMED
+
+    # a corrupted line in the middle of the journal is not skipped
+    path.write_text('{"reference": "abc", "carr\n' + path.read_text())
+    with pytest.raises(ValueError):
+        FileStore(path)
+
+
+def test_rate_limiter():
+    server = FakeQosServer(latency=0.02)
+    limiter = RateLimiter(
+        [
+            RateLimit(carrier="MOOV", rate=50, burst=2),
+            RateLimit(endpoint=MOOV_PAYMENT_PATH, concurrency=2),
+        ]
+    )
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MOOV(id=get_random_string())],
+        transport=server.transport,
+        rate_limiter=limiter,
+    )
+    in_flight = []
+    handle = server.handle
+
+    def counting_handle(request):
+        in_flight.append(1)
+        try:
+            assert len(in_flight) <= 2
+            return handle(request)
+        finally:
+            in_flight.pop()
+
+    server.handle = counting_handle
+    payers = [Payer(phone=MOOV_PHONE_NUMBER, amount=100) for _ in range(12)]
+    started_at = time.monotonic()
+    items = list(client.pay_many(payers, concurrency=6))
+    # 2 requests of the burst then 10 at 50 per second
+    assert time.monotonic() - started_at >= 0.2
+    assert all(item.success for item in items)
+
+
+def test_retry_policy():
+    responses = {
+        MTN_PAYMENT_PATH: [503, 202],
+        MTN_PAYMENT_STATUS_PATH: [502, 500, 200],
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        status_code = responses[request.url.path].pop(0)
+        return httpx.Response(status_code, json={"responsecode": "00"})
+
+    metrics = MetricsCollector()
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MTN(id=get_random_string(), polling=FixedInterval(0))],
+        transport=httpx.MockTransport(handler),
+        metrics=metrics,
+        retry=RetryPolicy(backoff=FixedInterval(0)),
+    )
+    # the payment request may have reached the server, it is not sent again
+    with pytest.raises(ServerError):
+        client.pay(phone=MTN_PHONE_NUMBER, amount=100)
+    assert client.pay(phone=MTN_PHONE_NUMBER, amount=100).success
+    retries = metrics.snapshot()["counters"]["retries_total"]
+    assert sum(retries.values()) == 2
+
+
+def test_circuit_breaker():
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("connection refused", request=request)
+
+    metrics = MetricsCollector()
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MOOV(id=get_random_string())],
+        transport=httpx.MockTransport(handler),
+        metrics=metrics,
+        retry=RetryPolicy(
+            max_attempts=2, backoff=FixedInterval(0), failure_threshold=3
+        ),
+    )
+    with pytest.raises(httpx.ConnectError):
+        client.pay(phone=MOOV_PHONE_NUMBER, amount=100)
+    with pytest.raises(CircuitOpenError):
+        client.pay(phone=MOOV_PHONE_NUMBER, amount=100)
+    with pytest.raises(CircuitOpenError):
+        client.pay(phone=MOOV_PHONE_NUMBER, amount=100)
+    gauges = metrics.snapshot()["gauges"]["circuit_breaker_state"]
+    assert gauges[(("carrier", "MOOV"),)] == CircuitBreaker.State.OPEN
+
+
+def test_client_pickling(client: Client):
+    clone = pickle.loads(pickle.dumps(client))
+    assert clone.config == client.config
+    assert clone._http_client is not client._http_client
+
+    # a connection pool can't be pickled, the clone opens its own
+    transport = httpx.HTTPTransport(limits=httpx.Limits(max_connections=5))
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MOOV(id=get_random_string())],
+        transport=transport,
+    )
+    assert client.config.transport is None
+    clone = pickle.loads(pickle.dumps(client))
+    assert clone.transport is None and clone.login == client.login
+    transport.close()
+
+
+def test_payment_executor():
+    config = ClientConfig(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=(
+            bj.MTN(id=get_random_string(), polling=FixedInterval(0)),
+            bj.MOOV(id=get_random_string()),
+        ),
+        transport=FakeQosServer().transport,
+    )
+    phones = [MTN_PHONE_NUMBER, MOOV_PHONE_NUMBER, "22900000000"]
+    payers = [Payer(phone=phones[i % 3], amount=100) for i in range(30)]
+    progress = BatchProgress()
+    with PaymentExecutor(config, processes=2, chunk_size=4) as executor:
+        items = list(executor.pay_many(payers, progress=progress))
+    assert sorted(item.index for item in items) == list(range(30))
+    assert progress.succeeded == 20
+    for item in items:
+        assert item.payer == payers[item.index]
+        if item.payer.phone == "22900000000":
+            assert isinstance(item.error, MobileCarrierNotFoundError)
+
+
+def test_lazy_import():
+    code = (
+        "import sys, qosic; assert 'httpx' not in sys.modules; "
+        "from qosic import Payer, bj; bj.MOOV; assert 'qosic.polling' not in sys.modules; "
+        "qosic.Client; assert 'qosic.client' in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_compact_results():
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MOOV(id=get_random_string())],
+        transport=FakeQosServer().transport,
+        compact_results=True,
+    )
+    result = client.pay(phone=MOOV_PHONE_NUMBER, amount=100)
+    assert result.success
+    assert result.response is None
+    assert result.status_code == 200
+    assert result.response_code == "0"
+    assert result.latency >= 0
+    assert not hasattr(result, "__dict__")
+    assert result.compact() is result
+    assert pickle.loads(pickle.dumps(result)) == result
+
+
+def test_check_status_many(tmp_path):
+    server = FakeQosServer(rejection_rate=0.5, seed=3)
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[
+            bj.MTN(id=get_random_string(), polling=FixedInterval(0)),
+            bj.MOOV(id=get_random_string()),
+        ],
+        transport=server.transport,
+        status_cache=StatusCache(),
+    )
+    results = [client.pay(phone=MTN_PHONE_NUMBER, amount=100) for _ in range(10)]
+    path = tmp_path / "references.csv"
+    path.write_text(
+        "transref,amount\n" + "".join(f"{r.reference},100\n" for r in results)
+    )
+    expected = {r.reference: r.status for r in results}
+
+    # the statuses of the payments are not cached, only those of the status endpoint
+    items = list(client.check_status_many(read_references(path), concurrency=3))
+    assert {item.reference: item.status for item in items} == expected
+    assert server.requests[MTN_PAYMENT_STATUS_PATH] == 20
+
+    # confirmed and failed statuses are cached
+    jsonl = "".join(f'{{"transref": "{r.reference}"}}\n' for r in results)
+    items = list(client.check_status_many(read_references(io.StringIO(jsonl))))
+    assert all(item.cached for item in items)
+    assert {item.reference: item.status for item in items} == expected
+    assert server.requests[MTN_PAYMENT_STATUS_PATH] == 20
+    assert client.status_cache.hits == 10
+
+
+def test_status_cache_skips_client_side_timeouts():
+    clock = VirtualClock()
+    server = FakeQosServer(confirmation_delay=90, clock=clock)
+    mtn = bj.MTN(
+        id=get_random_string(), polling=FixedInterval(30), timeout=60, clock=clock
+    )
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[mtn],
+        transport=server.transport,
+        status_cache=StatusCache(),
+    )
+    # the client gives up before the payer confirms
+    result = client.pay(phone=MTN_PHONE_NUMBER, amount=100)
+    assert result.status == Result.Status.FAILED
+    clock.advance(30)
+    requests = server.requests[MTN_PAYMENT_STATUS_PATH]
+    assert client.check_status(result.reference) == Result.Status.CONFIRMED
+    assert server.requests[MTN_PAYMENT_STATUS_PATH] == requests + 1
+    assert client.check_status(result.reference) == Result.Status.CONFIRMED
+    assert server.requests[MTN_PAYMENT_STATUS_PATH] == requests + 1
+
+
+def test_check_status_server_errors():
+    server = FakeQosServer()
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MTN(id=get_random_string(), polling=FixedInterval(0))],
+        transport=server.transport,
+        status_cache=StatusCache(),
+    )
+    reference = client.pay(phone=MTN_PHONE_NUMBER, amount=100).reference
+    server.error_rate = 1
+    with pytest.raises(ServerError):
+        client.check_status(reference)
+    (item,) = client.check_status_many([reference])
+    assert isinstance(item.error, ServerError)
+    assert item.status is None and not item.cached
+    # the errors are not cached, the status is checked again once the api is back
+    server.error_rate = 0
+    assert client.check_status(reference) == Result.Status.CONFIRMED
+    assert server.requests[MTN_PAYMENT_STATUS_PATH] == 4
+
+
+def test_pay_tolerates_status_check_errors():
+    statuses = [503, 200]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == MTN_PAYMENT_PATH:
+            return httpx.Response(httpx.codes.ACCEPTED)
+        return httpx.Response(statuses.pop(0), json={"responsecode": "00"})
+
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[
+            bj.MTN(id=get_random_string(), polling=FixedInterval(0), max_tries=2)
+        ],
+        transport=httpx.MockTransport(handler),
+    )
+    # the payment was accepted, a server error while polling is checked again
+    result = client.pay(phone=MTN_PHONE_NUMBER, amount=100)
+    assert result.success
+    assert result.attempts == 2
+
+    # once exhausted, the payment fails with the error and its callbacks are called
+    statuses.extend([503, 503])
+    pending = client.submit_payment(phone=MTN_PHONE_NUMBER, amount=100)
+    failures = []
+    pending.add_done_callback(lambda future: failures.append(future.exception()))
+    with pytest.raises(ServerError):
+        pending.wait()
+    assert isinstance(failures[0], ServerError)
+
+
+def test_status_cache_expiry_and_eviction(tmp_path):
+    now = [0.0]
+    cache = StatusCache(
+        MemoryCacheBackend(maxsize=2), pending_ttl=5, clock=lambda: now[0]
+    )
+    cache.set("mtn", "a", Result.Status.PENDING)
+    cache.set("mtn", "b", Result.Status.CONFIRMED)
+    assert cache.get("mtn", "a") == Result.Status.PENDING
+    assert cache.get("moov", "a") is None
+    now[0] = 10
+    # pending statuses expire, terminal ones are kept
+    assert cache.get("mtn", "a") is None
+    assert cache.get("mtn", "b") == Result.Status.CONFIRMED
+    cache.set("mtn", "c", Result.Status.FAILED)
+    cache.set("mtn", "d", Result.Status.FAILED)
+    # b is the least recently used entry
+    assert cache.get("mtn", "b") is None
+    assert (cache.hits, cache.misses) == (2, 3)
+
+    backend = SQLiteCacheBackend(tmp_path / "statuses.db")
+    StatusCache(backend).set("mtn", "a", Result.Status.CONFIRMED)
+    backend.close()
+    cache = StatusCache(SQLiteCacheBackend(tmp_path / "statuses.db"))
+    assert cache.get("mtn", "a") == Result.Status.CONFIRMED
+
+
+def test_client_registry():
+    server = FakeQosServer()
+    with ClientRegistry(
+        transport=server.transport, status_cache=StatusCache()
+    ) as registry:
+        for merchant in ("shop-1", "shop-2"):
+            registry.register(
+                merchant,
+                login=merchant,
+                password=get_random_string(),
+                mobile_carriers=[
+                    bj.MTN(id=f"{merchant}-mtn", polling=FixedInterval(0)),
+                    bj.MOOV(id=f"{merchant}-moov"),
+                ],
+            )
+        shop_1, shop_2 = registry["shop-1"], registry["shop-2"]
+        assert len(registry) == 2 and "shop-3" not in registry
+        assert shop_1.poller is shop_2.poller
+        assert shop_1.status_cache is shop_2.status_cache
+        assert shop_1._router._index is shop_2._router._index
+        with pytest.raises(AssertionError):
+            registry.register("shop-1", login="shop-1", password="", mobile_carriers=[])
+
+        assert shop_1.pay(phone=MTN_PHONE_NUMBER, amount=100).success
+        pending = shop_2.submit_payment(phone=MOOV_PHONE_NUMBER, amount=100)
+        assert pending.result(timeout=5).success
+        registry.remove("shop-2")
+        assert registry.get("shop-2") is None
+    assert server.requests[MTN_PAYMENT_PATH] == 1
+
+
+def test_client_registry_metrics_per_merchant():
+    server = FakeQosServer()
+    events = []
+    collectors = {"shop-1": MetricsCollector(), "shop-2": MetricsCollector()}
+    with ClientRegistry(
+        transport=server.transport, instrumentation=Instrumentation([events.append])
+    ) as registry:
+        for merchant, metrics in collectors.items():
+            registry.register(
+                merchant,
+                login=merchant,
+                password=get_random_string(),
+                mobile_carriers=[bj.MOOV(id=f"{merchant}-moov")],
+                metrics=metrics,
+            )
+        registry["shop-1"].pay(phone=MOOV_PHONE_NUMBER, amount=100)
+        for _ in range(2):
+            registry["shop-2"].pay(phone=MOOV_PHONE_NUMBER, amount=100)
+    moov = (("carrier", "MOOV"), ("status", "CONFIRMED"))
+    for merchant, payments in (("shop-1", 1), ("shop-2", 2)):
+        counters = collectors[merchant].snapshot()["counters"]
+        assert counters["payments_total"] == {moov: payments}
+        assert sum(counters["requests_total"].values()) == payments
+    # the hooks of the registry instrumentation get the requests of every merchant
+    assert len(events) == 3
+
+
+def test_metrics_on_virtual_time():
+    clock = VirtualClock()
+    metrics = MetricsCollector()
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[
+            bj.MTN(id=get_random_string(), polling=FixedInterval(3), clock=clock)
+        ],
+        transport=FakeQosServer(confirmation_delay=3, clock=clock).transport,
+        metrics=metrics,
+    )
+    assert client.pay(phone=MTN_PHONE_NUMBER, amount=100).success
+    assert client.submit_payment(phone=MTN_PHONE_NUMBER, amount=100).wait().success
+    duration = metrics.snapshot()["histograms"]["payment_duration_seconds"]
+    assert duration[(("carrier", "MTN"),)]["sum"] == 6
+
+
+def test_status_poller_on_virtual_time():
+    clock = VirtualClock()
+    with StatusPoller(clock=clock) as poller:
+        client = Client(
+            login=get_random_string(),
+            password=get_random_string(),
+            mobile_carriers=[
+                bj.MTN(id=get_random_string(), polling=FixedInterval(10), clock=clock)
+            ],
+            transport=FakeQosServer(confirmation_delay=60, clock=clock).transport,
+            poller=poller,
+        )
+        pending = client.submit_payment(phone=MTN_PHONE_NUMBER, amount=100)
+        # minutes of polling in virtual time
+        result = pending.result(timeout=5)
+    assert result.success
+    assert result.attempts == 7
+    assert clock.monotonic() == 60
+
+
+def test_run_load_on_virtual_time():
+    clock = VirtualClock()
+    server = FakeQosServer(
+        confirmation_delay=30, rejection_rate=0.1, seed=1, clock=clock
+    )
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[
+            bj.MTN(id=get_random_string(), polling=FixedInterval(5), clock=clock)
+        ],
+        transport=server.transport,
+    )
+    started_at = time.monotonic()
+    report = run_load(
+        client,
+        (Payer(phone=MTN_PHONE_NUMBER, amount=100) for _ in range(1000)),
+        clock=clock,
+        rate=128,
+    )
+    assert time.monotonic() - started_at < 30
+    assert report.payments == report.confirmed + report.failed == 1000
+    assert 50 < report.failed < 150
+    # checked 0, 5, ..., 30 seconds after the submission
+    assert report.p50 == report.p99 == 30
+    assert report.duration == 999 / 128 + 30
+    assert report.requests == {
+        MTN_PAYMENT_PATH: 1000,
+        MTN_PAYMENT_STATUS_PATH: 1000 * 7,
+    }
+
+    # a payment waited for in place sleeps on the virtual clock too
+    now = clock.monotonic()
+    result = client.pay(phone=MTN_PHONE_NUMBER, amount=100)
+    assert result.attempts == 7
+    assert clock.monotonic() == now + 30
+
+
+def test_pay_many_payer_batch(tmp_path):
+    server = FakeQosServer()
+    client = Client(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[
+            bj.MTN(id=get_random_string(), polling=FixedInterval(0)),
+            bj.MOOV(id=get_random_string()),
+        ],
+        transport=server.transport,
+    )
+    path = tmp_path / "payouts.csv"
+    path.write_text(
+        "phone,amount,first_name\n"
+        f"{MTN_PHONE_NUMBER},100,Jean\n"
+        "2299161745,100,\n"
+        f"{MOOV_PHONE_NUMBER},abc,\n"
+        "22910000000,100,\n"
+        f" {MOOV_PHONE_NUMBER} ,200,Zoé\n"
+    )
+    batch = read_payers(path, mobile_carriers=client.mobile_carriers)
+    assert len(batch) == 2
+    assert [(r.index, r.reason) for r in batch.rejections] == [
+        (1, INVALID_PHONE),
+        (2, INVALID_AMOUNT),
+        (3, UNKNOWN_CARRIER),
+    ]
+    report = io.StringIO()
+    batch.write_rejections(report)
+    assert report.getvalue().splitlines()[1] == f'1,2299161745,100,"{INVALID_PHONE}"'
+
+    items = sorted(client.pay_many(batch), key=lambda item: item.index)
+    assert [item.index for item in items] == [0, 4]
+    assert all(item.success for item in items)
+    assert items[1].payer == Payer(
+        phone=MOOV_PHONE_NUMBER, amount=200, first_name="Zoé"
+    )
+
+    # any table indexed by column name, like a pandas DataFrame
+    batch = PayerBatch.from_table(
+        {"phone": [MTN_PHONE_NUMBER, "abc"], "amount": [100.0, 5]},
+        mobile_carriers=client.mobile_carriers,
+    )
+    assert list(batch) == [Payer(phone=MTN_PHONE_NUMBER, amount=100)]
+    assert batch.rejections[0].index == 1
+
+    # a batch routed for another client is routed again to the carriers of this one
+    batch = PayerBatch.from_columns(
+        phones=[MOOV_PHONE_NUMBER],
+        amounts=[100],
+        mobile_carriers=[bj.MOOV(id="another-merchant")],
+    )
+    (item,) = client.pay_many(batch)
+    assert item.result.mobile_carrier is client.mobile_carriers[1]
@@ -0,0 +1,373 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+from pytest_httpx import HTTPXMock
+
+from qosic import AsyncClient, Payer, PendingPayment, Result, bj
+from qosic.cache import SQLiteCacheBackend, StatusCache
+from qosic.callbacks import CallbackReceiver
+from qosic.clock import VirtualClock
+from qosic.errors import (
+    FeatureNotImplementedError,
+    InvalidCredentialsError,
+    ServerError,
+)
+from qosic.journal import MemoryStore, TransactionState, hash_phone
+from qosic.mobile_carriers.bj.moov import MOOV_PAYMENT_PATH
+from qosic.polling import FixedInterval
+from qosic.ratelimit import ConcurrencyLimit, RateLimit, RateLimiter
+from qosic.registry import AsyncClientRegistry
+from qosic.testing import FakeQosServer
+from qosic.mobile_carriers.bj.mtn import (
+    MTN_REFUND_PATH,
+    MTN_PAYMENT_PATH,
+    MTN_PAYMENT_STATUS_PATH,
+)
+from qosic.utils import get_random_string
+
+MTN_PHONE_NUMBER = "22991617451"
+MOOV_PHONE_NUMBER = "22963588213"
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def client():
+    mobile_carriers = [
+        bj.MTN(id=get_random_string()),
+        bj.MOOV(id=get_random_string()),
+    ]
+    return AsyncClient(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=mobile_carriers,
+    )
+
+
+async def test_request_refund_ok_response(client: AsyncClient, httpx_mock: HTTPXMock):
+    url = client.base_url + MTN_REFUND_PATH
+    httpx_mock.add_response(
+        url=url, method="POST", status_code=httpx.codes.OK, json={"responsecode": "00"}
+    )
+    async with client:
+        result = await client.refund(
+            reference=get_random_string(), phone=MTN_PHONE_NUMBER
+        )
+    assert result.success
+
+
+async def test_request_refund_unauthorized_response(
+    client: AsyncClient, httpx_mock: HTTPXMock
+):
+    url = client.base_url + MTN_REFUND_PATH
+    httpx_mock.add_response(
+        url=url, method="POST", status_code=httpx.codes.UNAUTHORIZED
+    )
+    async with client:
+        with pytest.raises(InvalidCredentialsError):
+            await client.refund(reference=get_random_string(), phone=MTN_PHONE_NUMBER)
+
+
+async def test_request_refund_moov(client: AsyncClient):
+    async with client:
+        with pytest.raises(FeatureNotImplementedError):
+            await client.refund(reference=get_random_string(), phone=MOOV_PHONE_NUMBER)
+
+
+async def test_request_payment_mtn_ok_response(
+    client: AsyncClient, httpx_mock: HTTPXMock
+):
+    payment_url = client.base_url + MTN_PAYMENT_PATH
+    payment_status_url = client.base_url + MTN_PAYMENT_STATUS_PATH
+    httpx_mock.add_response(
+        url=payment_url, method="POST", status_code=httpx.codes.ACCEPTED
+    )
+    httpx_mock.add_response(
+        url=payment_status_url,
+        method="POST",
+        status_code=httpx.codes.OK,
+        json={"responsecode": "00"},
+    )
+    async with client:
+        result = await client.pay(
+            phone=MTN_PHONE_NUMBER, amount=2000, first_name="jean", last_name="pierre"
+        )
+    assert result.success
+
+
+async def test_request_payment_mtn_rejected(client: AsyncClient, httpx_mock: HTTPXMock):
+    payment_url = client.base_url + MTN_PAYMENT_PATH
+    payment_status_url = client.base_url + MTN_PAYMENT_STATUS_PATH
+    httpx_mock.add_response(
+        url=payment_url, method="POST", status_code=httpx.codes.ACCEPTED
+    )
+    httpx_mock.add_response(
+        url=payment_status_url,
+        method="POST",
+        status_code=httpx.codes.OK,
+    )
+    async with client:
+        result = await client.pay(
+            phone=MTN_PHONE_NUMBER, amount=2000, first_name="jean", last_name="dnd"
+        )
+    assert not result.success
+
+
+async def test_request_payment_moov_ok_response(
+    client: AsyncClient, httpx_mock: HTTPXMock
+):
+    url = client.base_url + MOOV_PAYMENT_PATH
+    httpx_mock.add_response(
+        url=url,
+        method="POST",
+        status_code=httpx.codes.OK,
+        json={"responsecode": "0"},
+    )
+    async with client:
+        result = await client.pay(
+            phone=MOOV_PHONE_NUMBER, amount=2000, first_name="jean", last_name="nb"
+        )
+    assert result.success
+
+
+async def test_pay_many(client: AsyncClient, httpx_mock: HTTPXMock):
+    for _ in range(3):
+        httpx_mock.add_response(
+            url=client.base_url + MOOV_PAYMENT_PATH,
+            method="POST",
+            status_code=httpx.codes.OK,
+            json={"responsecode": "0"},
+        )
+    payers = [Payer(phone=MOOV_PHONE_NUMBER, amount=amount) for amount in (1, 2, 3)]
+    async with client:
+        items = [item async for item in client.pay_many(payers, concurrency=2)]
+    assert sorted(item.index for item in items) == [0, 1, 2]
+    assert all(item.success for item in items)
+
+
+async def test_callback_receiver_asgi():
+    receiver = CallbackReceiver(trust_payload=True)
+    pending = PendingPayment(
+        mobile_carrier=bj.MTN(id=get_random_string()),
+        http_client=None,
+        reference=get_random_string(),
+        phone=MTN_PHONE_NUMBER,
+        response=httpx.Response(httpx.codes.ACCEPTED),
+    )
+    receiver.register(pending)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=receiver.asgi_app), base_url="http://test"
+    ) as callback_client:
+        response = await callback_client.post(
+            "/", json={"transref": pending.reference, "responsecode": "00"}
+        )
+    assert response.status_code == httpx.codes.OK
+    assert pending.result(timeout=0).success
+
+
+async def test_journaled_payment(client: AsyncClient, httpx_mock: HTTPXMock):
+    client.store = MemoryStore(phone_key="secret")
+    httpx_mock.add_response(
+        url=client.base_url + MOOV_PAYMENT_PATH, json={"responsecode": "0"}
+    )
+    result = await client.pay(phone=MOOV_PHONE_NUMBER, amount=2000)
+    record = client.store.get(result.reference)
+    assert record.state == TransactionState.CONFIRMED
+    assert record.amount == 2000
+    assert record.phone_hash == hash_phone(MOOV_PHONE_NUMBER, b"secret")
+    # without a key the phone number is not stored at all
+    client.store = MemoryStore()
+    httpx_mock.add_response(
+        url=client.base_url + MOOV_PAYMENT_PATH, json={"responsecode": "0"}
+    )
+    result = await client.pay(phone=MOOV_PHONE_NUMBER, amount=2000)
+    assert client.store.get(result.reference).phone_hash == ""
+
+
+async def test_journaled_payment_submitted():
+    clock = VirtualClock()
+    store = MemoryStore()
+    saves = []
+    save = store.save
+
+    def recording_save(record):
+        saves.append((record.state, threading.current_thread()))
+        save(record)
+
+    store.save = recording_save
+    async with AsyncClient(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[
+            bj.MTN(id=get_random_string(), polling=FixedInterval(10), clock=clock)
+        ],
+        transport=FakeQosServer(confirmation_delay=30, clock=clock).transport,
+        store=store,
+    ) as client:
+        assert (await client.pay(phone=MTN_PHONE_NUMBER, amount=100)).success
+    # the payment is journaled as submitted while waiting for the confirmation
+    assert [state for state, _ in saves] == [
+        TransactionState.CREATED,
+        TransactionState.SUBMITTED,
+        TransactionState.CONFIRMED,
+    ]
+    assert threading.main_thread() not in {thread for _, thread in saves}
+
+
+async def test_rate_limiter():
+    limiter = RateLimiter([RateLimit(carrier="MOOV", concurrency=1, rate=100)])
+    async with AsyncClient(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MOOV(id=get_random_string())],
+        transport=FakeQosServer(latency=0.01).transport,
+        rate_limiter=limiter,
+    ) as client:
+        payers = [Payer(phone=MOOV_PHONE_NUMBER, amount=100) for _ in range(5)]
+        items = [item async for item in client.pay_many(payers, concurrency=5)]
+    assert all(item.success for item in items)
+
+
+async def test_concurrency_limit_shared_with_threads():
+    slots = ConcurrencyLimit(1)
+    slots.acquire()
+    waiter = asyncio.ensure_future(slots.aacquire())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    # released from another thread, the slot is handed over to the waiting coroutine
+    threading.Thread(target=slots.release).start()
+    await asyncio.wait_for(waiter, timeout=1)
+    cancelled = asyncio.ensure_future(slots.aacquire())
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    slots.release()
+    await asyncio.sleep(0.01)
+    await asyncio.wait_for(slots.aacquire(), timeout=1)
+    # cancelled after the slot was handed over but before the coroutine resumed
+    late = asyncio.ensure_future(slots.aacquire())
+    await asyncio.sleep(0)
+    slots.release()
+    await asyncio.sleep(0)
+    late.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await late
+    await asyncio.wait_for(slots.aacquire(), timeout=1)
+
+
+async def test_check_status_many():
+    server = FakeQosServer()
+    async with AsyncClient(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MTN(id=get_random_string(), polling=FixedInterval(0))],
+        transport=server.transport,
+        status_cache=StatusCache(),
+    ) as client:
+        result = await client.pay(phone=MTN_PHONE_NUMBER, amount=100)
+        references = [result.reference, get_random_string()]
+        items = [item async for item in client.check_status_many(references)]
+        assert {item.reference: item.status for item in items} == {
+            references[0]: Result.Status.CONFIRMED,
+            references[1]: Result.Status.FAILED,
+        }
+        assert not any(item.cached for item in items)
+        items = [item async for item in client.check_status_many(references)]
+        assert all(item.cached for item in items)
+    assert server.requests[MTN_PAYMENT_STATUS_PATH] == 3
+
+
+async def test_check_status_sqlite_cache_off_the_event_loop(tmp_path):
+    server = FakeQosServer()
+    backend = SQLiteCacheBackend(tmp_path / "statuses.db")
+    threads = []
+    get = backend.get
+
+    def tracked_get(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return get(*args, **kwargs)
+
+    backend.get = tracked_get
+    async with AsyncClient(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[bj.MTN(id=get_random_string(), polling=FixedInterval(0))],
+        transport=server.transport,
+        status_cache=StatusCache(backend=backend),
+    ) as client:
+        result = await client.pay(phone=MTN_PHONE_NUMBER, amount=100)
+        for _ in range(2):
+            status = await client.check_status(result.reference)
+            assert status == Result.Status.CONFIRMED
+    assert server.requests[MTN_PAYMENT_STATUS_PATH] == 2
+    assert threads and threading.main_thread() not in threads
+
+
+async def test_pay_tolerates_status_check_errors():
+    statuses = [503, 200]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == MTN_PAYMENT_PATH:
+            return httpx.Response(httpx.codes.ACCEPTED)
+        return httpx.Response(statuses.pop(0), json={"responsecode": "00"})
+
+    async with AsyncClient(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[
+            bj.MTN(id=get_random_string(), polling=FixedInterval(0), max_tries=2)
+        ],
+        transport=httpx.MockTransport(handler),
+    ) as client:
+        result = await client.pay(phone=MTN_PHONE_NUMBER, amount=100)
+        assert result.success and result.attempts == 2
+        statuses.extend([503, 503])
+        with pytest.raises(ServerError):
+            await client.pay(phone=MTN_PHONE_NUMBER, amount=100)
+
+
+async def test_client_registry():
+    server = FakeQosServer()
+    async with AsyncClientRegistry(transport=server.transport) as registry:
+        for merchant in ("shop-1", "shop-2"):
+            registry.register(
+                merchant,
+                login=merchant,
+                password=get_random_string(),
+                mobile_carriers=[
+                    bj.MTN(id=f"{merchant}-mtn", polling=FixedInterval(0))
+                ],
+            )
+        results = await asyncio.gather(
+            *(
+                registry[merchant].pay(phone=MTN_PHONE_NUMBER, amount=100)
+                for merchant in registry
+            )
+        )
+        assert all(result.success for result in results)
+        await registry.remove("shop-1")
+        assert list(registry) == ["shop-2"]
+    assert server.requests[MTN_PAYMENT_PATH] == 2
+
+
+async def test_virtual_clock():
+    clock = VirtualClock()
+    server = FakeQosServer(confirmation_delay=60, clock=clock)
+    async with AsyncClient(
+        login=get_random_string(),
+        password=get_random_string(),
+        mobile_carriers=[
+            bj.MTN(id=get_random_string(), polling=FixedInterval(10), clock=clock)
+        ],
+        transport=server.transport,
+    ) as client:
+        result = await client.pay(phone=MTN_PHONE_NUMBER, amount=100)
+    assert result.success
+    assert result.attempts == 7
+    assert clock.monotonic() == 60
@@ -1,7 +1,32 @@
+import json
+
+import httpx
 import pytest
 
+from qosic.errors import (
+    MobileCarrierConflictError,
+    MobileCarrierNotFoundError,
+    ReferenceCollisionError,
+)
 from qosic.mobile_carriers import bj
-from qosic.utils import get_random_string
+from qosic.polling import (
+    DEFAULT_POLLING,
+    ExponentialBackoff,
+    FastStart,
+    FixedInterval,
+    Jitter,
+)
+from qosic.references import (
+    ALPHABET,
+    RandomReference,
+    SortableReference,
+    UniqueReferences,
+    random_characters,
+)
+from qosic.responses import QosResponse, parse_response
+from qosic.routing import RoutingTable
+from qosic.templates import PaymentTemplate
+from qosic.utils import Payer, get_random_string
 
 
 def test_provider():
@@ -54,3 +79,116 @@ def test_mtn():
 
     with pytest.raises(AssertionError):
         bj.MTN(step=30, timeout=500, max_tries=6, id="fake")
+
+
+def test_mtn_polling():
+    assert bj.MTN(id="fake").polling == DEFAULT_POLLING
+    assert bj.MTN(id="fake", step=5).polling == FixedInterval(5)
+    strategy = FastStart(fast_step=1, fast_attempts=2, slow_step=20)
+    assert bj.MTN(id="fake", polling=strategy).polling == strategy
+
+    with pytest.raises(AssertionError):
+        bj.MTN(id="fake", step=10, polling=strategy)
+
+
+def test_polling_strategies():
+    backoff = ExponentialBackoff(initial=2, factor=2, maximum=10)
+    assert [backoff.delay(attempt) for attempt in range(1, 6)] == [2, 4, 8, 10, 10]
+
+    fast_start = FastStart(fast_step=1, fast_attempts=2, slow_step=20)
+    assert [fast_start.delay(attempt) for attempt in range(1, 5)] == [1, 1, 20, 20]
+
+    jitter = Jitter(FixedInterval(10), ratio=0.2)
+    assert all(8 <= jitter.delay(attempt) <= 12 for attempt in range(1, 50))
+
+    with pytest.raises(AssertionError):
+        ExponentialBackoff(initial=10, maximum=5)
+    with pytest.raises(AssertionError):
+        Jitter(FixedInterval(10), ratio=1)
+
+
+def test_routing_table():
+    mtn, moov = bj.MTN(id="mtn"), bj.MOOV(id="moov")
+    router = RoutingTable([mtn, moov])
+    assert router.carrier_for("22991617451") is mtn
+    assert router.carrier_for("22963588213") is moov
+    with pytest.raises(MobileCarrierNotFoundError):
+        router.carrier_for("22900000000")
+    with pytest.raises(MobileCarrierNotFoundError):
+        router.carrier_for("22591617451")
+
+    other = bj.MOOV(id="other", allowed_prefixes=["7", "801"], country_code="1")
+    router = RoutingTable([mtn, other])
+    assert router.carrier_for("17000000000") is other
+    assert router.carrier_for("18010000000") is other
+    assert router.carrier_for("22991617451") is mtn
+
+
+def test_routing_table_conflicts():
+    with pytest.raises(MobileCarrierConflictError):
+        RoutingTable([bj.MTN(id="mtn"), bj.MOOV(id="moov", allowed_prefixes=["51"])])
+    with pytest.raises(MobileCarrierConflictError):
+        RoutingTable([bj.MTN(id="mtn"), bj.MOOV(id="moov", allowed_prefixes=["5"])])
+
+
+def test_reference_strategies():
+    reference = RandomReference(prefix="N1")()
+    assert len(reference) == 12 and reference.startswith("N1")
+    assert set(random_characters(10_000)) == set(ALPHABET)
+
+    now = [1_700_000_000.0]
+    sortable = SortableReference(clock=lambda: now[0])
+    references = []
+    for _ in range(5):
+        references.append(sortable())
+        now[0] += 0.5
+    assert references == sorted(references)
+    assert len(references[0]) == 16
+
+    with pytest.raises(AssertionError):
+        RandomReference(length=17)
+    with pytest.raises(AssertionError):
+        SortableReference(prefix="node-1")
+
+    unique = UniqueReferences(iter(["a", "a", "b", "b", "b"]).__next__, max_tries=2)
+    assert unique() == "a"
+    assert unique() == "b"
+    with pytest.raises(ReferenceCollisionError):
+        unique()
+    bj.MTN(id="fake", reference_factory=UniqueReferences())
+
+
+def test_parse_response():
+    response = httpx.Response(200, json={"responsecode": "00", "responsemsg": "OK"})
+    parsed = parse_response(response)
+    assert parsed.ok and parsed.response_code == "00"
+    assert parsed.content == {"responsecode": "00", "responsemsg": "OK"}
+    # decoded once, the record is kept on the response
+    assert parse_response(response) is parsed
+
+    assert parse_response(httpx.Response(202)) == QosResponse(status_code=202)
+    assert parse_response(httpx.Response(200, content=b"<html>")) == QosResponse(200)
+    assert parse_response(httpx.Response(200, json=["00"])).response_code is None
+
+
+@pytest.mark.parametrize(
+    "first_name,last_name", [("", ""), ("Jean", "Dupont"), ('Zo"é', "N\\\n1")]
+)
+def test_payment_template(first_name, last_name):
+    mtn = bj.MTN(id=get_random_string())
+    http_client = httpx.Client(
+        base_url="https://api.qosic.net", headers={"content-type": "application/json"}
+    )
+    template = PaymentTemplate(mtn, http_client, "/pay")
+    payer = Payer(
+        phone="22991617451", amount=2000, first_name=first_name, last_name=last_name
+    )
+    request = template.build_request(payer, "ref-1")
+    assert json.loads(request.content) == payer.to_qos_compliant_payment_request_body(
+        mtn, "ref-1"
+    )
+    assert request.url == "https://api.qosic.net/pay"
+    assert request.headers["content-length"] == str(len(request.content))
+    assert request.headers["content-type"] == "application/json"
+    assert request.extensions["qosic"]["carrier"] == "MTN"
+    assert template.build_request(payer, "ref-2").extensions is not request.extensions